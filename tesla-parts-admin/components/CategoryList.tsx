@@ -54,10 +54,20 @@ interface SubcategoryItemProps {
   onReorderProducts: (productIds: string[]) => Promise<void>;
   onUpdateSubcategorySort: (
     subcategory: Subcategory,
-    newSortOrder: number
+    afterId: number | null
   ) => Promise<void>;
 }
 
+// Rank keys compare as plain strings (byte order), like the API sorts them
+const compareRank = (
+  a: { rank?: string | null },
+  b: { rank?: string | null }
+) => {
+  const rankA = a.rank ?? '';
+  const rankB = b.rank ?? '';
+  return rankA === rankB ? 0 : rankA < rankB ? -1 : 1;
+};
+
 const collectDescendantIds = (sub: Subcategory): number[] => {
   if (!sub.subcategories || sub.subcategories.length === 0) return [];
   const ids: number[] = [];
@@ -103,11 +113,7 @@ const sortSubcategoriesTree = (
 ): Subcategory[] => {
   if (!subs) return [];
   return [...subs]
-    .sort((a, b) => {
-      const orderDiff = (b.sort_order ?? 0) - (a.sort_order ?? 0);
-      if (orderDiff !== 0) return orderDiff;
-      return a.id - b.id;
-    })
+    .sort((a, b) => compareRank(a, b) || a.id - b.id)
     .map((sub) => ({
       ...sub,
       subcategories: sortSubcategoriesTree(sub.subcategories),
@@ -116,11 +122,7 @@ const sortSubcategoriesTree = (
 
 const sortCategoriesData = (cats: Category[]): Category[] => {
   return [...cats]
-    .sort((a, b) => {
-      const orderDiff = (b.sort_order ?? 0) - (a.sort_order ?? 0);
-      if (orderDiff !== 0) return orderDiff;
-      return a.id - b.id;
-    })
+    .sort((a, b) => compareRank(a, b) || a.id - b.id)
     .map((cat) => ({
       ...cat,
       subcategories: sortSubcategoriesTree(cat.subcategories),
@@ -264,10 +266,7 @@ const SubcategoryItem: React.FC<SubcategoryItemProps> = ({
       const parentSub = findParentSub(parentCategory.subcategories);
       rawSiblings = parentSub?.subcategories || [];
     }
-    // Sort DESC to match visual order
-    return [...rawSiblings].sort(
-      (a, b) => (b.sort_order ?? 0) - (a.sort_order ?? 0) || a.id - b.id
-    );
+    return [...rawSiblings].sort((a, b) => compareRank(a, b) || a.id - b.id);
   }, [categories, categoryId, subcategory.parent_id, subcategory.id]);
 
   const siblingIndex = siblings.findIndex((s) => s.id === subcategory.id);
@@ -299,9 +298,10 @@ const SubcategoryItem: React.FC<SubcategoryItemProps> = ({
             <button
               onClick={() => {
                 if (siblingIndex > 0) {
-                  const targetOrder =
-                    (siblings[siblingIndex - 1].sort_order ?? 0) + 1;
-                  onUpdateSubcategorySort(subcategory, targetOrder);
+                  onUpdateSubcategorySort(
+                    subcategory,
+                    siblingIndex > 1 ? siblings[siblingIndex - 2].id : null
+                  );
                 }
               }}
               disabled={siblingIndex === 0}
@@ -312,9 +312,10 @@ const SubcategoryItem: React.FC<SubcategoryItemProps> = ({
             <button
               onClick={() => {
                 if (siblingIndex < siblings.length - 1) {
-                  const targetOrder =
-                    (siblings[siblingIndex + 1].sort_order ?? 0) - 1;
-                  onUpdateSubcategorySort(subcategory, targetOrder);
+                  onUpdateSubcategorySort(
+                    subcategory,
+                    siblings[siblingIndex + 1].id
+                  );
                 }
               }}
               disabled={siblingIndex === siblings.length - 1}
@@ -606,8 +607,7 @@ const SubcategoryItem: React.FC<SubcategoryItemProps> = ({
                     {(() => {
                       const sortedProducts = [...subcategory.products!].sort(
                         (a, b) =>
-                          (a.sort_order ?? 0) - (b.sort_order ?? 0) ||
-                          a.name.localeCompare(b.name)
+                          compareRank(a, b) || a.name.localeCompare(b.name)
                       );
 
                       return sortedProducts.map((product, idx) => (
@@ -873,17 +873,10 @@ const CategoryList: React.FC = () => {
 
   const handleUpdateCategorySort = async (
     category: Category,
-    newSortOrder: number
+    afterId: number | null
   ) => {
     try {
-      await ApiService.updateCategory(
-        category.id,
-        category.name,
-        undefined,
-        newSortOrder,
-        category.meta_title || undefined,
-        category.meta_description || undefined
-      );
+      await ApiService.moveCategoryAfter(category.id, afterId);
       loadCategories();
     } catch (e) {
       alert('Failed to update category sort order');
@@ -956,17 +949,10 @@ const CategoryList: React.FC = () => {
 
   const handleUpdateSubcategorySort = async (
     subcategory: Subcategory,
-    newSortOrder: number
+    afterId: number | null
   ) => {
     try {
-      await ApiService.updateSubcategory(
-        subcategory.id,
-        subcategory.name,
-        subcategory.code,
-        subcategory.parent_id ?? undefined,
-        undefined,
-        newSortOrder
-      );
+      await ApiService.moveSubcategoryAfter(subcategory.id, afterId);
       loadCategories();
     } catch (e) {
       alert('Failed to update subcategory sort order');
@@ -1038,7 +1024,7 @@ const CategoryList: React.FC = () => {
   if (loading) return <div className="p-8 text-center">Loading...</div>;
 
   const sortedCategories = [...categories].sort(
-    (a, b) => (b.sort_order ?? 0) - (a.sort_order ?? 0)
+    (a, b) => compareRank(a, b) || a.id - b.id
   );
 
   return (
@@ -1259,9 +1245,10 @@ const CategoryList: React.FC = () => {
                     <button
                       onClick={() => {
                         if (idx > 0) {
-                          const targetOrder =
-                            (sortedCategories[idx - 1].sort_order ?? 0) + 1;
-                          handleUpdateCategorySort(category, targetOrder);
+                          handleUpdateCategorySort(
+                            category,
+                            idx > 1 ? sortedCategories[idx - 2].id : null
+                          );
                         }
                       }}
                       disabled={idx === 0}
@@ -1273,9 +1260,10 @@ const CategoryList: React.FC = () => {
                     <button
                       onClick={() => {
                         if (idx < sortedCategories.length - 1) {
-                          const targetOrder =
-                            (sortedCategories[idx + 1].sort_order ?? 0) - 1;
-                          handleUpdateCategorySort(category, targetOrder);
+                          handleUpdateCategorySort(
+                            category,
+                            sortedCategories[idx + 1].id
+                          );
                         }
                       }}
                       disabled={idx === sortedCategories.length - 1}
@@ -1345,7 +1333,7 @@ const CategoryList: React.FC = () => {
                               ...category.products,
                             ].sort(
                               (a, b) =>
-                                (a.sort_order ?? 0) - (b.sort_order ?? 0) ||
+                                compareRank(a, b) ||
                                 a.name.localeCompare(b.name)
                             );
 
@@ -325,7 +325,9 @@ export const ApiService = {
     return res.ok;
   },
 
-  bulkDeleteProducts: async (ids: string[]): Promise<{ deleted: number }> => {
+  bulkDeleteProducts: async (
+    ids: string[]
+  ): Promise<{ deleted: number; freed_images: string[] }> => {
     const res = await _authenticatedFetch(`${API_URL}/products/bulk-delete`, {
       method: 'POST',
       headers: getHeaders(),
@@ -345,6 +347,38 @@ export const ApiService = {
     return res.json();
   },
 
+  moveCategoryAfter: async (
+    id: number,
+    afterId: number | null
+  ): Promise<{ id: number; rank: string }> => {
+    const res = await _authenticatedFetch(
+      `${API_URL}/categories/${id}/move-after`,
+      {
+        method: 'POST',
+        headers: getHeaders(),
+        body: JSON.stringify({ after_id: afterId }),
+      }
+    );
+    if (!res.ok) throw new Error('Failed to move category');
+    return res.json();
+  },
+
+  moveSubcategoryAfter: async (
+    id: number,
+    afterId: number | null
+  ): Promise<{ id: number; rank: string }> => {
+    const res = await _authenticatedFetch(
+      `${API_URL}/categories/subcategories/${id}/move-after`,
+      {
+        method: 'POST',
+        headers: getHeaders(),
+        body: JSON.stringify({ after_id: afterId }),
+      }
+    );
+    if (!res.ok) throw new Error('Failed to move subcategory');
+    return res.json();
+  },
+
   togglePopular: async (id: string): Promise<Product> => {
     const res = await _authenticatedFetch(
       `${API_URL}/products/${id}/toggle-popular`,
@@ -412,20 +446,26 @@ export const ApiService = {
       )
     );
 
-    // 3. Map products to subcategories
-    const attachProductsToTree = (subs: Subcategory[]) => {
-      subs.forEach((sub) => {
-        // Find products for this subcategory (direct and linked)
-        sub.products = allProducts.filter(
-          (p) =>
-            p.subcategory_id === sub.id ||
-            (p.subcategory_ids && p.subcategory_ids.includes(sub.id))
-        );
-
-        if (sub.subcategories) {
-          attachProductsToTree(sub.subcategories);
-        }
+    // 3. Map products to subcategories: index them by subcategory id once
+    // (direct and linked) instead of filtering all products at every node
+    const productsBySubcategory = new Map<number, Product[]>();
+    allProducts.forEach((p) => {
+      const ids = new Set(p.subcategory_ids ?? []);
+      if (p.subcategory_id) ids.add(p.subcategory_id);
+      ids.forEach((id) => {
+        const list = productsBySubcategory.get(id);
+        if (list) list.push(p);
+        else productsBySubcategory.set(id, [p]);
       });
+    });
+
+    const attachProductsToTree = (subs: Subcategory[]) => {
+      const stack = [...subs];
+      while (stack.length > 0) {
+        const sub = stack.pop()!;
+        sub.products = productsBySubcategory.get(sub.id) ?? [];
+        if (sub.subcategories) stack.push(...sub.subcategories);
+      }
     };
 
     const finalCategories = categoriesDetails.map((catDetail) => {
@@ -6,6 +6,7 @@ export interface Subcategory {
   category_id: number;
   parent_id?: number | null;
   sort_order?: number;
+  rank?: string | null;
   subcategories?: Subcategory[];
   products?: Product[];
 }
@@ -15,6 +16,7 @@ export interface Category {
   name: string;
   image?: string;
   sort_order?: number;
+  rank?: string | null;
   meta_title?: string | null;
   meta_description?: string | null;
   subcategories: Subcategory[];
@@ -33,6 +35,7 @@ export interface Product {
   description: string;
   inStock: boolean;
   sort_order?: number;
+  rank?: string | null;
   detail_number?: string;
   priceUSD?: number;
   cross_number: string;
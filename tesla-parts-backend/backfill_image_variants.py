@@ -0,0 +1,61 @@
+import asyncio
+from sqlmodel import Session, select
+from database import engine
+from models import Category, ProductImage, Review, Subcategory
+from services.image_uploader import image_uploader
+from services.image_variants import cloudinary_variants, is_cloudinary_url
+from services.versioning import bump_catalog_version
+
+BATCH_SIZE = 100
+
+async def variants_for(url):
+    """Variants for an existing image, [] if it cannot be resized, None if it should be retried later."""
+    if is_cloudinary_url(url):
+        return cloudinary_variants(url)
+    path = image_uploader.local_path(url)
+    if path is None:
+        return []  # Image hosted elsewhere
+    if not path.is_file():
+        print(f"  missing file {path}, skipped")
+        return None
+    return await image_uploader.store_local_variants(path)
+
+async def backfill(model, url_field):
+    updated = 0
+    last_id = 0
+    with Session(engine) as session:
+        while True:
+            rows = session.exec(
+                select(model)
+                .where(model.variants.is_(None))
+                .where(model.id > last_id)
+                .order_by(model.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            for row in rows:
+                variants = await variants_for(getattr(row, url_field))
+                if variants is not None:
+                    row.variants = variants
+                    session.add(row)
+                    updated += 1
+            last_id = rows[-1].id
+            if updated:
+                bump_catalog_version(session)
+            session.commit()
+            print(f"  {model.__tablename__}: {updated} images done")
+    return updated
+
+async def backfill_all():
+    print("Generating product image variants...")
+    await backfill(ProductImage, "url")
+    print("Generating review image variants...")
+    await backfill(Review, "image_url")
+    print("Generating category and subcategory image variants...")
+    await backfill(Category, "image")
+    await backfill(Subcategory, "image")
+    print("Done.")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_all())
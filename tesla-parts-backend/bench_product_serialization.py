@@ -0,0 +1,103 @@
+"""
+Micro-benchmark for product list serialization.
+
+Compares the old path (model_dump -> ProductRead -> FastAPI response_model
+validation -> json.dumps) with services.product_serializer on in-memory
+products, and prints items/sec for each.
+
+    python bench_product_serialization.py [--items 100] [--rounds 200]
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+
+from models import Product, ProductImage, Subcategory
+from schemas import ProductRead
+from services.pricing import compute_price_fields
+from services.product_serializer import collect_subcategory_ids, product_list_response
+
+RATE = 41.5
+
+
+def make_products(count: int) -> List[Product]:
+    products = []
+    for index in range(count):
+        product = Product(
+            id=f"product-{index}",
+            name=f"Front bumper assembly {index}",
+            category="Model 3, Model Y",
+            subcategory_id=index % 7 + 1,
+            priceUAH=0.0,
+            priceUSD=12.5 + index,
+            image="https://example.com/images/main.jpg",
+            description="Genuine part. " * 20,
+            inStock=index % 3 != 0,
+            sort_order=index,
+            detail_number=f"1084168-{index:02d}-E",
+            cross_number="1500000-00-A",
+            is_popular=index % 5 == 0,
+            created_at=datetime(2024, 1, 1, 12, 0, 0),
+        )
+        product.images = [
+            ProductImage(url=f"https://example.com/images/{index}-{n}.jpg", product_id=product.id)
+            for n in range(3)
+        ]
+        product.linked_subcategories = [Subcategory(id=20 + index % 4, name="Linked", category_id=1)]
+        products.append(product)
+    return products
+
+
+def legacy_serialize(products: List[Product], adapter: TypeAdapter) -> bytes:
+    items = []
+    for product in products:
+        price_usd, price_uah = compute_price_fields(product, RATE)
+        data = product.model_dump()
+        data["priceUSD"] = price_usd
+        data["priceUAH"] = price_uah
+        data["images"] = [img.url for img in product.images]
+        data["subcategory_ids"] = collect_subcategory_ids(product)
+        if product.created_at:
+            data["created_at"] = product.created_at.isoformat()
+        items.append(ProductRead(**data))
+    # What FastAPI does with the returned list for response_model=List[ProductRead]
+    validated = adapter.validate_python(items)
+    return json.dumps(adapter.dump_python(validated, mode="json"), ensure_ascii=False).encode("utf-8")
+
+
+def fast_serialize(products: List[Product], adapter: TypeAdapter) -> bytes:
+    return product_list_response(products, RATE).body
+
+
+def measure(label: str, serialize, products: List[Product], rounds: int) -> float:
+    adapter = TypeAdapter(List[ProductRead])
+    serialize(products, adapter)  # warm up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        serialize(products, adapter)
+    elapsed = time.perf_counter() - started
+    rate = len(products) * rounds / elapsed
+    print(f"{label:<8} {rate:>12,.0f} items/sec")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    products = make_products(args.items)
+    adapter = TypeAdapter(List[ProductRead])
+    assert json.loads(legacy_serialize(products, adapter)) == json.loads(fast_serialize(products, adapter))
+
+    before = measure("before", legacy_serialize, products, args.rounds)
+    after = measure("after", fast_serialize, products, args.rounds)
+    print(f"speedup  {after / before:>12.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Benchmark for moving and copying a large subcategory branch.
+
+Generates a catalog in a scratch SQLite database (one branch of nested
+subcategories holding --products products, a quarter of them also linked to a
+second node) and times services.subcategory_transfer against the old
+node-by-node copy, printing wall time and the number of SQL statements.
+
+    python bench_subcategory_transfer.py [--products 5000] [--fanout 5] [--depth 3] [--rounds 5]
+"""
+import argparse
+import time
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from models import Category, Product, ProductSubcategoryLink, Subcategory
+from services.pricing import reprice_products
+from services.product_categories import add_products_to_category, refresh_category_strings
+from services.slugs import unique_slug
+from services.subcategory_transfer import copy_subtree, move_subtree
+
+
+def build_catalog(session: Session, products: int, fanout: int, depth: int) -> Subcategory:
+    source = Category(name="Model S", slug="model-s")
+    session.add_all([source, Category(name="Model X", slug="model-x")])
+    session.flush()
+
+    root = Subcategory(name="Body", slug="body", category_id=source.id)
+    session.add(root)
+    session.flush()
+    level = [root]
+    nodes = [root]
+    for _ in range(depth):
+        children = [
+            Subcategory(name=f"{parent.name} {n}", slug=f"{parent.slug}-{n}", category_id=source.id, parent_id=parent.id)
+            for parent in level
+            for n in range(fanout)
+        ]
+        session.add_all(children)
+        session.flush()  # Paths are set per level, parents first
+        level = children
+        nodes += children
+
+    rows, links = [], []
+    for index in range(products):
+        rows.append({
+            "id": f"part-{index}", "name": f"Part {index}", "category": source.name,
+            "subcategory_id": level[index % len(level)].id, "priceUAH": 0.0, "priceUSD": 10.0 + index % 90,
+            "image": "", "description": "", "inStock": index % 3 != 0,
+        })
+        if index % 4 == 0:
+            links.append({"product_id": f"part-{index}", "subcategory_id": nodes[index % len(nodes)].id})
+    session.execute(Product.__table__.insert(), rows)
+    session.execute(ProductSubcategoryLink.__table__.insert(), links)
+    session.commit()
+    return root
+
+
+def legacy_copy(session: Session, source: Subcategory, category_id: int, parent_id: Optional[int], cloned: List[str]) -> Subcategory:
+    # The recursive copy this replaced: one INSERT per node, one lookup per link
+    clone = Subcategory(
+        name=source.name, slug=unique_slug(session, Subcategory, source.name), code=source.code,
+        image=source.image, category_id=category_id, parent_id=parent_id,
+        sort_order=source.sort_order, rank=source.rank,
+    )
+    session.add(clone)
+    session.flush()
+    product_ids = list(dict.fromkeys([
+        *session.exec(select(Product.id).where(Product.subcategory_id == source.id)).all(),
+        *session.exec(select(ProductSubcategoryLink.product_id).where(ProductSubcategoryLink.subcategory_id == source.id)).all(),
+    ]))
+    for product_id in product_ids:
+        if not session.get(ProductSubcategoryLink, (product_id, clone.id)):
+            session.add(ProductSubcategoryLink(product_id=product_id, subcategory_id=clone.id))
+    cloned.extend(product_ids)
+    for child in session.exec(select(Subcategory).where(Subcategory.parent_id == source.id)).all():
+        legacy_copy(session, child, category_id, clone.id, cloned)
+    return clone
+
+
+def run_legacy_copy(session: Session, root: Subcategory, category_id: int):
+    cloned: List[str] = []
+    legacy_copy(session, root, category_id, None, cloned)
+    add_products_to_category(session, cloned, category_id)
+    refresh_category_strings(session, cloned)
+    reprice_products(session, cloned)
+    session.flush()
+
+
+def measure(label: str, engine, operation, rounds: int) -> float:
+    """Average time of ``operation(session)``, each round rolled back so every round sees the same catalog."""
+    statements = 0
+
+    def count(*args):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+    elapsed = 0.0
+    for _ in range(rounds):
+        with Session(engine) as session:
+            started = time.perf_counter()
+            operation(session)
+            elapsed += time.perf_counter() - started
+            session.rollback()
+    event.remove(engine, "before_cursor_execute", count)
+    print(f"{label:<12} {elapsed / rounds * 1000:>10.1f} ms {statements // rounds:>8} statements")
+    return elapsed / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    SQLModel.metadata.create_all(engine)
+    with Session(engine) as session:
+        root = build_catalog(session, args.products, args.fanout, args.depth)
+        root_id, target_id = root.id, root.category_id + 1
+        nodes = session.exec(select(Subcategory)).all()
+    print(f"{len(nodes)} subcategories, {args.products} products")
+
+    def root_of(session: Session) -> Subcategory:
+        return session.get(Subcategory, root_id)
+
+    measure("move", engine, lambda session: move_subtree(session, root_of(session), target_id, None), args.rounds)
+    before = measure("copy before", engine, lambda session: run_legacy_copy(session, root_of(session), target_id), args.rounds)
+    after = measure("copy after", engine, lambda session: copy_subtree(session, root_of(session), target_id, None), args.rounds)
+    print(f"speedup      {before / after:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
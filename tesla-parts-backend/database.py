@@ -1,8 +1,12 @@
 from sqlmodel import SQLModel, create_engine, Session, select
 from sqlalchemy import text, inspect
 import os
-from models import Settings, User # Import Settings and User model
+from models import Settings, User, Product, ProductPartNumber, ProductCategoryLink, Category, Subcategory, Review
 from auth import get_password_hash # Import password hashing utility
+import services.search # Registers the product search index DDL on metadata create/drop
+import services.image_store # Keeps ImageBlob reference counts in step with image rows
+import services.ordering # Gives new catalog rows a rank key on flush
+import services.subcategory_paths # Keeps Subcategory.path in step with parent_id
 
 DATABASE_URL = os.environ.get("DATABASE_URL")
 
@@ -28,11 +32,26 @@ def create_db_and_tables():
     _ensure_subcategory_sort_order_column()
     _ensure_product_cross_number_column()
     _ensure_category_seo_columns()
+    pricing_added = _ensure_category_pricing_columns()
+    tiles_untracked = _ensure_image_variant_columns()
     _ensure_product_sort_order_column()
+    _ensure_rank_columns()
+    _ensure_subcategory_path_column()
     _ensure_product_subcategory_id_column()
     _ensure_product_created_at_column()
     _ensure_product_is_popular_column()
     _ensure_order_note_column()
+    _ensure_image_blob_released_at_column()
+    _ensure_product_part_numbers()
+    _ensure_product_listing_index()
+    _ensure_category_slug_columns()
+    _ensure_product_category_links()
+    if pricing_added:
+        _reprice_products()
+    if tiles_untracked:
+        _retain_tile_images()
+    _backfill_ranks()
+    _backfill_subcategory_paths()
     
     with Session(engine) as session:
         # Check if admin user exists, if not, create it
@@ -73,6 +92,98 @@ def _ensure_category_seo_columns():
             conn.execute(text("ALTER TABLE category ADD COLUMN meta_description VARCHAR"))
         conn.commit()
 
+def _ensure_category_pricing_columns():
+    inspector = inspect(engine)
+    columns = [c["name"] for c in inspector.get_columns("category")]
+    with engine.connect() as conn:
+        if "markup_percent" not in columns:
+            conn.execute(text("ALTER TABLE category ADD COLUMN markup_percent FLOAT DEFAULT 0"))
+        if "price_rounding" not in columns:
+            conn.execute(text("ALTER TABLE category ADD COLUMN price_rounding FLOAT"))
+        conn.commit()
+    return "markup_percent" not in columns
+
+def _ensure_image_variant_columns():
+    # Returns True when category/subcategory images were not tracked until now
+    inspector = inspect(engine)
+    added = []
+    with engine.connect() as conn:
+        for table in ("productimage", "review", "category", "subcategory"):
+            columns = [c["name"] for c in inspector.get_columns(table)]
+            if "variants" not in columns:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN variants JSON"))
+                added.append(table)
+        conn.commit()
+    return "category" in added
+
+def _retain_tile_images():
+    # Count the references of category and subcategory images saved before they were tracked
+    from services.image_store import retain
+    print("Counting category and subcategory image references...")
+    with engine.begin() as conn:
+        for model in (Category, Subcategory):
+            image = model.__table__.c.image
+            retain(conn, conn.execute(select(image).where(image.is_not(None))).scalars().all())
+
+def _ensure_rank_columns():
+    # Before anything selects these models through the ORM
+    rank_type = 'VARCHAR COLLATE "C"' if not is_sqlite() else "VARCHAR"
+    for model in (Category, Subcategory, Product, Review):
+        table_name = model.__tablename__
+        columns = [c["name"] for c in inspect(engine).get_columns(table_name)]
+        if "rank" not in columns:
+            print(f"Adding 'rank' column to '{table_name}' table...")
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN rank {rank_type}"))
+                conn.commit()
+        for index in model.__table__.indexes:
+            if [c.name for c in index.columns] == ["rank"]:
+                index.create(engine, checkfirst=True)
+
+def _ensure_subcategory_path_column():
+    # Before anything selects subcategories through the ORM
+    columns = [c["name"] for c in inspect(engine).get_columns("subcategory")]
+    if "path" not in columns:
+        print("Adding 'path' column to 'subcategory' table...")
+        path_type = 'VARCHAR COLLATE "C"' if not is_sqlite() else "VARCHAR"
+        with engine.connect() as conn:
+            conn.execute(text(f"ALTER TABLE subcategory ADD COLUMN path {path_type}"))
+            conn.commit()
+    for index in Subcategory.__table__.indexes:
+        if [c.name for c in index.columns] == ["path"]:
+            index.create(engine, checkfirst=True)
+
+def _backfill_subcategory_paths():
+    from services.subcategory_paths import rebuild_paths
+    with Session(engine) as session:
+        if session.exec(select(Subcategory.id).where(Subcategory.path.is_(None)).limit(1)).first() is None:
+            return
+        print("Backfilling subcategory paths...")
+        rebuild_paths(session)
+        session.commit()
+
+def _backfill_ranks():
+    # Rows without a rank (all of them right after the column is added) are
+    # ranked after the ranked ones, in the order the old integer sort_order gave
+    from services.ordering import ORDERINGS, rebalance_all
+    with Session(engine) as session:
+        for ordering in ORDERINGS:
+            model = ordering.model
+            if session.exec(select(model.id).where(model.rank.is_(None)).limit(1)).first() is None:
+                continue
+            print(f"Backfilling ranks for '{model.__tablename__}' table...")
+            rebalance_all(session, ordering, order_by=(model.rank.is_(None), model.rank, *ordering.legacy_order))
+        session.commit()
+
+def _reprice_products():
+    # Stored UAH prices used to be recomputed on read; bring them up to the current rate once
+    from services.pricing import reprice_products
+    from services.site_settings import load_settings
+    with Session(engine) as session:
+        print("Repricing products...")
+        reprice_products(session, settings=load_settings(session))
+        session.commit()
+
 def _ensure_subcategory_sort_order_column():
     inspector = inspect(engine)
     columns = [c["name"] for c in inspector.get_columns("subcategory")]
@@ -150,3 +261,88 @@ def _ensure_order_note_column():
             # Use double quotes for the table name "order"
             conn.execute(text('ALTER TABLE "order" ADD COLUMN note VARCHAR'))
             conn.commit()
+
+def _ensure_image_blob_released_at_column():
+    columns = [c["name"] for c in inspect(engine).get_columns("imageblob")]
+    if "released_at" not in columns:
+        print("Adding 'released_at' column to 'imageblob' table...")
+        column_type = "TIMESTAMP" if not is_sqlite() else "DATETIME"
+        with engine.connect() as conn:
+            conn.execute(text(f"ALTER TABLE imageblob ADD COLUMN released_at {column_type}"))
+            conn.commit()
+
+def _ensure_product_part_numbers():
+    # Prefix range scans need the byte-wise "C" collation on PostgreSQL
+    if not is_sqlite():
+        with engine.connect() as conn:
+            collation = conn.execute(text(
+                "SELECT collation_name FROM information_schema.columns "
+                "WHERE table_schema = current_schema() AND table_name = 'productpartnumber' AND column_name = 'number'"
+            )).scalar()
+            if collation != "C":
+                print("Switching 'productpartnumber.number' to the \"C\" collation...")
+                conn.execute(text('ALTER TABLE productpartnumber ALTER COLUMN number TYPE VARCHAR COLLATE "C"'))
+                conn.commit()
+    # Backfill the part-number index for databases created before it existed
+    from services.part_numbers import rebuild_part_numbers
+    with Session(engine) as session:
+        if session.exec(select(ProductPartNumber.id).limit(1)).first() is not None:
+            return
+        products = session.exec(
+            select(Product.id, Product.detail_number, Product.cross_number)
+        ).all()
+        if not products:
+            return
+        print("Backfilling 'productpartnumber' table...")
+        rebuild_part_numbers(session, products)
+        session.commit()
+
+def _ensure_product_listing_index():
+    # create_all() only creates indexes together with new tables
+    listing_index = next(i for i in Product.__table__.indexes if i.name == "ix_product_rank_listing")
+    listing_index.create(engine, checkfirst=True)
+    # Superseded by the rank listing index
+    with engine.connect() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_product_listing"))
+        conn.commit()
+
+def _ensure_category_slug_columns():
+    from services.slugs import unique_slug
+    for model in (Category, Subcategory):
+        table_name = model.__tablename__
+        inspector = inspect(engine)
+        columns = [c["name"] for c in inspector.get_columns(table_name)]
+        if "slug" not in columns:
+            print(f"Adding 'slug' column to '{table_name}' table...")
+            with engine.connect() as conn:
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN slug VARCHAR"))
+                conn.commit()
+
+        # Backfill rows created before the column existed, oldest first keeps the plain slug
+        with Session(engine) as session:
+            missing = session.exec(
+                select(model).where(model.slug.is_(None)).order_by(model.id)
+            ).all()
+            for item in missing:
+                item.slug = unique_slug(session, model, item.name, exclude_id=item.id)
+                session.add(item)
+                session.flush()
+            if missing:
+                print(f"Backfilled slugs for {len(missing)} rows in '{table_name}'.")
+            session.commit()
+
+        # ALTER TABLE cannot add the unique constraint, the unique index enforces it
+        for index in model.__table__.indexes:
+            index.create(engine, checkfirst=True)
+
+def _ensure_product_category_links():
+    # Backfill category links from the legacy comma-separated Product.category strings
+    from services.product_categories import rebuild_category_links
+    with Session(engine) as session:
+        if session.exec(select(ProductCategoryLink.product_id).limit(1)).first() is not None:
+            return
+        if session.exec(select(Product.id).limit(1)).first() is None:
+            return
+        print("Backfilling 'productcategorylink' table...")
+        rebuild_category_links(session)
+        session.commit()
@@ -1,10 +1,11 @@
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, Response
 from fastapi.security import OAuth2PasswordBearer
 from sqlmodel import Session, select # Import Session and select
 from models import User, Customer # Import User model
 from database import get_session # Import get_session
 from auth import verify_token
 from services.crypto import get_email_hash
+from services.versioning import get_version, CATALOG
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/token")
 
@@ -64,3 +65,33 @@ async def get_current_customer(customer: Customer = Depends(get_optional_custome
         )
     return customer
 
+class NotModified(Exception):
+    """Raised by conditional GET dependencies; main.py turns it into an empty 304."""
+    def __init__(self, etag: str):
+        self.etag = etag
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # Weak comparison (RFC 9110): W/"1" and "1" are the same validator
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == opaque
+        for candidate in if_none_match.split(",")
+    )
+
+async def catalog_etag(request: Request, response: Response, session: Session = Depends(get_session)):
+    """
+    Weak ETag derived from the catalog version for public read endpoints.
+    A matching If-None-Match short-circuits with 304 before the endpoint runs.
+    Returns the version, so endpoints can hand it to catalog caches instead of
+    reading it again.
+    """
+    version = get_version(session, CATALOG)
+    etag = f'W/"catalog-{version}"'
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        raise NotModified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return version
@@ -1,6 +1,7 @@
-from fastapi import FastAPI, Response, Depends, HTTPException
+from fastapi import FastAPI, Request, Response, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from sqlmodel import Session, select
 from typing import List
 from database import create_db_and_tables, engine, get_session
@@ -9,7 +10,9 @@ from contextlib import asynccontextmanager
 import os
 from models import Product, Category, StaticPageSEO
 from schemas import StaticPageSEORead, StaticPageSEOUpdate
-from dependencies import get_current_admin
+from dependencies import get_current_admin, catalog_etag, NotModified
+from services.versioning import bump_catalog_version, ensure_versions, CATALOG, SETTINGS
+from services.image_uploader import UploadRejected
 
 DEFAULT_STATIC_SEO = {
     "home": {
@@ -54,10 +57,16 @@ def ensure_static_seo_records():
                 )
         session.commit()
 
+def ensure_cache_versions():
+    with Session(engine) as session:
+        ensure_versions(session, CATALOG, SETTINGS)
+        session.commit()
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     create_db_and_tables()
     ensure_static_seo_records()
+    ensure_cache_versions()
     yield
 
 app = FastAPI(lifespan=lifespan)
@@ -87,8 +96,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[products.NEXT_CURSOR_HEADER, "ETag"],
 )
 
+@app.exception_handler(NotModified)
+async def not_modified_handler(request: Request, exc: NotModified):
+    return Response(status_code=304, headers={"ETag": exc.etag, "Cache-Control": "no-cache"})
+
+@app.exception_handler(UploadRejected)
+async def upload_rejected_handler(request: Request, exc: UploadRejected):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
 app.include_router(products.router)
 app.include_router(orders.router)
 app.include_router(categories.router)
@@ -105,14 +123,6 @@ app.include_router(email_campaigns.router)
 def read_root():
     return {"message": "Tesla Parts API is running"}
 
-def _slugify(value: str) -> str:
-    return (
-        value.lower()
-        .strip()
-        .replace(" ", "-")
-        .replace("/", "-")
-    )
-
 @app.get("/sitemap.xml", response_class=Response)
 def get_sitemap():
     base_url = "https://teslapartscenter.com.ua"
@@ -125,7 +135,7 @@ def get_sitemap():
     xml_parts.append(f'<url><loc>{base_url}/</loc><changefreq>daily</changefreq></url>')
 
     for category in categories:
-        slug = _slugify(category.name) if category.name else f"category/{category.id}"
+        slug = category.slug or f"category/{category.id}"
         xml_parts.append(f'<url><loc>{base_url}/{slug}</loc><changefreq>weekly</changefreq></url>')
 
     for product in products:
@@ -135,11 +145,11 @@ def get_sitemap():
 
     return Response(content="".join(xml_parts), media_type="application/xml")
 
-@app.get("/seo/static", response_model=List[StaticPageSEORead])
+@app.get("/seo/static", response_model=List[StaticPageSEORead], dependencies=[Depends(catalog_etag)])
 def get_static_seo_records(session: Session = Depends(get_session)):
     return session.exec(select(StaticPageSEO)).all()
 
-@app.get("/seo/static/{slug}", response_model=StaticPageSEORead)
+@app.get("/seo/static/{slug}", response_model=StaticPageSEORead, dependencies=[Depends(catalog_etag)])
 def get_static_seo_record(slug: str, session: Session = Depends(get_session)):
     record = session.exec(
         select(StaticPageSEO).where(StaticPageSEO.slug == slug)
@@ -172,6 +182,7 @@ def update_static_seo_record(
         setattr(record, key, value)
 
     session.add(record)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(record)
     return record
@@ -0,0 +1,9 @@
+from database import _ensure_category_slug_columns
+
+def migrate_category_slugs():
+    print("Ensuring 'slug' columns on 'category' and 'subcategory'...")
+    _ensure_category_slug_columns()
+    print("Category slugs are up to date.")
+
+if __name__ == "__main__":
+    migrate_category_slugs()
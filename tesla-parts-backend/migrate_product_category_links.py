@@ -0,0 +1,14 @@
+from sqlmodel import Session
+from database import engine
+from services.product_categories import rebuild_category_links
+
+def migrate_product_category_links():
+    # Re-creates all links from the legacy Product.category strings
+    with Session(engine) as session:
+        print("Rebuilding 'productcategorylink' from Product.category...")
+        count = rebuild_category_links(session)
+        session.commit()
+    print(f"Created {count} product category links.")
+
+if __name__ == "__main__":
+    migrate_product_category_links()
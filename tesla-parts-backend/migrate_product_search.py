@@ -0,0 +1,13 @@
+from database import engine
+from services.search import install_search_index, rebuild_search_index
+
+def migrate_product_search():
+    with engine.begin() as conn:
+        print("Ensuring product search index...")
+        install_search_index(conn)
+        print("Rebuilding product search index...")
+        rebuild_search_index(conn)
+    print("Product search index is up to date.")
+
+if __name__ == "__main__":
+    migrate_product_search()
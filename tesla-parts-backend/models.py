@@ -1,22 +1,40 @@
 from typing import Optional, List
 from sqlmodel import Field, SQLModel, Relationship
-from sqlalchemy import Column, ForeignKey, String
+from sqlalchemy import Column, ForeignKey, String, Index, JSON
 from datetime import datetime
 from zoneinfo import ZoneInfo
 
 def get_kyiv_time():
     return datetime.now(ZoneInfo("Europe/Kyiv")).replace(tzinfo=None)
 
+# Rank keys, subcategory paths and part-number prefixes must compare byte by byte,
+# like Python strings (see services/ranks.py, services/subcategory_paths.py and
+# services/part_numbers.py)
+RankType = String().with_variant(String(collation="C"), "postgresql")
+
+def rank_column():
+    return Column(RankType, index=True)
+
 class Category(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
+    slug: Optional[str] = Field(default=None, unique=True, index=True)
     image: Optional[str] = None
-    sort_order: int = Field(default=0, index=True)
+    variants: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True))) # Resized copies of image, see services/image_variants.py
+    sort_order: int = Field(default=0, index=True) # Deprecated: order is given by rank
+    rank: Optional[str] = Field(default=None, sa_column=rank_column()) # Display position, lowest first
     meta_title: Optional[str] = None
     meta_description: Optional[str] = None
+    markup_percent: float = Field(default=0.0) # Added to the UAH price of products whose primary category this is
+    price_rounding: Optional[float] = None # UAH rounding step, falls back to the price_rounding setting
     
     subcategories: List["Subcategory"] = Relationship(back_populates="category")
 
+class ProductCategoryLink(SQLModel, table=True):
+    product_id: str = Field(foreign_key="product.id", primary_key=True)
+    category_id: int = Field(foreign_key="category.id", primary_key=True, index=True)
+    position: int = Field(default=0) # Order of the category in the legacy Product.category string
+
 class ProductSubcategoryLink(SQLModel, table=True):
     product_id: str = Field(foreign_key="product.id", primary_key=True)
     subcategory_id: int = Field(foreign_key="subcategory.id", primary_key=True)
@@ -25,11 +43,15 @@ class ProductSubcategoryLink(SQLModel, table=True):
 class Subcategory(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
+    slug: Optional[str] = Field(default=None, unique=True, index=True)
     code: Optional[str] = None
     image: Optional[str] = None
+    variants: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True))) # Resized copies of image, see services/image_variants.py
     category_id: int = Field(foreign_key="category.id")
     parent_id: Optional[int] = Field(default=None, foreign_key="subcategory.id")
-    sort_order: int = Field(default=0, index=True)
+    sort_order: int = Field(default=0, index=True) # Deprecated: order among siblings is given by rank
+    rank: Optional[str] = Field(default=None, sa_column=rank_column()) # Display position among siblings, lowest first
+    path: Optional[str] = Field(default=None, sa_column=Column(RankType, index=True)) # "/<top id>/.../<own id>/", see services/subcategory_paths.py
     
     category: Category = Relationship(back_populates="subcategories")
     parent: Optional["Subcategory"] = Relationship(back_populates="children", sa_relationship_kwargs={"remote_side": "Subcategory.id"})
@@ -43,14 +65,15 @@ class Subcategory(SQLModel, table=True):
 class Product(SQLModel, table=True):
     id: str = Field(primary_key=True)
     name: str
-    category: str # Deprecated, keeping for backward compatibility
+    category: str # Deprecated: derived from ProductCategoryLink, kept for old clients
     subcategory_id: Optional[int] = Field(default=None, foreign_key="subcategory.id")
     priceUAH: float
     priceUSD: float = Field(default=0.0)
     image: str
     description: str
     inStock: bool
-    sort_order: int = Field(default=0, index=True)
+    sort_order: int = Field(default=0, index=True) # Deprecated: order is given by rank
+    rank: Optional[str] = Field(default=None, sa_column=rank_column()) # Display position, lowest first
     detail_number: Optional[str] = None
     cross_number: Optional[str] = None # Made optional
     meta_title: Optional[str] = None
@@ -65,10 +88,26 @@ class Product(SQLModel, table=True):
     )
     images: List["ProductImage"] = Relationship(back_populates="product", sa_relationship_kwargs={"cascade": "all, delete-orphan"})
 
+# Matches the storefront listing order so keyset pages are a plain index range scan
+Index(
+    "ix_product_rank_listing",
+    Product.rank,
+    Product.inStock.desc(),
+    Product.name,
+    Product.id,
+)
+
+class ProductPartNumber(SQLModel, table=True):
+    id: Optional[int] = Field(default=None, primary_key=True)
+    product_id: str = Field(foreign_key="product.id", index=True)
+    number: str = Field(sa_column=Column(RankType, nullable=False, index=True)) # Normalized: no dashes/spaces, upper case
+    kind: str # 'detail' or 'cross'
+
 class ProductImage(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     product_id: str = Field(foreign_key="product.id")
     url: str
+    variants: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True))) # Resized copies, see services/image_variants.py
     
     product: Product = Relationship(back_populates="images")
 
@@ -109,6 +148,10 @@ class Settings(SQLModel, table=True):
     key: str = Field(primary_key=True)
     value: str
 
+class CacheVersion(SQLModel, table=True):
+    name: str = Field(primary_key=True) # e.g. "catalog"
+    version: int = Field(default=0)
+
 class Page(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     slug: str = Field(unique=True, index=True)
@@ -132,8 +175,17 @@ class StaticPageSEO(SQLModel, table=True):
 class Review(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     image_url: str
+    variants: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON(none_as_null=True))) # Resized copies, see services/image_variants.py
+    created_at: datetime = Field(default_factory=get_kyiv_time)
+    sort_order: int = Field(default=0, index=True) # Deprecated: order is given by rank
+    rank: Optional[str] = Field(default=None, sa_column=rank_column()) # Display position, lowest first
+
+class ImageBlob(SQLModel, table=True):
+    url: str = Field(primary_key=True) # Content-addressed URL, see services/image_store.py
+    sha256: str = Field(index=True)
+    ref_count: int = Field(default=0) # ProductImage, Review, Category and Subcategory rows using this URL
     created_at: datetime = Field(default_factory=get_kyiv_time)
-    sort_order: int = Field(default=0, index=True)
+    released_at: Optional[datetime] = None # When ref_count last dropped to 0, prune_images.py waits a grace period after it
 
 class CustomerPromoCodeLink(SQLModel, table=True):
     customer_id: int = Field(foreign_key="customer.id", primary_key=True)
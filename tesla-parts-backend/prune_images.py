@@ -0,0 +1,101 @@
+import argparse
+import time
+from datetime import timedelta
+from sqlmodel import Session, func, select
+from database import engine
+from models import ImageBlob, get_kyiv_time
+from services.image_store import CONTENT_DIR, URL_COLUMNS
+from services.image_uploader import image_uploader
+from services.image_variants import is_cloudinary_url
+
+# Files (and blobs released) more recently than this may belong to a form
+# that is still being submitted
+GRACE_SECONDS = 24 * 3600
+
+def is_referenced(session, url):
+    """Checks every image column, including the ones ImageBlob.ref_count does not track."""
+    for column in URL_COLUMNS:
+        if session.exec(select(column).where(column == url).limit(1)).first():
+            return True
+    return False
+
+def content_files(digest):
+    """The original and its variants: ``<digest>.ext`` and ``<digest>-<w>w.ext``."""
+    return sorted((CONTENT_DIR / digest[:2]).glob(f"{digest}*"))
+
+def delete_cloudinary(url):
+    import cloudinary.uploader
+    public_id = url.split("/image/upload/", 1)[1]
+    if public_id.startswith("v") and "/" in public_id:
+        public_id = public_id.split("/", 1)[1]
+    cloudinary.uploader.destroy(public_id.rsplit(".", 1)[0])
+
+def _recently_uploaded(blob, cutoff):
+    # Re-uploading existing content touches the file, the upload's row may not be saved yet
+    return any(path.stat().st_mtime > cutoff for path in content_files(blob.sha256))
+
+def prune_blobs(session, dry_run):
+    removed = 0
+    cutoff = time.time() - GRACE_SECONDS
+    released_before = get_kyiv_time() - timedelta(seconds=GRACE_SECONDS)
+    urls = session.exec(
+        select(ImageBlob.url).where(
+            ImageBlob.ref_count <= 0,
+            func.coalesce(ImageBlob.released_at, ImageBlob.created_at) < released_before,
+        )
+    ).all()
+    for url in urls:
+        # Re-read under a row lock: a save retaining the blob meanwhile waits for
+        # this transaction, or has already raised the count
+        blob = session.exec(
+            select(ImageBlob).where(ImageBlob.url == url, ImageBlob.ref_count <= 0).with_for_update()
+        ).first()
+        if blob is None or is_referenced(session, blob.url):
+            session.rollback()
+            continue
+        if not is_cloudinary_url(blob.url) and _recently_uploaded(blob, cutoff):
+            session.rollback()
+            continue
+        print(f"  unreferenced {blob.url}")
+        if not dry_run:
+            if is_cloudinary_url(blob.url):
+                if image_uploader.use_cloudinary:
+                    delete_cloudinary(blob.url)
+            else:
+                for path in content_files(blob.sha256):
+                    path.unlink(missing_ok=True)
+            session.delete(blob)
+        session.commit()
+        removed += 1
+    return removed
+
+def prune_orphan_files(session, dry_run):
+    """Files uploaded by requests that failed before saving any row, and stale temp files."""
+    removed = 0
+    known = set(session.exec(select(ImageBlob.sha256)).all())
+    cutoff = time.time() - GRACE_SECONDS
+    # Includes temp files of uploads interrupted mid-stream
+    for path in sorted([*CONTENT_DIR.glob("*/*"), *CONTENT_DIR.glob(".upload-*")]):
+        digest = path.name.split(".", 1)[0].split("-", 1)[0]
+        if digest in known or path.stat().st_mtime > cutoff:
+            continue
+        if is_referenced(session, image_uploader._local_url(path)):
+            continue
+        print(f"  orphan {path}")
+        if not dry_run:
+            path.unlink(missing_ok=True)
+        removed += 1
+    return removed
+
+def prune(dry_run=False):
+    with Session(engine) as session:
+        print("Removing unreferenced images...")
+        blobs = prune_blobs(session, dry_run)
+        print("Removing orphaned uploads...")
+        files = prune_orphan_files(session, dry_run) if CONTENT_DIR.is_dir() else 0
+    print(f"Done: {blobs} images, {files} orphaned files{' (dry run)' if dry_run else ''}.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Delete content-addressed images no row refers to.")
+    parser.add_argument("--dry-run", action="store_true")
+    prune(parser.parse_args().dry_run)
@@ -0,0 +1,16 @@
+from sqlmodel import Session
+from database import engine
+from services.pricing import reprice_products
+from services.site_settings import load_settings
+from services.versioning import bump_catalog_version
+
+def reprice_all():
+    with Session(engine) as session:
+        print("Recomputing UAH prices...")
+        updated = reprice_products(session, settings=load_settings(session))
+        bump_catalog_version(session)
+        session.commit()
+    print(f"Repriced {updated} products.")
+
+if __name__ == "__main__":
+    reprice_all()
@@ -1,10 +1,8 @@
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlmodel import Session, select, delete
-from sqlalchemy.orm import selectinload
-from sqlalchemy import func
+from sqlmodel import Session, select
 from database import get_session
-from models import Category, Subcategory, Product, ProductSubcategoryLink
+from models import Category, Subcategory
 from schemas import (
     CategoryRead,
     CategoryCreate,
@@ -13,191 +11,64 @@ from schemas import (
     SubcategoryTransferRequest,
     CategoryListSchema,
     CategoryDetailSchema,
-    SubcategoryNoProducts,
+    CategoryReorderRequest,
+    SubcategoryReorderRequest,
+    CategoryMoveRequest,
 )
 from services.image_uploader import image_uploader
-from services.pricing import get_exchange_rate, compute_price_fields
-from dependencies import get_current_admin # Import get_current_admin
+from services.ordering import CATEGORIES, SUBCATEGORIES, move_after, new_ranks, reorder
+from services.pricing import get_exchange_rate, reprice_products
+from services.category_tree import SubcategoryTree, subcategory_trees
+from services.subcategory_paths import in_subtree, is_ancestor
+from services.subcategory_deletion import delete_subcategories, has_products
+from services.subcategory_transfer import copy_subtree, move_subtree
+from services.slugs import unique_slug
+from services.versioning import bump_catalog_version
+from services.product_categories import (
+    refresh_category_strings,
+    delete_category_links,
+    products_in_category,
+)
+from dependencies import get_current_admin, catalog_etag # Import get_current_admin
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 
-def _get_next_category_sort_order(session: Session) -> int:
-    result = session.exec(select(func.max(Category.sort_order))).first()
-    if result is None:
-        return 0
-    if isinstance(result, tuple):
-        result = result[0]
-    if result is None:
-        return 0
-    return int(result) + 1
-
-
-def _get_next_subcategory_sort_order(
-    session: Session, category_id: int, parent_id: Optional[int]
-) -> int:
-    stmt = select(func.max(Subcategory.sort_order)).where(
-        Subcategory.category_id == category_id
-    )
-    if parent_id is None:
-        stmt = stmt.where(Subcategory.parent_id.is_(None))
-    else:
-        stmt = stmt.where(Subcategory.parent_id == parent_id)
-    result = session.exec(stmt).first()
-    if result is None:
-        return 0
-    if isinstance(result, tuple):
-        result = result[0]
-    if result is None:
-        return 0
-    return int(result) + 1
-
-
-def _sort_subcategories(subs: List[Subcategory]) -> List[Subcategory]:
-    return sorted(subs, key=lambda s: (-(s.sort_order or 0), s.id or 0))
-
-
-def _split_categories(value: Optional[str]) -> List[str]:
-    if not value:
-        return []
-    return [item.strip() for item in value.split(",") if item.strip()]
-
-
-def _join_categories(categories: List[str]) -> str:
-    unique: List[str] = []
-    for category in categories:
-        if category not in unique:
-            unique.append(category)
-    return ", ".join(unique)
-
-
-def _ensure_category_present(
-    product: Product,
-    category_name: str,
-    session: Session,
-):
-    categories = _split_categories(product.category)
-    if category_name not in categories:
-        categories.append(category_name)
-        product.category = _join_categories(categories)
-        session.add(product)
-
-
-def _replace_category(
-    product: Product,
-    old_category_name: Optional[str],
-    new_category_name: str,
-    session: Session,
-):
-    categories = _split_categories(product.category)
-    if old_category_name:
-        categories = [c for c in categories if c != old_category_name]
-    if new_category_name not in categories:
-        categories.append(new_category_name)
-    if not categories:
-        categories = [new_category_name]
-    product.category = _join_categories(categories)
-    session.add(product)
-
-
-def _ensure_product_link(
-    session: Session,
-    product_id: str,
-    subcategory_id: int,
-):
-    existing = session.get(ProductSubcategoryLink, (product_id, subcategory_id))
-    if not existing:
-        session.add(
-            ProductSubcategoryLink(
-                product_id=product_id,
-                subcategory_id=subcategory_id,
-            )
-        )
-
-
-def _get_products_for_subcategory(
-    session: Session,
-    subcategory_id: int,
-) -> List[Product]:
-    direct_products = session.exec(
-        select(Product)
-        .where(Product.subcategory_id == subcategory_id)
-        .options(
-            selectinload(Product.images),
-            selectinload(Product.linked_subcategories),
-        )
-    ).all()
-
-    linked_products = session.exec(
-        select(Product)
-        .join(
-            ProductSubcategoryLink,
-            ProductSubcategoryLink.product_id == Product.id,
-        )
-        .where(ProductSubcategoryLink.subcategory_id == subcategory_id)
-        .options(
-            selectinload(Product.images),
-            selectinload(Product.linked_subcategories),
-        )
-    ).all()
-
-    merged: dict[str, Product] = {product.id: product for product in direct_products}
-    for product in linked_products:
-        merged.setdefault(product.id, product)
-
-    return list(merged.values())
-
-
-def _collect_subcategory_ids(product: Product) -> List[int]:
-    ids: List[int] = []
-    if product.subcategory_id:
-        ids.append(product.subcategory_id)
-    if product.linked_subcategories:
-        for sub in product.linked_subcategories:
-            if sub.id and sub.id not in ids:
-                ids.append(sub.id)
-    return ids
+async def _set_tile_image(tile, file: Optional[UploadFile], image: Optional[str], folder: str):
+    """Store an uploaded category/subcategory image with its variants, or take over a given URL."""
+    if file and file.filename:
+        uploaded = await image_uploader.upload_image_with_variants(file, folder=folder)
+        if uploaded:
+            tile.image, tile.variants = uploaded
+    elif image and image != tile.image:
+        tile.image = image
+        tile.variants = image_uploader.known_variants(image)
 
 
-def _serialize_product(product: Product, rate: float) -> dict:
-    price_usd, price_uah = compute_price_fields(product, rate)
-    prod_data = product.model_dump()
-    prod_data["priceUSD"] = price_usd
-    prod_data["priceUAH"] = price_uah
-    prod_data["images"] = [img.url for img in product.images]
-    prod_data["subcategory_ids"] = _collect_subcategory_ids(product)
-    return prod_data
+def _validate_pricing(markup_percent: Optional[float], price_rounding: Optional[float]):
+    if markup_percent is not None and markup_percent <= -100:
+        raise HTTPException(status_code=400, detail="markup_percent must be greater than -100")
+    if price_rounding is not None and price_rounding < 0:
+        raise HTTPException(status_code=400, detail="price_rounding must be positive")
 
-@router.get("/", response_model=List[CategoryListSchema])
+@router.get("/", response_model=List[CategoryListSchema], dependencies=[Depends(catalog_etag)])
 def get_categories(session: Session = Depends(get_session)):
     categories = session.exec(
         select(Category)
-        .order_by(Category.sort_order.desc(), Category.id)
+        .order_by(*CATEGORIES.display_order)
     ).all()
     return categories
 
-@router.get("/{category_id}", response_model=CategoryDetailSchema)
+@router.get("/{category_id}", response_model=CategoryDetailSchema, dependencies=[Depends(catalog_etag)])
 def get_category_details(category_id: int, session: Session = Depends(get_session)):
     category = session.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
         
-    # Load subcategories without products
-    subcategories = session.exec(
-        select(Subcategory)
-        .where(Subcategory.category_id == category_id)
-        .order_by(Subcategory.sort_order.desc(), Subcategory.id)
-    ).all()
-
-    # Filter for top-level subcategories (no parent)
-    root_subs = _sort_subcategories([s for s in subcategories if s.parent_id is None])
-    
+    # Subcategories without products, nested through the parent -> children index
+    tree = SubcategoryTree.load(session, category_id)
     cat_data = category.model_dump()
-    cat_data["subcategories"] = [
-        _serialize_subcategory_tree_no_products(sub, subcategories) 
-        for sub in root_subs
-    ]
-    
+    cat_data["subcategories"] = tree.to_dicts(tree.roots(category_id), Subcategory.model_dump)
     return CategoryDetailSchema(**cat_data)
 
 def _validate_target_parent(
@@ -219,164 +90,31 @@ def _validate_target_parent(
     if parent.category_id != target_category_id:
         raise HTTPException(status_code=400, detail="Target parent belongs to another category")
 
-    # Ensure we are not assigning a descendant as parent
+    # Ensure we are not assigning a descendant as parent (read off the paths)
     if moving_subcategory_id:
-        current = parent
-        while current:
-            if current.id == moving_subcategory_id:
-                raise HTTPException(
-                    status_code=400,
-                    detail="Cannot move subcategory inside its own descendant",
-                )
-            if current.parent_id is None:
-                break
-            current = session.get(Subcategory, current.parent_id)
+        moving = session.get(Subcategory, moving_subcategory_id)
+        if moving is not None and is_ancestor(moving, parent):
+            raise HTTPException(
+                status_code=400,
+                detail="Cannot move subcategory inside its own descendant",
+            )
 
     return parent
 
 
-def _update_subtree_category(
-    session: Session,
-    subcategory: Subcategory,
-    new_category_id: int,
-    new_category_name: str,
-    old_category_name: Optional[str] = None,
-):
-    subcategory.category_id = new_category_id
-    session.add(subcategory)
-
-    products = _get_products_for_subcategory(session, subcategory.id)
-    for product in products:
-        _replace_category(product, old_category_name, new_category_name, session)
-
-    children = session.exec(
-        select(Subcategory).where(Subcategory.parent_id == subcategory.id)
-    ).all()
-    for child in children:
-        _update_subtree_category(
-            session,
-            child,
-            new_category_id,
-            new_category_name,
-            old_category_name,
-        )
-
-
-def _clone_subcategory_tree(
-    session: Session,
-    source_subcategory: Subcategory,
-    target_category_id: int,
-    target_category_name: str,
-    parent_id: Optional[int],
-) -> Subcategory:
-    new_subcategory = Subcategory(
-        name=source_subcategory.name,
-        code=source_subcategory.code,
-        image=source_subcategory.image,
-        category_id=target_category_id,
-        parent_id=parent_id,
-        sort_order=source_subcategory.sort_order,
-    )
-    session.add(new_subcategory)
-    session.flush()  # Get ID for children
-
-    products = _get_products_for_subcategory(session, source_subcategory.id)
-    for product in products:
-        _ensure_category_present(product, target_category_name, session)
-        _ensure_product_link(session, product.id, new_subcategory.id)
-
-    children = session.exec(
-        select(Subcategory).where(Subcategory.parent_id == source_subcategory.id)
-    ).all()
-    for child in children:
-        _clone_subcategory_tree(
-            session,
-            child,
-            target_category_id,
-            target_category_name,
-            new_subcategory.id,
-        )
-
-    return new_subcategory
-
-
-def _load_subcategories_for_category(
-    session: Session, category_id: int
-) -> List[Subcategory]:
-    return session.exec(
-        select(Subcategory)
-        .where(Subcategory.category_id == category_id)
-        .order_by(Subcategory.sort_order.desc(), Subcategory.id)
-        .options(selectinload(Subcategory.products))
-    ).all()
-
-
-def _serialize_subcategory_tree(
-    root: Subcategory, all_subs: List[Subcategory], session: Session, rate: float
-) -> SubcategoryRead:
-    sub_data = root.model_dump()
-    products = _get_products_for_subcategory(session, root.id)
-    sub_data["products"] = [_serialize_product(product, rate) for product in products]
-
-    children = _sort_subcategories([sub for sub in all_subs if sub.parent_id == root.id])
-    sub_data["subcategories"] = [
-        _serialize_subcategory_tree(child, all_subs, session, rate)
-        for child in children
-    ]
-    return SubcategoryRead(**sub_data)
-
-
-def _serialize_subcategory_tree_no_products(
-    root: Subcategory, all_subs: List[Subcategory]
-) -> SubcategoryNoProducts:
-    sub_data = root.model_dump()
-    
-    children = _sort_subcategories([sub for sub in all_subs if sub.parent_id == root.id])
-    sub_data["subcategories"] = [
-        _serialize_subcategory_tree_no_products(child, all_subs)
-        for child in children
-    ]
-    return SubcategoryNoProducts(**sub_data)
-
-
 def _build_subcategory_response(
     session: Session, subcategory_id: int, rate: float
 ) -> SubcategoryRead:
-    subcategory = session.exec(
-        select(Subcategory)
-        .where(Subcategory.id == subcategory_id)
-        .options(selectinload(Subcategory.products))
-    ).one()
-    all_subs = _load_subcategories_for_category(session, subcategory.category_id)
-    return _serialize_subcategory_tree(subcategory, all_subs, session, rate)
+    subcategory = session.get(Subcategory, subcategory_id)
+    trees = subcategory_trees(session, subcategory.category_id, rate, root_id=subcategory_id)
+    return SubcategoryRead(**trees[0])
 
 def _build_category_read_response(session: Session, category: Category) -> CategoryRead:
     rate = get_exchange_rate(session)
-    
-    # Reload category with subcategories and products for full serialization
-    category_with_relations = session.exec(
-        select(Category)
-        .where(Category.id == category.id)
-        .options(
-            selectinload(Category.subcategories).selectinload(Subcategory.products).selectinload(Product.images),
-            selectinload(Category.subcategories).selectinload(Subcategory.children)
-        )
-    ).first()
-
-    if not category_with_relations:
-        raise HTTPException(status_code=404, detail="Category not found after refresh")
-
-    cat_data = category_with_relations.model_dump()
-    
-    # Filter for top-level subcategories (no parent)
-    root_subs = [s for s in category_with_relations.subcategories if s.parent_id is None]
-    
-    # Build tree for each root subcategory
-    cat_data["subcategories"] = [
-        _serialize_subcategory_tree(sub, category_with_relations.subcategories, session, rate)
-        for sub in root_subs
-    ]
-        
+    session.refresh(category)
+    cat_data = category.model_dump()
+    # The whole tree with products in a fixed number of queries
+    cat_data["subcategories"] = subcategory_trees(session, category.id, rate)
     return CategoryRead(**cat_data)
 
 @router.post("/", response_model=CategoryRead, dependencies=[Depends(get_current_admin)])
@@ -384,28 +122,24 @@ async def create_category(
     name: str = Form(...),
     image: str = Form(None),
     file: UploadFile = File(None),
-    sort_order: Optional[int] = Form(None),
     meta_title: Optional[str] = Form(None),
     meta_description: Optional[str] = Form(None),
+    markup_percent: Optional[float] = Form(None),
+    price_rounding: Optional[float] = Form(None),
     session: Session = Depends(get_session)
 ):
-    # Handle file upload
-    image_url = image
-    if file and file.filename:
-        image_url = await image_uploader.upload_image(file, folder="tesla-parts/categories")
-
-    if sort_order is None:
-        min_order = session.exec(select(func.min(Category.sort_order))).one()
-        sort_order = (min_order - 10) if min_order is not None else 1000
-
+    _validate_pricing(markup_percent, price_rounding)
     db_category = Category(
         name=name,
-        image=image_url,
-        sort_order=sort_order,
+        slug=unique_slug(session, Category, name),
         meta_title=meta_title or None,
         meta_description=meta_description or None,
+        markup_percent=markup_percent or 0.0,
+        price_rounding=price_rounding,
     )
+    await _set_tile_image(db_category, file, image, "tesla-parts/categories")
     session.add(db_category)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(db_category)
     return _build_category_read_response(session, db_category) # Use helper for response
@@ -418,35 +152,23 @@ async def create_subcategory(
     parent_id: Optional[int] = Form(None),
     image: Optional[str] = Form(None),
     file: UploadFile = File(None),
-    sort_order: Optional[int] = Form(None),
     session: Session = Depends(get_session)
 ):
-    # Handle file upload
-    image_url = image
-    if file and file.filename:
-        image_url = await image_uploader.upload_image(file, folder="tesla-parts/subcategories")
+    # The parent must exist in the same category, its path is the new node's prefix
+    _validate_target_parent(session, parent_id, category_id)
 
     parent_value = parent_id if parent_id is not None else None
     
-    if sort_order is None:
-        query = select(func.min(Subcategory.sort_order)).where(Subcategory.category_id == category_id)
-        if parent_value is None:
-            query = query.where(Subcategory.parent_id.is_(None))
-        else:
-            query = query.where(Subcategory.parent_id == parent_value)
-        
-        min_order = session.exec(query).one()
-        sort_order = (min_order - 10) if min_order is not None else 1000
-
     db_subcategory = Subcategory(
         name=name,
+        slug=unique_slug(session, Subcategory, name),
         code=code,
         category_id=category_id,
         parent_id=parent_value,
-        image=image_url,
-        sort_order=sort_order,
     )
+    await _set_tile_image(db_subcategory, file, image, "tesla-parts/subcategories")
     session.add(db_subcategory)
+    bump_catalog_version(session)
     session.commit()
     rate = get_exchange_rate(session)
     return _build_subcategory_response(session, db_subcategory.id, rate)
@@ -457,32 +179,46 @@ async def update_category(
     name: str = Form(...),
     image: str = Form(None),
     file: UploadFile = File(None),
-    sort_order: Optional[int] = Form(None),
     meta_title: Optional[str] = Form(None),
     meta_description: Optional[str] = Form(None),
+    markup_percent: Optional[float] = Form(None),
+    price_rounding: Optional[float] = Form(None),
     session: Session = Depends(get_session)
 ):
     category = session.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
+    _validate_pricing(markup_percent, price_rounding)
     
+    renamed = category.name != name
+    if renamed or not category.slug:
+        category.slug = unique_slug(session, Category, name, exclude_id=category.id)
     category.name = name
-    if sort_order is not None:
-        category.sort_order = sort_order
     if meta_title is not None:
         category.meta_title = meta_title or None
     if meta_description is not None:
         category.meta_description = meta_description or None
+    repriced = False
+    if markup_percent is not None and markup_percent != category.markup_percent:
+        category.markup_percent = markup_percent
+        repriced = True
+    if price_rounding is not None and price_rounding != category.price_rounding:
+        # 0 clears the category's own step so the site-wide rounding applies
+        category.price_rounding = price_rounding or None
+        repriced = True
     
     # Handle file upload
-    if file and file.filename:
-        image_url = await image_uploader.upload_image(file, folder="tesla-parts/categories")
-        if image_url:
-            category.image = image_url
-    elif image:
-        category.image = image
+    await _set_tile_image(category, file, image, "tesla-parts/categories")
         
     session.add(category)
+    if renamed or repriced:
+        product_ids = session.exec(products_in_category(category.id)).all()
+        if renamed:
+            # Keep the derived legacy category strings in line with the new name
+            refresh_category_strings(session, product_ids)
+        if repriced:
+            reprice_products(session, product_ids)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(category)
     return _build_category_read_response(session, category) # Use helper for response
@@ -495,37 +231,91 @@ async def update_subcategory(
     parent_id: Optional[int] = Form(None),
     image: Optional[str] = Form(None),
     file: UploadFile = File(None),
-    sort_order: Optional[int] = Form(None),
     session: Session = Depends(get_session)
 ):
     subcategory = session.get(Subcategory, subcategory_id)
     if not subcategory:
         raise HTTPException(status_code=404, detail="Subcategory not found")
+    if parent_id is not None and parent_id != subcategory.parent_id:
+        # Same checks as /move: no cycles, no parent from another category's tree
+        _validate_target_parent(
+            session,
+            parent_id,
+            subcategory.category_id,
+            moving_subcategory_id=subcategory_id,
+        )
         
+    if subcategory.name != name or not subcategory.slug:
+        subcategory.slug = unique_slug(session, Subcategory, name, exclude_id=subcategory.id)
     subcategory.name = name
     subcategory.code = code
     # Only update parent_id if it's provided (or explicitly None if we want to move to root, but Form(None) makes it hard to distinguish missing vs null. 
     # For now assume if provided it changes. If not provided (None), keep existing? 
     # Actually Form(None) means it defaults to None if not sent. 
     # Let's assume we send current value if not changing.
-    if parent_id is not None:
+    if parent_id is not None and parent_id != subcategory.parent_id:
+        # Last among the new siblings; its old key means nothing there
+        subcategory.rank = new_ranks(session, SUBCATEGORIES, (subcategory.category_id, parent_id))[0]
         subcategory.parent_id = parent_id
-    if sort_order is not None:
-        subcategory.sort_order = sort_order
         
     # Handle file upload
-    if file and file.filename:
-        image_url = await image_uploader.upload_image(file, folder="tesla-parts/subcategories")
-        if image_url:
-            subcategory.image = image_url
-    elif image:
-        subcategory.image = image
+    await _set_tile_image(subcategory, file, image, "tesla-parts/subcategories")
         
     session.add(subcategory)
+    bump_catalog_version(session)
     session.commit()
     rate = get_exchange_rate(session)
     return _build_subcategory_response(session, subcategory.id, rate)
 
+@router.post("/reorder", dependencies=[Depends(get_current_admin)])
+def reorder_categories(
+    request: CategoryReorderRequest,
+    session: Session = Depends(get_session),
+):
+    """``category_ids`` in display order, first shown first."""
+    if reorder(session, CATEGORIES, request.category_ids):
+        bump_catalog_version(session)
+    session.commit()
+    return {"message": "Successfully reordered"}
+
+@router.post("/{category_id}/move-after", dependencies=[Depends(get_current_admin)])
+def move_category(
+    category_id: int,
+    request: CategoryMoveRequest,
+    session: Session = Depends(get_session),
+):
+    category = move_after(session, CATEGORIES, category_id, request.after_id)
+    if not category:
+        raise HTTPException(status_code=404, detail="Category not found")
+    bump_catalog_version(session)
+    session.commit()
+    return {"id": category.id, "rank": category.rank}
+
+@router.post("/subcategories/reorder", dependencies=[Depends(get_current_admin)])
+def reorder_subcategories(
+    request: SubcategoryReorderRequest,
+    session: Session = Depends(get_session),
+):
+    """``subcategory_ids`` in display order; siblings keep their relative order."""
+    if reorder(session, SUBCATEGORIES, request.subcategory_ids):
+        bump_catalog_version(session)
+    session.commit()
+    return {"message": "Successfully reordered"}
+
+@router.post("/subcategories/{subcategory_id}/move-after", dependencies=[Depends(get_current_admin)])
+def move_subcategory_after(
+    subcategory_id: int,
+    request: CategoryMoveRequest,
+    session: Session = Depends(get_session),
+):
+    """Move among siblings only; use ``/move`` to change the parent."""
+    subcategory = move_after(session, SUBCATEGORIES, subcategory_id, request.after_id)
+    if not subcategory:
+        raise HTTPException(status_code=404, detail="Subcategory not found or not a sibling")
+    bump_catalog_version(session)
+    session.commit()
+    return {"id": subcategory.id, "rank": subcategory.rank}
+
 @router.post("/subcategories/{subcategory_id}/move", response_model=SubcategoryRead, dependencies=[Depends(get_current_admin)])
 def move_subcategory(
     subcategory_id: int,
@@ -539,8 +329,6 @@ def move_subcategory(
     target_category = session.get(Category, transfer.target_category_id)
     if not target_category:
         raise HTTPException(status_code=404, detail="Target category not found")
-    source_category = session.get(Category, subcategory.category_id)
-    old_category_name = source_category.name if source_category else None
 
     _validate_target_parent(
         session,
@@ -549,16 +337,8 @@ def move_subcategory(
         moving_subcategory_id=subcategory_id,
     )
 
-    _update_subtree_category(
-        session,
-        subcategory,
-        transfer.target_category_id,
-        target_category.name,
-        old_category_name,
-    )
-    subcategory.parent_id = transfer.target_parent_id
-
-    session.add(subcategory)
+    move_subtree(session, subcategory, transfer.target_category_id, transfer.target_parent_id)
+    bump_catalog_version(session)
     session.commit()
     rate = get_exchange_rate(session)
     return _build_subcategory_response(session, subcategory.id, rate)
@@ -585,88 +365,40 @@ def copy_subcategory(
         moving_subcategory_id=None,
     )
 
-    new_subcategory = _clone_subcategory_tree(
+    new_subcategory_id = copy_subtree(
         session,
         source_subcategory,
         transfer.target_category_id,
-        target_category.name,
         transfer.target_parent_id,
     )
+    bump_catalog_version(session)
     session.commit()
     rate = get_exchange_rate(session)
-    return _build_subcategory_response(session, new_subcategory.id, rate)
+    return _build_subcategory_response(session, new_subcategory_id, rate)
 
 
-def _has_products(session: Session, subcategory_id: int) -> bool:
-    # Check direct assignment
-    count_direct = session.exec(
-        select(func.count(Product.id)).where(Product.subcategory_id == subcategory_id)
-    ).one()
-    if count_direct > 0:
-        return True
-        
-    # Check linked assignment
-    count_linked = session.exec(
-        select(func.count(ProductSubcategoryLink.product_id)).where(ProductSubcategoryLink.subcategory_id == subcategory_id)
-    ).one()
-    if count_linked > 0:
-        return True
-        
-    return False
-
-def _collect_descendant_ids(session: Session, subcategory_id: int) -> List[int]:
-    ids = [subcategory_id]
-    children = session.exec(select(Subcategory).where(Subcategory.parent_id == subcategory_id)).all()
-    for child in children:
-        ids.extend(_collect_descendant_ids(session, child.id))
-    return ids
-
 @router.delete("/{category_id}", dependencies=[Depends(get_current_admin)])
 def delete_category(category_id: int, session: Session = Depends(get_session)):
     category = session.get(Category, category_id)
     if not category:
         raise HTTPException(status_code=404, detail="Category not found")
     
-    # Get all subcategories
-    subcategories = session.exec(
-        select(Subcategory).where(Subcategory.category_id == category_id)
-    ).all()
-    
-    subcategory_ids = [s.id for s in subcategories]
-    
-    # Check for products in any subcategory
-    for sub_id in subcategory_ids:
-        if _has_products(session, sub_id):
-            raise HTTPException(
-                status_code=400, 
-                detail="Категорія не пуста. Видалення неможливе"
-            )
-            
-    if subcategory_ids:
-        # 1. Break parent/child relationships to avoid FK constraints during deletion
-        # It is safer to update them to NULL first
-        session.exec(
-            select(Subcategory).where(Subcategory.category_id == category_id)
-        ) 
-        # Actually, simple update statement is better
-        # But SQLModel/SQLAlchemy update syntax:
-        for sub in subcategories:
-            sub.parent_id = None
-            session.add(sub)
-        session.flush()
-
-        # 2. Delete links
-        session.exec(
-            delete(ProductSubcategoryLink).where(
-                ProductSubcategoryLink.subcategory_id.in_(subcategory_ids)
-            )
+    # One EXISTS over every subcategory of the category, direct and linked products
+    in_category = Subcategory.category_id == category_id
+    if has_products(session, in_category):
+        raise HTTPException(
+            status_code=400, 
+            detail="Категорія не пуста. Видалення неможливе"
         )
-        
-        # 3. Delete subcategories
-        for sub in subcategories:
-            session.delete(sub)
-            
+    delete_subcategories(session, in_category)
+
+    # Products placed directly in the category lose it, their legacy strings follow
+    unlinked_product_ids = delete_category_links(session, category_id)
     session.delete(category)
+    session.flush()
+    refresh_category_strings(session, unlinked_product_ids)
+    reprice_products(session, unlinked_product_ids)
+    bump_catalog_version(session)
     session.commit()
     return {"ok": True}
 
@@ -676,37 +408,15 @@ def delete_subcategory(subcategory_id: int, session: Session = Depends(get_sessi
     if not subcategory:
         raise HTTPException(status_code=404, detail="Subcategory not found")
         
-    # Collect all descendants (including self)
-    target_ids = _collect_descendant_ids(session, subcategory_id)
-    
-    # Check products
-    for tid in target_ids:
-        if _has_products(session, tid):
-            raise HTTPException(
-                status_code=400, 
-                detail="Категорія не пуста. Видалення неможливе"
-            )
-    
-    # Safe delete
-    # 1. Break parent relationships for the tree (or just for those being deleted)
-    # Finding objects to delete
-    targets = session.exec(select(Subcategory).where(Subcategory.id.in_(target_ids))).all()
-    
-    for t in targets:
-        t.parent_id = None
-        session.add(t)
-    session.flush()
-    
-    # 2. Delete links
-    session.exec(
-        delete(ProductSubcategoryLink).where(
-            ProductSubcategoryLink.subcategory_id.in_(target_ids)
+    # The whole subtree is one path range: one EXISTS, then one DELETE per table
+    subtree = in_subtree(subcategory.path)
+    if has_products(session, subtree):
+        raise HTTPException(
+            status_code=400, 
+            detail="Категорія не пуста. Видалення неможливе"
         )
-    )
-    
-    # 3. Delete subcategories
-    for t in targets:
-        session.delete(t)
-        
+    delete_subcategories(session, subtree)
+
+    bump_catalog_version(session)
     session.commit()
     return {"ok": True}
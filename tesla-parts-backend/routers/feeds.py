@@ -5,7 +5,8 @@ from fastapi import APIRouter, Depends, Response, HTTPException
 from sqlmodel import Session, select
 from sqlalchemy.orm import selectinload
 from database import get_session
-from models import Product, Category, Subcategory
+from models import Product, Category
+from services.category_tree import SubcategoryTree
 from services.pricing import get_exchange_rate, compute_price_fields
 from datetime import datetime
 
@@ -111,7 +112,7 @@ async def get_prom_ua_feed(session: Session = Depends(get_session)):
     try:
         products = await get_active_products(session)
         categories = session.exec(select(Category)).all()
-        subcategories = session.exec(select(Subcategory)).all()
+        subcategories = SubcategoryTree.load(session)
         rate = get_exchange_rate(session)
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M")
 
@@ -135,8 +136,8 @@ async def get_prom_ua_feed(session: Session = Depends(get_session)):
             cat_id = cat.id * 1000000
             xml_output.append(f'<category id="{cat_id}">{saxutils.escape(cat.name)}</category>')
         
-        # Add subcategories
-        for sub in subcategories:
+        # Add subcategories, parents before their children
+        for sub in subcategories.walk():
             if sub.parent_id:
                 parent_id = sub.parent_id
             else:
@@ -4,6 +4,8 @@ from sqlmodel import Session, select
 from database import get_session
 from models import Page
 from pydantic import BaseModel
+from dependencies import catalog_etag
+from services.versioning import bump_catalog_version
 
 router = APIRouter(prefix="/pages", tags=["pages"])
 
@@ -33,7 +35,7 @@ def get_pages_by_slugs(req: PagesRequest, session: Session = Depends(get_session
     # Return pages in the order of requested slugs
     return [slug_map[slug] for slug in req.slugs if slug in slug_map]
 
-@router.get("/", response_model=List[Page])
+@router.get("/", response_model=List[Page], dependencies=[Depends(catalog_etag)])
 def read_pages(
     offset: int = 0,
     limit: int = Query(default=100, le=100),
@@ -42,7 +44,7 @@ def read_pages(
     pages = session.exec(select(Page).offset(offset).limit(limit)).all()
     return pages
 
-@router.get("/{slug_or_id}", response_model=Page)
+@router.get("/{slug_or_id}", response_model=Page, dependencies=[Depends(catalog_etag)])
 def read_page(slug_or_id: str, session: Session = Depends(get_session)):
     # Try ID first if integer
     if slug_or_id.isdigit():
@@ -65,6 +67,7 @@ def create_page(page: PageCreate, session: Session = Depends(get_session)):
         
     db_page = Page.from_orm(page)
     session.add(db_page)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(db_page)
     return db_page
@@ -80,6 +83,7 @@ def update_page(page_id: int, page_update: PageUpdate, session: Session = Depend
         setattr(db_page, key, value)
         
     session.add(db_page)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(db_page)
     return db_page
@@ -90,5 +94,6 @@ def delete_page(page_id: int, session: Session = Depends(get_session)):
     if not page:
         raise HTTPException(status_code=404, detail="Page not found")
     session.delete(page)
+    bump_catalog_version(session)
     session.commit()
     return {"ok": True}
@@ -1,63 +1,60 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlmodel import Session, select, delete, or_, col
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session, select, delete, or_, and_, col
 from typing import List, Optional
 import shutil
 import os
+import tempfile
 import re
+import json
+import base64
+import binascii
 from sqlalchemy.orm import selectinload
-from sqlalchemy import func
+from sqlalchemy import false
 from database import get_session
-from models import Product, ProductImage, ProductSubcategoryLink, Category
-from schemas import ProductCreate, ProductRead, ProductBulkDeleteRequest, ProductReorderRequest
+from models import Product, ProductImage, ProductSubcategoryLink
+from schemas import ProductCreate, ProductRead, ProductBulkDeleteRequest, ProductReorderRequest, ProductMoveRequest, ProductLabelRead, ProductFacetsRead, ProductBatchRequest, ProductSnapshotRead
 from services.image_uploader import image_uploader
-from services.pricing import get_exchange_rate, compute_price_fields
-from dependencies import get_current_admin
+from services.ordering import PRODUCTS, move_after, reorder
+from services.pricing import get_exchange_rate, reprice_products
+from services.product_deletion import delete_products
+from services.product_facets import facet_columns, product_facets
+from services.product_serializer import product_list_response, product_response, product_snapshot_list_response
+from services.search import apply_product_search
+from services.slugs import resolve_category_slug
+from services.versioning import bump_catalog_version
+from services.product_categories import (
+    split_categories,
+    category_ids_for_names,
+    UnknownCategoryError,
+    products_in_category,
+    set_product_categories,
+    copy_product_categories,
+    category_labels,
+)
+from services.catalog_io import (
+    CSV,
+    CatalogFormatError,
+    detect_format,
+    import_products,
+    iter_csv_export,
+    read_rows,
+    write_xlsx_export,
+)
+from services.part_numbers import sync_part_numbers, lookup_product_ids
+from dependencies import get_current_admin, catalog_etag
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/300"
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
 
 
-def _slugify(value: str) -> str:
-    """
-    Simple slugify implementation matching frontend logic:
-    lowercase, trim, replace spaces with dashes.
-    """
-    if not value:
-        return ""
-    value = value.lower().strip()
-    return re.sub(r'\s+', '-', value)
-
-
-def _split_categories(category_str: Optional[str]) -> List[str]:
-    if not category_str:
-        return []
-    return [c.strip() for c in category_str.split(",") if c.strip()]
-
-
-def _collect_subcategory_ids(product: Product) -> List[int]:
-    ids: List[int] = []
-    if product.subcategory_id:
-        ids.append(product.subcategory_id)
-    if product.linked_subcategories:
-        for sub in product.linked_subcategories:
-            if sub.id and sub.id not in ids:
-                ids.append(sub.id)
-    return ids
-
-
-def _build_product_response(product: Product, rate: float) -> ProductRead:
-    price_usd, price_uah = compute_price_fields(product, rate)
-    p_data = product.model_dump()
-    p_data["priceUSD"] = price_usd
-    p_data["priceUAH"] = price_uah
-    p_data["images"] = [img.url for img in product.images]
-    p_data["subcategory_ids"] = _collect_subcategory_ids(product)
-    # Ensure created_at is handled as ISO format string for frontend if needed, 
-    # but Pydantic's datetime field handles this naturally.
-    if product.created_at:
-        p_data["created_at"] = product.created_at.isoformat()
-    return ProductRead(**p_data)
+def _category_ids(session: Session, category: Optional[str]) -> List[int]:
+    try:
+        return category_ids_for_names(session, split_categories(category))
+    except UnknownCategoryError as exc:
+        raise HTTPException(status_code=400, detail=f"Unknown category: {', '.join(exc.names)}")
 
 
 def _normalize_subcategory_selection(
@@ -94,39 +91,58 @@ def _sync_linked_subcategories(
         )
     session.commit()
 
-@router.get("/", response_model=List[ProductRead])
-def read_products(
-    category_slug: Optional[str] = None,
-    subcategory_id: Optional[int] = None,
-    search: Optional[str] = None,
-    is_popular: Optional[bool] = None,
-    limit: int = 100,
-    offset: int = 0,
-    session: Session = Depends(get_session)
-):
-    query = select(Product).options(
-        selectinload(Product.images),
-        selectinload(Product.linked_subcategories),
+def _encode_cursor(product: Product) -> str:
+    payload = [product.rank, bool(product.inStock), product.name, product.id]
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        rank, in_stock, name, product_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(rank, str) or not isinstance(in_stock, bool) \
+            or not isinstance(name, str) or not isinstance(product_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return rank, in_stock, name, product_id
+
+
+def _after_cursor(cursor: str):
+    # Rows strictly after the cursor in (rank ASC, inStock DESC, name ASC, id ASC) order
+    rank, in_stock, name, product_id = _decode_cursor(cursor)
+    same_rank = Product.rank == rank
+    same_stock = and_(same_rank, Product.inStock == in_stock)
+    same_name = and_(same_stock, Product.name == name)
+    return or_(
+        Product.rank > rank,
+        # inStock DESC: only "in stock" cursors have rows after them in the same group
+        and_(same_rank, Product.inStock == False) if in_stock else false(),
+        and_(same_stock, Product.name > name),
+        and_(same_name, Product.id > product_id),
     )
 
+
+def _apply_listing_filters(
+    session: Session,
+    query,
+    category_slug: Optional[str],
+    subcategory_id: Optional[int],
+    is_popular: Optional[bool],
+    catalog_version: Optional[int] = None,
+):
+    """Filters shared by the listing and its facet counts; None when the category slug is unknown."""
     # 0. Filter by Popularity
     if is_popular is not None:
         query = query.where(Product.is_popular == is_popular)
-    # We need to find the category name from the slug to support legacy 'Product.category' field
+    # 1. Filter by Category (resolved from the slug)
     if category_slug:
-        # Fetch all categories to match slug (since we don't have slug column)
-        all_categories = session.exec(select(Category)).all()
-        target_category = next(
-            (c for c in all_categories if _slugify(c.name) == category_slug), 
-            None
-        )
+        target_category = resolve_category_slug(session, category_slug, catalog_version)
         
         if target_category:
-            # Filter by legacy category name field
-            # AND/OR filter by subcategories belonging to this category
-            # For now, adhering to existing pattern using the string field as primary
-            # FIX 1: Use contains for partial match (comma-separated)
-            query = query.where(col(Product.category).contains(target_category.name))
+            # Membership comes from the indexed product/category link table
+            query = query.where(col(Product.id).in_(products_in_category(target_category.id)))
             
             # FIX 2: If we are in "parent category view" (no subcategory_id),
             # hide products that belong to a subcategory.
@@ -135,9 +151,7 @@ def read_products(
                 # Also exclude if they are linked to any subcategory
                 query = query.where(~Product.linked_subcategories.any())
         else:
-            # If slug doesn't match any category, return empty or handle as 404? 
-            # Returning empty list is safer for list endpoint
-            return []
+            return None
 
     # 2. Filter by Subcategory ID
     if subcategory_id:
@@ -151,39 +165,217 @@ def read_products(
                 Product.linked_subcategories.any(ProductSubcategoryLink.subcategory_id == subcategory_id)
             )
         )
+    return query
 
-    # 3. Search Filter
-    if search:
-        search_term = f"%{search}%"
-        # Normalize search for cross/detail numbers (remove dashes/spaces) could be an improvement, 
-        # but basic ILIKE is a good start.
-        search_term_clean = f"%{search.replace('-', '')}%"
-        query = query.where(
-            or_(
-                col(Product.name).ilike(search_term),
-                func.replace(Product.detail_number, "-", "").ilike(search_term_clean),
-                col(Product.cross_number).ilike(search_term_clean),
-                col(Product.description).ilike(search_term_clean)
-            )
-        )
 
-    # 4. Sorting
-    # Priority: Sort Order (DESC), In Stock (DESC), then Name (ASC)
-    query = query.order_by(
-        col(Product.sort_order).asc(),
-        col(Product.inStock).desc(), 
-        col(Product.name).asc()
+@router.get("/", response_model=List[ProductRead])
+def read_products(
+    response: Response,
+    category_slug: Optional[str] = None,
+    subcategory_id: Optional[int] = None,
+    search: Optional[str] = None,
+    is_popular: Optional[bool] = None,
+    limit: int = 100,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    session: Session = Depends(get_session),
+    catalog_version: int = Depends(catalog_etag),
+):
+    # Passing `cursor` (empty for the first page) switches to keyset pagination:
+    # the next page token comes back in the X-Next-Cursor header.
+    use_cursor = cursor is not None
+    if use_cursor and search and search.strip():
+        raise HTTPException(status_code=400, detail="Cursor pagination is not supported together with search")
+
+    query = _apply_listing_filters(
+        session,
+        select(Product).options(
+            selectinload(Product.images),
+            selectinload(Product.linked_subcategories),
+        ),
+        category_slug,
+        subcategory_id,
+        is_popular,
+        catalog_version,
     )
+    if query is None:
+        # Unknown category slug: an empty list is safer than a 404 for a list endpoint
+        return []
+
+    # 3. Search Filter (full-text index, ordered by relevance)
+    if search and search.strip():
+        query = apply_product_search(session, query, search.strip())
+
+    # 4. Sorting
+    # Priority: Relevance (when searching), Rank (ASC), In Stock (DESC), then Name (ASC).
+    # Matches ix_product_rank_listing, id makes the order total for keyset pagination.
+    query = query.order_by(*PRODUCTS.display_order)
 
     # 5. Pagination
-    query = query.offset(offset).limit(limit)
+    if use_cursor:
+        if cursor:
+            query = query.where(_after_cursor(cursor))
+        query = query.limit(limit)
+    else:
+        query = query.offset(offset).limit(limit)
     
     products = session.exec(query).all()
+    if use_cursor and len(products) == limit:
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(products[-1])
+    rate = get_exchange_rate(session)
+    return product_list_response(products, rate, response)
+
+@router.get("/lookup", response_model=List[ProductRead], dependencies=[Depends(catalog_etag)])
+def lookup_products(
+    response: Response,
+    number: str = Query(..., min_length=1),
+    limit: int = Query(default=20, le=100),
+    session: Session = Depends(get_session)
+):
+    # Exact/prefix match on the normalized part-number index, exact hits first
+    product_ids = lookup_product_ids(session, number, limit)
+    if not product_ids:
+        return []
+    products = session.exec(
+        select(Product)
+        .where(col(Product.id).in_(product_ids))
+        .options(
+            selectinload(Product.images),
+            selectinload(Product.linked_subcategories),
+        )
+    ).all()
+    product_map = {p.id: p for p in products}
+    rate = get_exchange_rate(session)
+    return product_list_response(
+        (product_map[pid] for pid in product_ids if pid in product_map), rate, response
+    )
+
+@router.post("/batch", response_model=List[ProductSnapshotRead])
+def read_products_batch(
+    request: ProductBatchRequest,
+    response: Response,
+    session: Session = Depends(get_session)
+):
+    # Cart/checkout revalidation: one query for all ids, in request order.
+    # Ids that no longer exist are left out so the client can drop them.
+    product_ids = list(dict.fromkeys(request.product_ids))
+    if not product_ids:
+        return []
+    products = session.exec(
+        select(Product)
+        .where(col(Product.id).in_(product_ids))
+        .options(selectinload(Product.images))
+    ).all()
+    product_map = {p.id: p for p in products}
     rate = get_exchange_rate(session)
-    return [_build_product_response(p, rate) for p in products]
+    return product_snapshot_list_response(
+        (product_map[pid] for pid in product_ids if pid in product_map), rate, response
+    )
+
+@router.get("/export", dependencies=[Depends(get_current_admin)])
+def export_products(
+    file_format: str = Query(CSV, alias="format"),
+    session: Session = Depends(get_session),
+):
+    try:
+        file_format = detect_format(None, file_format)
+        if file_format == CSV:
+            bind = session.get_bind()
+
+            def iter_csv():
+                # The request's session is closed before the body streams, so the stream opens its own
+                with Session(bind) as stream_session:
+                    yield from iter_csv_export(stream_session)
+
+            return StreamingResponse(
+                iter_csv(),
+                media_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": 'attachment; filename="products.csv"'},
+            )
+        # openpyxl's write-only mode spools rows to disk, the finished file is streamed back
+        export_file = tempfile.TemporaryFile()
+        write_xlsx_export(session, export_file)
+    except CatalogFormatError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    export_file.seek(0)
+
+    def iter_file():
+        with export_file:
+            while chunk := export_file.read(64 * 1024):
+                yield chunk
+
+    return StreamingResponse(
+        iter_file(),
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        headers={"Content-Disposition": 'attachment; filename="products.xlsx"'},
+    )
+
+@router.post("/import", dependencies=[Depends(get_current_admin)])
+def import_products_file(
+    file: UploadFile = File(...),
+    file_format: Optional[str] = Query(None, alias="format"),
+    batch_size: int = Query(default=1000, ge=1, le=10000),
+    session: Session = Depends(get_session),
+):
+    """
+    Upsert products from a CSV/XLSX sheet (columns as in /products/export).
 
-@router.get("/{product_id}", response_model=ProductRead)
-def read_product(product_id: str, session: Session = Depends(get_session)):
+    Streams newline-delimited JSON: one progress line with the row errors of
+    each committed batch, then a final line with ``"done": true``.
+    """
+    # The upload is closed once this handler returns, keep a copy for the stream
+    upload = tempfile.TemporaryFile()
+    shutil.copyfileobj(file.file, upload)
+    upload.seek(0)
+    try:
+        rows = read_rows(upload, detect_format(file.filename, file_format))
+    except (CatalogFormatError, UnicodeDecodeError) as exc:
+        upload.close()
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    bind = session.get_bind()
+
+    def iter_progress():
+        # Batches commit as they go; the request's session is closed before the
+        # body streams, and closing this one rolls back a batch cut short by an error
+        with upload, Session(bind) as import_session:
+            for report in import_products(import_session, rows, batch_size):
+                yield json.dumps(report, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(iter_progress(), media_type="application/x-ndjson")
+
+@router.get(
+    "/labels",
+    response_model=List[ProductLabelRead],
+    tags=["labels"],
+)
+def read_labels(session: Session = Depends(get_session), catalog_version: int = Depends(catalog_etag)):
+    # One GROUP BY over the product/category links, cached until the catalog changes
+    return category_labels(session, catalog_version)
+
+@router.get("/facets", response_model=ProductFacetsRead)
+def read_product_facets(
+    category_slug: Optional[str] = None,
+    subcategory_id: Optional[int] = None,
+    search: Optional[str] = None,
+    is_popular: Optional[bool] = None,
+    session: Session = Depends(get_session),
+    catalog_version: int = Depends(catalog_etag),
+):
+    # Same filters as the listing, counted in one GROUP BY and cached per catalog version
+    search = search.strip() if search else None
+    query = _apply_listing_filters(
+        session, select(*facet_columns()), category_slug, subcategory_id, is_popular, catalog_version
+    )
+    if query is None:
+        return ProductFacetsRead()
+    if search:
+        query = apply_product_search(session, query, search)
+    key = (category_slug, subcategory_id, search, is_popular)
+    return product_facets(session, key, query, catalog_version)
+
+@router.get("/{product_id}", response_model=ProductRead, dependencies=[Depends(catalog_etag)])
+def read_product(product_id: str, response: Response, session: Session = Depends(get_session)):
     product = session.exec(
         select(Product)
         .where(Product.id == product_id)
@@ -196,13 +388,7 @@ def read_product(product_id: str, session: Session = Depends(get_session)):
         raise HTTPException(status_code=404, detail="Product not found")
     
     rate = get_exchange_rate(session)
-    return _build_product_response(product, rate)
-
-@router.get("/labels", tags=["labels"])
-def read_labels(session: Session = Depends(get_session)):
-    products = session.exec(select(Product)).all()
-    categories = list(set(p.category for p in products))
-    return categories
+    return product_response(product, rate, response)
 
 @router.post("/", response_model=ProductRead, dependencies=[Depends(get_current_admin)])
 async def create_product(
@@ -215,7 +401,6 @@ async def create_product(
     priceUSD: float = Form(...),
     description: str = Form(...),
     inStock: bool = Form(...),
-    sort_order: Optional[int] = Form(None),
     detail_number: Optional[str] = Form(None),
     cross_number: Optional[str] = Form(None),
     meta_title: Optional[str] = Form(None),
@@ -226,20 +411,15 @@ async def create_product(
     session: Session = Depends(get_session)
 ):
     product_id = id or f"prod-{os.urandom(4).hex()}"
-    image_urls = []
-    
-    # Handle multiple file uploads using the image uploader service
-    if files:
-        for file in files:
-            if file.filename:
-                url = await image_uploader.upload_image(file, folder="tesla-parts/products")
-                if url:
-                    image_urls.append(url)
+    # Before any upload, so a rejected category leaves no files behind
+    category_ids = _category_ids(session, category)
+    # Handle multiple file uploads using the image uploader service (concurrently)
+    uploaded_images = await image_uploader.upload_images(files, folder="tesla-parts/products")
     
     # Determine main image
     main_image = image
-    if not main_image and image_urls:
-        main_image = image_urls[0]
+    if not main_image and uploaded_images:
+        main_image = uploaded_images[0].url
     if not main_image:
         main_image = PLACEHOLDER_IMAGE_URL
 
@@ -251,21 +431,6 @@ async def create_product(
         normalized_subcategories[0] if normalized_subcategories else None
     )
 
-    if sort_order is None:
-        # Find current max sort_order within the group to place at bottom
-        if primary_subcategory_id:
-            query = select(func.max(Product.sort_order)).where(Product.subcategory_id == primary_subcategory_id)
-        else:
-            # For products directly in category name
-            # We assume the first category name in the list is the primary one
-            first_cat = _split_categories(category)[0] if category else None
-            if first_cat:
-                query = select(func.max(Product.sort_order)).where(col(Product.category).contains(first_cat)).where(Product.subcategory_id == None)
-            else:
-                query = select(func.max(Product.sort_order))
-
-        max_val = session.exec(query).one()
-        sort_order = (max_val + 1) if max_val is not None else 0
     rate = get_exchange_rate(session)
 
     product_data = Product(
@@ -277,7 +442,6 @@ async def create_product(
         priceUSD=priceUSD,
         description=description,
         inStock=inStock,
-        sort_order=sort_order,
         detail_number=detail_number,
         cross_number=cross_number,
         meta_title=meta_title,
@@ -285,10 +449,9 @@ async def create_product(
         is_popular=is_popular,
         image=main_image
     )
-    if priceUSD:
-        product_data.priceUAH = round(priceUSD * rate, 2)
 
     session.add(product_data)
+    product_data.category = set_product_categories(session, product_id, category_ids)
     session.commit()
     session.refresh(product_data)
 
@@ -297,12 +460,15 @@ async def create_product(
         product_id,
         normalized_subcategories[1:] if normalized_subcategories else [],
     )
+    sync_part_numbers(session, product_id, detail_number, cross_number)
     
     # Save additional images to ProductImage table
-    for url in image_urls:
-        product_image = ProductImage(product_id=product_id, url=url)
+    for uploaded in uploaded_images:
+        product_image = ProductImage(product_id=product_id, url=uploaded.url, variants=uploaded.variants)
         session.add(product_image)
     
+    reprice_products(session, [product_id])
+    bump_catalog_version(session)
     session.commit()
     session.refresh(product_data) # Refresh to get relationships
     
@@ -310,7 +476,7 @@ async def create_product(
     session.refresh(product_data) # Refresh to get relationships
     
     # Construct response manually to avoid modifying the SQLModel relationship with strings
-    return _build_product_response(product_data, rate)
+    return product_response(product_data, rate)
 
 @router.put("/{product_id}", response_model=ProductRead, dependencies=[Depends(get_current_admin)])
 async def update_product(
@@ -323,7 +489,6 @@ async def update_product(
     priceUSD: float = Form(...),
     description: str = Form(...),
     inStock: bool = Form(...),
-    sort_order: int = Form(0),
     detail_number: Optional[str] = Form(None),
     cross_number: Optional[str] = Form(None),
     meta_title: Optional[str] = Form(None),
@@ -340,12 +505,11 @@ async def update_product(
 
     # Update basic fields
     product.name = name
-    product.category = category
+    product.category = set_product_categories(session, product_id, _category_ids(session, category))
     product.priceUAH = priceUAH
     product.priceUSD = priceUSD
     product.description = description
     product.inStock = inStock
-    product.sort_order = sort_order
     product.detail_number = detail_number
     product.cross_number = cross_number
     product.meta_title = meta_title
@@ -368,14 +532,8 @@ async def update_product(
             if img.url not in normalized_kept:
                 session.delete(img)
     
-    # Handle new file uploads
-    new_image_urls = []
-    if files:
-        for file in files:
-            if file.filename:
-                url = await image_uploader.upload_image(file, folder="tesla-parts/products")
-                if url:
-                    new_image_urls.append(url)
+    # Handle new file uploads (concurrently)
+    new_images = await image_uploader.upload_images(files, folder="tesla-parts/products")
 
     normalized_subcategories = _normalize_subcategory_selection(
         subcategory_id,
@@ -386,8 +544,6 @@ async def update_product(
     )
 
     rate = get_exchange_rate(session)
-    if priceUSD:
-        product.priceUAH = round(priceUSD * rate, 2)
 
     session.add(product)
     session.commit()
@@ -397,12 +553,15 @@ async def update_product(
         product_id,
         normalized_subcategories[1:] if normalized_subcategories else [],
     )
+    sync_part_numbers(session, product_id, detail_number, cross_number)
     
     # Add new images to gallery
-    for url in new_image_urls:
-        product_image = ProductImage(product_id=product_id, url=url)
+    for uploaded in new_images:
+        product_image = ProductImage(product_id=product_id, url=uploaded.url, variants=uploaded.variants)
         session.add(product_image)
         
+    reprice_products(session, [product_id])
+    bump_catalog_version(session)
     session.commit()
     session.refresh(product)
     
@@ -424,11 +583,12 @@ async def update_product(
 
     if image_updated:
         session.add(product)
+        bump_catalog_version(session)
         session.commit()
         session.refresh(product)
 
     product.images = updated_images
-    return _build_product_response(product, rate)
+    return product_response(product, rate)
 
 @router.post("/{product_id}/copy", response_model=ProductRead, dependencies=[Depends(get_current_admin)])
 def copy_product(
@@ -465,10 +625,15 @@ def copy_product(
     links = session.exec(select(ProductSubcategoryLink).where(ProductSubcategoryLink.product_id == product_id)).all()
     for link in links:
         session.add(ProductSubcategoryLink(product_id=new_id, subcategory_id=link.subcategory_id))
+    copy_product_categories(session, product_id, new_id)
         
     images = session.exec(select(ProductImage).where(ProductImage.product_id == product_id)).all()
     for img in images:
-        session.add(ProductImage(product_id=new_id, url=img.url))
+        session.add(ProductImage(product_id=new_id, url=img.url, variants=img.variants))
+
+    sync_part_numbers(session, new_id, product.detail_number, product.cross_number)
+    move_after(session, PRODUCTS, new_id, product_id) # Show the copy right after the original
+    bump_catalog_version(session)
         
     session.commit()
     
@@ -481,21 +646,16 @@ def copy_product(
         )
     ).first()
     
-    return _build_product_response(full_new_product, rate)
+    return product_response(full_new_product, rate)
 
 @router.delete("/{product_id}", dependencies=[Depends(get_current_admin)])
 def delete_product(product_id: str, session: Session = Depends(get_session)):
-    product = session.get(Product, product_id)
-    if not product:
+    result = delete_products(session, [product_id])
+    if not result.deleted:
         raise HTTPException(status_code=404, detail="Product not found")
-    session.exec(
-        delete(ProductSubcategoryLink).where(
-            ProductSubcategoryLink.product_id == product_id
-        )
-    )
-    session.delete(product)
+    bump_catalog_version(session)
     session.commit()
-    return {"ok": True}
+    return {"ok": True, "freed_images": result.freed_images}
 
 
 @router.post("/reorder", dependencies=[Depends(get_current_admin)])
@@ -503,43 +663,35 @@ def reorder_products(
     request: ProductReorderRequest,
     session: Session = Depends(get_session)
 ):
-    products = session.exec(
-        select(Product).where(col(Product.id).in_(request.product_ids))
-    ).all()
-    
-    product_map = {p.id: p for p in products}
-    
-    for index, prod_id in enumerate(request.product_ids):
-        if prod_id in product_map:
-            product_map[prod_id].sort_order = index
-            session.add(product_map[prod_id])
-            
+    if reorder(session, PRODUCTS, request.product_ids):
+        bump_catalog_version(session)
     session.commit()
     return {"message": "Successfully reordered"}
 
+@router.post("/{product_id}/move-after", dependencies=[Depends(get_current_admin)])
+def move_product(
+    product_id: str,
+    request: ProductMoveRequest,
+    session: Session = Depends(get_session)
+):
+    product = move_after(session, PRODUCTS, product_id, request.after_id)
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    bump_catalog_version(session)
+    session.commit()
+    return {"id": product.id, "rank": product.rank}
+
 @router.post("/bulk-delete", dependencies=[Depends(get_current_admin)])
 def bulk_delete_products(
     request: ProductBulkDeleteRequest,
     session: Session = Depends(get_session),
 ):
-    if not request.product_ids:
-        return {"deleted": 0}
-
-    session.exec(
-        delete(ProductSubcategoryLink).where(
-            ProductSubcategoryLink.product_id.in_(request.product_ids)
-        )
-    )
-
-    products = session.exec(
-        select(Product).where(Product.id.in_(request.product_ids))
-    ).all()
-
-    for product in products:
-        session.delete(product)
-
+    """Returns the image URLs no remaining row uses; ``prune_images.py`` removes the files."""
+    result = delete_products(session, request.product_ids)
+    if result.deleted:
+        bump_catalog_version(session)
     session.commit()
-    return {"deleted": len(products)}
+    return {"deleted": result.deleted, "freed_images": result.freed_images}
 
 @router.post("/{product_id}/toggle-popular", dependencies=[Depends(get_current_admin)])
 def toggle_popular(
@@ -552,8 +704,9 @@ def toggle_popular(
     
     product.is_popular = not product.is_popular
     session.add(product)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(product)
     
     rate = get_exchange_rate(session)
-    return _build_product_response(product, rate)
+    return product_response(product, rate)
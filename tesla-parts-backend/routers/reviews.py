@@ -1,35 +1,37 @@
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
 from sqlmodel import Session, select
 from database import get_session
 from models import Review
-from schemas import ReviewRead, ReviewReorderRequest
+from schemas import ReviewRead, ReviewReorderRequest, ReviewMoveRequest
 from services.image_uploader import image_uploader
-from dependencies import get_current_admin
+from services.ordering import REVIEWS, move_after, reorder
+from dependencies import get_current_admin, catalog_etag
+from services.versioning import bump_catalog_version
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
 
-@router.get("/", response_model=List[ReviewRead])
+@router.get("/", response_model=List[ReviewRead], dependencies=[Depends(catalog_etag)])
 def read_reviews(
     offset: int = 0,
     limit: int = Query(default=100, le=100),
     session: Session = Depends(get_session)
 ):
-    reviews = session.exec(select(Review).order_by(Review.sort_order.asc(), Review.created_at.desc()).offset(offset).limit(limit)).all()
+    reviews = session.exec(select(Review).order_by(*REVIEWS.display_order).offset(offset).limit(limit)).all()
     return reviews
 
 @router.post("/", response_model=ReviewRead, dependencies=[Depends(get_current_admin)])
 async def create_review(
     file: UploadFile = File(...),
-    sort_order: int = Form(0),
     session: Session = Depends(get_session)
 ):
-    url = await image_uploader.upload_image(file, folder="tesla-parts/reviews")
-    if not url:
+    uploaded = await image_uploader.upload_image_with_variants(file, folder="tesla-parts/reviews")
+    if not uploaded:
         raise HTTPException(status_code=400, detail="Could not upload image")
     
-    db_review = Review(image_url=url, sort_order=sort_order)
+    db_review = Review(image_url=uploaded.url, variants=uploaded.variants)
     session.add(db_review)
+    bump_catalog_version(session)
     session.commit()
     session.refresh(db_review)
     return db_review
@@ -40,6 +42,7 @@ def delete_review(review_id: int, session: Session = Depends(get_session)):
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     session.delete(review)
+    bump_catalog_version(session)
     session.commit()
     return {"ok": True}
 
@@ -48,16 +51,20 @@ def reorder_reviews(
     request: ReviewReorderRequest,
     session: Session = Depends(get_session)
 ):
-    reviews = session.exec(
-        select(Review).where(Review.id.in_(request.review_ids))
-    ).all()
-    
-    review_map = {r.id: r for r in reviews}
-    
-    for index, review_id in enumerate(request.review_ids):
-        if review_id in review_map:
-            review_map[review_id].sort_order = index
-            session.add(review_map[review_id])
-            
+    if reorder(session, REVIEWS, request.review_ids):
+        bump_catalog_version(session)
     session.commit()
     return {"message": "Successfully reordered"}
+
+@router.post("/{review_id}/move-after", dependencies=[Depends(get_current_admin)])
+def move_review(
+    review_id: int,
+    request: ReviewMoveRequest,
+    session: Session = Depends(get_session)
+):
+    review = move_after(session, REVIEWS, review_id, request.after_id)
+    if not review:
+        raise HTTPException(status_code=404, detail="Review not found")
+    bump_catalog_version(session)
+    session.commit()
+    return {"id": review.id, "rank": review.rank}
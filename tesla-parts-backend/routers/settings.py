@@ -7,6 +7,9 @@ from typing import List
 from schemas import SocialLinks
 import os
 from dependencies import get_current_admin
+from services.versioning import bump_catalog_version
+from services.site_settings import get_settings, load_settings, settings_changed, reload_settings
+from services.pricing import reprice_products
 
 
 
@@ -15,18 +18,19 @@ router = APIRouter(
     tags=["settings"],
 )
 
+# Settings that stored UAH prices are computed from
+PRICING_SETTINGS = {"exchange_rate", "price_rounding"}
+
 class SettingUpdate(BaseModel):
     value: str
 
 @router.get("/social-links", response_model=SocialLinks)
 def get_social_links(session: Session = Depends(get_session)):
-    instagram_link = session.get(Settings, "instagram_link")
-    telegram_link = session.get(Settings, "telegram_link")
-    viber_link = session.get(Settings, "viber_link")
+    settings = get_settings(session)
     return SocialLinks(
-        instagram=instagram_link.value if instagram_link else "",
-        telegram=telegram_link.value if telegram_link else "",
-        viber=viber_link.value if viber_link else ""
+        instagram=settings.instagram_link,
+        telegram=settings.telegram_link,
+        viber=settings.viber_link
     )
 
 @router.post("/social-links", dependencies=[Depends(get_current_admin)])
@@ -55,7 +59,9 @@ def update_social_links(links: SocialLinks, session: Session = Depends(get_sessi
         viber_link.value = links.viber or ""
         session.add(viber_link)
 
+    settings_changed(session)
     session.commit()
+    reload_settings()
     return {"message": "Social links updated successfully"}
 
 
@@ -83,6 +89,12 @@ def update_setting(key: str, update: SettingUpdate, session: Session = Depends(g
     else:
         setting.value = update.value
         session.add(setting)
+    if key in PRICING_SETTINGS:
+        session.flush()
+        reprice_products(session, settings=load_settings(session))
+        bump_catalog_version(session)
+    settings_changed(session)
     session.commit()
+    reload_settings()
     session.refresh(setting)
     return setting
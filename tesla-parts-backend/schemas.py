@@ -1,6 +1,7 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, computed_field
 from typing import List
 from datetime import datetime
+from services.image_variants import image_sources
 
 class ProductBase(BaseModel):
     id: str
@@ -35,30 +36,54 @@ class Delivery(BaseModel):
 class ProductCreate(ProductBase):
     subcategory_id: int | None = None
 
+class ImageSource(BaseModel):
+    type: str # MIME type, for <source type="...">
+    srcset: str # "url 200w, url 400w, ..."
+
+class ImageSourceSet(BaseModel):
+    url: str # Original upload, for <img src>
+    sources: List[ImageSource] = []
+
+class TileImage(BaseModel):
+    """``image_source`` for the single image of a category or subcategory."""
+    image: str | None = None
+    variants: List[dict] | None = Field(default=None, exclude=True)
+
+    @computed_field
+    @property
+    def image_source(self) -> ImageSourceSet | None:
+        return ImageSourceSet(**image_sources(self.image, self.variants)) if self.image else None
+
 class ProductRead(ProductBase):
+    rank: str | None = None # Display order key, compare as plain strings
     subcategory_id: int | None = None
     subcategory_ids: List[int] = []
     images: List[str] = []
+    image_sources: List[ImageSourceSet] = [] # Same order as images
     created_at: datetime | None = None
 
-class SubcategoryRead(BaseModel):
+class SubcategoryRead(TileImage):
     id: int
     name: str
+    slug: str | None = None
     code: str | None = None
-    image: str | None = None
     category_id: int
     parent_id: int | None = None
     sort_order: int | None = None
+    rank: str | None = None # Display order key, compare as plain strings
     products: List[ProductRead] = []
     subcategories: List["SubcategoryRead"] = []
 
-class CategoryRead(BaseModel):
+class CategoryRead(TileImage):
     id: int
     name: str
-    image: str | None = None
+    slug: str | None = None
     sort_order: int
+    rank: str | None = None # Display order key, compare as plain strings
     meta_title: str | None = None
     meta_description: str | None = None
+    markup_percent: float = 0.0
+    price_rounding: float | None = None
     subcategories: List[SubcategoryRead] = []
 
 class CategoryCreate(BaseModel):
@@ -67,6 +92,8 @@ class CategoryCreate(BaseModel):
     sort_order: int | None = None
     meta_title: str | None = None
     meta_description: str | None = None
+    markup_percent: float | None = None
+    price_rounding: float | None = None
 
 class SubcategoryCreate(BaseModel):
     name: str
@@ -81,6 +108,15 @@ class SubcategoryTransferRequest(BaseModel):
     target_category_id: int
     target_parent_id: int | None = None
 
+class CategoryReorderRequest(BaseModel):
+    category_ids: List[int]
+
+class SubcategoryReorderRequest(BaseModel):
+    subcategory_ids: List[int]
+
+class CategoryMoveRequest(BaseModel):
+    after_id: int | None = None # Show right after this category/sibling, first when None
+
 class OrderCreate(BaseModel):
     items: List[CartItem]
     totalUSD: float | None = None
@@ -122,6 +158,38 @@ class ProductBulkDeleteRequest(BaseModel):
 class ProductReorderRequest(BaseModel):
     product_ids: List[str]
 
+class ProductBatchRequest(BaseModel):
+    product_ids: List[str] = Field(max_length=200) # A cart or an order worth of ids
+
+class ProductSnapshotRead(BaseModel):
+    id: str
+    name: str
+    priceUSD: float | None = None
+    priceUAH: float
+    inStock: bool
+    image: str
+    images: List[str] = []
+
+class ProductMoveRequest(BaseModel):
+    after_id: str | None = None # Show right after this product, first when None
+
+class ProductLabelRead(BaseModel):
+    label: str
+    category_id: int
+    slug: str | None = None
+    product_count: int
+    in_stock_count: int
+
+class FacetCount(BaseModel):
+    product_count: int = 0
+    in_stock_count: int = 0
+
+class ProductFacetsRead(BaseModel):
+    total: FacetCount = FacetCount()
+    popular: FacetCount = FacetCount()
+    categories: dict[int, FacetCount] = {} # By category id
+    subcategories: dict[int, FacetCount] = {} # By subcategory id, including products of descendants
+
 class SocialLinks(BaseModel):
     instagram: str | None = None
     telegram: str | None = None
@@ -142,23 +210,27 @@ class StaticPageSEOUpdate(BaseModel):
 
 # --- Optimized Schemas for Lazy Loading ---
 
-class SubcategoryNoProducts(BaseModel):
+class SubcategoryNoProducts(TileImage):
     id: int
     name: str
+    slug: str | None = None
     code: str | None = None
-    image: str | None = None
     category_id: int
     parent_id: int | None = None
     sort_order: int | None = None
+    rank: str | None = None # Display order key, compare as plain strings
     subcategories: List["SubcategoryNoProducts"] = []
 
-class CategoryListSchema(BaseModel):
+class CategoryListSchema(TileImage):
     id: int
     name: str
-    image: str | None = None
+    slug: str | None = None
     sort_order: int
+    rank: str | None = None # Display order key, compare as plain strings
     meta_title: str | None = None
     meta_description: str | None = None
+    markup_percent: float = 0.0
+    price_rounding: float | None = None
 
 class CategoryDetailSchema(CategoryListSchema):
     subcategories: List[SubcategoryNoProducts] = []
@@ -170,12 +242,22 @@ class ReviewCreate(BaseModel):
 class ReviewRead(BaseModel):
     id: int
     image_url: str
+    variants: List[dict] | None = Field(default=None, exclude=True)
     created_at: datetime
     sort_order: int
+    rank: str | None = None # Display order key, compare as plain strings
+
+    @computed_field
+    @property
+    def image_source(self) -> ImageSourceSet:
+        return ImageSourceSet(**image_sources(self.image_url, self.variants))
 
 class ReviewReorderRequest(BaseModel):
     review_ids: List[int]
 
+class ReviewMoveRequest(BaseModel):
+    after_id: int | None = None # Show right after this review, first when None
+
 class CustomerRegisterRequest(BaseModel):
     email: str
 
@@ -0,0 +1,467 @@
+"""
+Bulk product import and export in CSV and XLSX.
+
+Both directions work in fixed-size batches so memory stays flat whatever the
+file size: export pages through products by id, import reads the upload row
+by row and upserts every ``IMPORT_BATCH_SIZE`` rows with executemany,
+committing and reporting progress after each batch.
+
+Import rows are matched on ``id`` first, then on the normalized
+``detail_number``; anything unmatched is created. Blank cells keep the
+current value of an existing product.
+"""
+import csv
+import io
+import os
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlmodel import Session
+
+from models import Category, Product, Subcategory, get_kyiv_time
+from services.part_numbers import (
+    normalize_part_number,
+    product_ids_by_detail_number,
+    replace_part_numbers,
+)
+from services.ordering import PRODUCTS, rebalance
+from services.pricing import reprice_products
+from services.ranks import MAX_RANK_LENGTH, rank_sequence, sequence_prefix
+from services.site_settings import get_settings
+from services.product_categories import (
+    join_categories,
+    replace_product_categories,
+    split_categories,
+)
+from services.versioning import bump_catalog_version
+
+CSV = "csv"
+XLSX = "xlsx"
+FORMATS = (CSV, XLSX)
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_BATCH_SIZE = 1000
+
+PLACEHOLDER_IMAGE_URL = "https://via.placeholder.com/300"
+
+COLUMNS = [
+    "id",
+    "name",
+    "category",
+    "subcategory_id",
+    "detail_number",
+    "cross_number",
+    "priceUSD",
+    "priceUAH",
+    "inStock",
+    "is_popular",
+    "sort_order",
+    "image",
+    "description",
+    "meta_title",
+    "meta_description",
+]
+
+_TEXT_COLUMNS = {
+    "id",
+    "name",
+    "category",
+    "detail_number",
+    "cross_number",
+    "image",
+    "description",
+    "meta_title",
+    "meta_description",
+}
+_FLOAT_COLUMNS = {"priceUSD", "priceUAH"}
+_INT_COLUMNS = {"subcategory_id", "sort_order"}
+_BOOL_COLUMNS = {"inStock", "is_popular"}
+
+# Digits appended to the last rank for each imported product
+_RANK_COUNTER_WIDTH = 5
+
+_TRUE_VALUES = {"1", "true", "yes", "y", "+", "так"}
+_FALSE_VALUES = {"0", "false", "no", "n", "-", "ні"}
+
+_table = Product.__table__
+_UPDATE_COLUMNS = [name for name in COLUMNS if name != "id"]
+
+
+class CatalogFormatError(ValueError):
+    """The uploaded file cannot be read as a product sheet."""
+
+
+class RowError(ValueError):
+    pass
+
+
+def detect_format(filename: Optional[str], requested: Optional[str] = None) -> str:
+    fmt = (requested or os.path.splitext(filename or "")[1].lstrip(".") or CSV).lower()
+    if fmt not in FORMATS:
+        raise CatalogFormatError(f"Unsupported format '{fmt}', expected one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def _require_openpyxl():
+    try:
+        import openpyxl
+    except ImportError as exc:
+        raise CatalogFormatError("XLSX support requires the 'openpyxl' package") from exc
+    return openpyxl
+
+
+# --- Export -----------------------------------------------------------------
+
+def iter_export_rows(session: Session, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[tuple]:
+    """Yield product rows in ``COLUMNS`` order, paging by id so no cursor stays open."""
+    columns = [_table.c[name] for name in COLUMNS]
+    last_id = None
+    while True:
+        stmt = select(*columns).order_by(_table.c.id).limit(batch_size)
+        if last_id is not None:
+            stmt = stmt.where(_table.c.id > last_id)
+        rows = session.connection().execute(stmt).all()
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def iter_csv_export(session: Session) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM so Excel opens Cyrillic text as UTF-8
+    buffer.write("\ufeff")
+    writer.writerow(COLUMNS)
+    for index, row in enumerate(iter_export_rows(session), 1):
+        writer.writerow(row)
+        if index % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def write_xlsx_export(session: Session, fileobj: BinaryIO):
+    openpyxl = _require_openpyxl()
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("products")
+    sheet.append(COLUMNS)
+    for row in iter_export_rows(session):
+        sheet.append(list(row))
+    workbook.save(fileobj)
+
+
+# --- Reading uploads --------------------------------------------------------
+
+def _header_index(header: Iterable[Any]) -> Dict[str, int]:
+    known = {name.lower(): name for name in COLUMNS}
+    index: Dict[str, int] = {}
+    for position, title in enumerate(header):
+        name = known.get(str(title or "").strip().lower())
+        if name and name not in index:
+            index[name] = position
+    if "id" not in index and "detail_number" not in index:
+        raise CatalogFormatError("The header must contain an 'id' or 'detail_number' column")
+    return index
+
+
+def _row_values(index: Dict[str, int], row) -> Dict[str, Any]:
+    values = {}
+    for name, position in index.items():
+        value = row[position] if position < len(row) else None
+        if isinstance(value, str):
+            value = value.strip()
+        if value is not None and value != "":
+            values[name] = value
+    return values
+
+
+def _iter_values(index: Dict[str, int], rows) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    for row_number, row in enumerate(rows, 2):
+        values = _row_values(index, row)
+        if values:
+            yield row_number, values
+
+
+def _read_csv(fileobj: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    header_line = text.readline()
+    # Spreadsheets saved with a Ukrainian locale use ';'
+    delimiter = max(",;\t", key=header_line.count)
+    index = _header_index(next(csv.reader([header_line], delimiter=delimiter), []))
+    return _iter_values(index, csv.reader(text, delimiter=delimiter))
+
+
+def _read_xlsx(fileobj: BinaryIO) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    openpyxl = _require_openpyxl()
+    workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    index = _header_index(next(rows, ()))
+    return _iter_values(index, rows)
+
+
+def read_rows(fileobj: BinaryIO, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Validate the header and return an iterator of ``(row_number, values)`` for
+    non-empty rows; row numbers match the spreadsheet.
+    """
+    if fmt == XLSX:
+        return _read_xlsx(fileobj)
+    return _read_csv(fileobj)
+
+
+# --- Import -----------------------------------------------------------------
+
+def _parse_text(value: Any) -> str:
+    if isinstance(value, float) and value.is_integer():
+        # Spreadsheets turn part numbers like 1084168 into floats
+        return str(int(value))
+    return str(value).strip()
+
+
+def _parse_float(name: str, value: Any) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    try:
+        return float(str(value).replace(" ", "").replace(",", "."))
+    except ValueError:
+        raise RowError(f"{name}: '{value}' is not a number")
+
+
+def _parse_int(name: str, value: Any) -> int:
+    number = _parse_float(name, value)
+    if not number.is_integer():
+        raise RowError(f"{name}: '{value}' is not a whole number")
+    return int(number)
+
+
+def _parse_bool(name: str, value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)) and value in (0, 1):
+        return bool(value)
+    text = str(value).strip().lower()
+    if text in _TRUE_VALUES:
+        return True
+    if text in _FALSE_VALUES:
+        return False
+    raise RowError(f"{name}: '{value}' is not a yes/no value")
+
+
+def _parse_row(values: Dict[str, Any]) -> Dict[str, Any]:
+    parsed = {}
+    for name, value in values.items():
+        if name in _TEXT_COLUMNS:
+            parsed[name] = _parse_text(value)
+        elif name in _FLOAT_COLUMNS:
+            parsed[name] = _parse_float(name, value)
+        elif name in _INT_COLUMNS:
+            parsed[name] = _parse_int(name, value)
+        elif name in _BOOL_COLUMNS:
+            parsed[name] = _parse_bool(name, value)
+    return parsed
+
+
+class ProductImporter:
+    """Upserts parsed rows batch by batch; one instance per import."""
+
+    def __init__(self, session: Session):
+        self.session = session
+        self.settings = get_settings(session)
+        self.category_ids: Dict[str, int] = {}
+        for name, category_id in session.exec(select(Category.name, Category.id).order_by(Category.id)).all():
+            self.category_ids.setdefault(name, category_id)
+        self.subcategory_categories: Dict[int, int] = dict(
+            session.exec(select(Subcategory.id, Subcategory.category_id)).all()
+        )
+        # New products go last, in file order, keyed by the current last rank plus a counter
+        last_rank = session.scalar(select(func.max(Product.rank)))
+        if len(sequence_prefix(last_rank)) > MAX_RANK_LENGTH - _RANK_COUNTER_WIDTH:
+            rebalance(session, PRODUCTS)
+            session.commit()
+            last_rank = session.scalar(select(func.max(Product.rank)))
+        self.new_ranks = rank_sequence(last_rank, _RANK_COUNTER_WIDTH)
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _resolve_targets(self, parsed: List[Tuple[int, Dict[str, Any]]]) -> List[Tuple[int, Dict[str, Any], str]]:
+        connection = self.session.connection()
+        ids = [values["id"] for _, values in parsed if values.get("id")]
+        existing_ids = set()
+        if ids:
+            existing_ids = set(connection.execute(select(_table.c.id).where(_table.c.id.in_(ids))).scalars())
+        detail_matches = product_ids_by_detail_number(
+            self.session,
+            (normalize_part_number(values.get("detail_number")) for _, values in parsed),
+        )
+        new_by_detail: Dict[str, str] = {}
+        targets = []
+        for row_number, values in parsed:
+            product_id = values.get("id")
+            detail = normalize_part_number(values.get("detail_number"))
+            if product_id and product_id in existing_ids:
+                target = product_id
+            elif detail and detail in detail_matches:
+                target = detail_matches[detail]
+            elif detail and detail in new_by_detail:
+                target = new_by_detail[detail]
+            else:
+                target = product_id or f"prod-{os.urandom(4).hex()}"
+                if detail:
+                    new_by_detail[detail] = target
+            targets.append((row_number, values, target))
+        return targets
+
+    def _new_record(self, product_id: str) -> Dict[str, Any]:
+        return {
+            "id": product_id,
+            "name": None,
+            "category": "",
+            "subcategory_id": None,
+            "detail_number": None,
+            "cross_number": None,
+            "priceUSD": 0.0,
+            "priceUAH": None,
+            "inStock": True,
+            "is_popular": False,
+            "sort_order": 0,
+            "image": PLACEHOLDER_IMAGE_URL,
+            "description": "",
+            "meta_title": None,
+            "meta_description": None,
+        }
+
+    def _apply(self, record: Dict[str, Any], values: Dict[str, Any]) -> Optional[List[int]]:
+        """Merge a row into ``record``; returns the new category ids when the row sets them."""
+        category_ids = None
+        if "category" in values:
+            names = split_categories(values["category"])
+            unknown = [name for name in names if name not in self.category_ids]
+            if unknown:
+                raise RowError(f"category: unknown category {', '.join(unknown)}")
+            category_ids = list(dict.fromkeys(self.category_ids[name] for name in names))
+        if "subcategory_id" in values and values["subcategory_id"] not in self.subcategory_categories:
+            raise RowError(f"subcategory_id: subcategory {values['subcategory_id']} does not exist")
+
+        merged = dict(record)
+        merged.update((name, value) for name, value in values.items() if name != "id")
+        if category_ids is not None:
+            merged["category"] = join_categories(names)
+        subcategory_id = merged.get("subcategory_id")
+        if subcategory_id and ("subcategory_id" in values or category_ids is not None):
+            names = split_categories(merged["category"])
+            if self.subcategory_categories.get(subcategory_id) not in {
+                self.category_ids.get(name) for name in names
+            }:
+                raise RowError(
+                    f"subcategory_id: subcategory {subcategory_id} is not in category {', '.join(names) or '(none)'}"
+                )
+        if not merged.get("name"):
+            raise RowError("name: required for new products")
+        if not merged.get("priceUSD") and merged.get("priceUAH") is None:
+            raise RowError("priceUSD: required for new products")
+        if merged.get("priceUAH") is None:
+            # Filled in by reprice_products once the row is written
+            merged["priceUAH"] = 0.0
+        record.update(merged)
+        return category_ids
+
+    def run_batch(self, batch: List[Tuple[int, Dict[str, Any]]]) -> Dict[str, Any]:
+        errors = []
+        parsed = []
+        for row_number, values in batch:
+            try:
+                parsed.append((row_number, _parse_row(values)))
+            except RowError as exc:
+                errors.append({"row": row_number, "error": str(exc)})
+
+        targets = self._resolve_targets(parsed)
+        connection = self.session.connection()
+        existing_ids = list({target for _, _, target in targets})
+        existing = {
+            row.id: dict(row._mapping)
+            for row in connection.execute(
+                select(*[_table.c[name] for name in COLUMNS]).where(_table.c.id.in_(existing_ids))
+            )
+        }
+
+        records: Dict[str, Dict[str, Any]] = {}
+        category_updates: Dict[str, List[int]] = {}
+        for row_number, values, target in targets:
+            record = records.get(target)
+            if record is None:
+                record = dict(existing[target]) if target in existing else self._new_record(target)
+            try:
+                category_ids = self._apply(record, values)
+            except RowError as exc:
+                errors.append({"row": row_number, "error": str(exc)})
+                continue
+            records[target] = record
+            if category_ids is not None:
+                category_updates[target] = category_ids
+
+        inserts = []
+        updates = []
+        for product_id, record in records.items():
+            if product_id in existing:
+                updates.append({"b_id": product_id, **{f"b_{name}": record[name] for name in _UPDATE_COLUMNS}})
+            else:
+                inserts.append({**record, "rank": next(self.new_ranks), "created_at": get_kyiv_time()})
+
+        if inserts:
+            connection.execute(insert(_table), inserts)
+        if updates:
+            connection.execute(
+                update(_table)
+                .where(_table.c.id == bindparam("b_id"))
+                .values({name: bindparam(f"b_{name}") for name in _UPDATE_COLUMNS}),
+                updates,
+            )
+        replace_product_categories(self.session, category_updates)
+        replace_part_numbers(
+            self.session,
+            ((product_id, record["detail_number"], record["cross_number"]) for product_id, record in records.items()),
+        )
+        reprice_products(self.session, records, self.settings)
+        if records:
+            bump_catalog_version(self.session)
+        self.session.commit()
+
+        self.batches += 1
+        self.rows += len(batch)
+        self.created += len(inserts)
+        self.updated += len(updates)
+        self.failed += len(errors)
+        errors.sort(key=lambda error: error["row"])
+        return {**self.summary(), "errors": errors}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "batch": self.batches,
+            "rows": self.rows,
+            "created": self.created,
+            "updated": self.updated,
+            "failed": self.failed,
+        }
+
+
+def import_products(
+    session: Session,
+    rows: Iterable[Tuple[int, Dict[str, Any]]],
+    batch_size: int = IMPORT_BATCH_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """Upsert rows in batches, yielding a progress report after each committed batch and a final summary."""
+    importer = ProductImporter(session)
+    batch: List[Tuple[int, Dict[str, Any]]] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield importer.run_batch(batch)
+            batch = []
+    if batch:
+        yield importer.run_batch(batch)
+    yield {**importer.summary(), "done": True}
@@ -0,0 +1,169 @@
+"""
+Subcategory trees assembled in memory.
+
+``SubcategoryTree`` indexes a set of subcategories by parent once, with
+siblings already in display order, so walking or serializing a tree is linear
+in its size: no per-node scans of the whole list and no per-level sorting. It
+is iterative, so deep trees do not hit the recursion limit, and a node is
+visited once even if bad data forms a parent cycle.
+
+``subcategory_trees`` adds products for the category responses with a fixed
+number of statements however large the tree is: the subcategories, the direct
+and linked product ids of the nodes needed, and the products themselves with
+their images and links.
+"""
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy.orm import selectinload
+from sqlmodel import Session, col, select
+
+from models import Product, ProductSubcategoryLink, Subcategory
+from services.product_serializer import product_payload
+
+# Ids per IN (...) list, keeps SQLite under its bound parameter limit
+_CHUNK_SIZE = 500
+
+
+def _display_key(subcategory: Subcategory):
+    # Same order as services.ordering.SUBCATEGORIES
+    return (subcategory.rank is None, subcategory.rank or "", subcategory.id or 0)
+
+
+class SubcategoryTree:
+    def __init__(self, subcategories: Iterable[Subcategory]):
+        self.nodes: Dict[int, Subcategory] = {}
+        for subcategory in sorted(subcategories, key=_display_key):
+            self.nodes[subcategory.id] = subcategory
+        self._children: Dict[int, List[Subcategory]] = defaultdict(list)
+        self._roots: Dict[int, List[Subcategory]] = defaultdict(list)
+        for subcategory in self.nodes.values():
+            if subcategory.parent_id in self.nodes:
+                self._children[subcategory.parent_id].append(subcategory)
+            else:
+                # Top level, or a parent outside the loaded set
+                self._roots[subcategory.category_id].append(subcategory)
+
+    @classmethod
+    def load(cls, session: Session, category_id: Optional[int] = None) -> "SubcategoryTree":
+        """The subcategories of one category, or of all categories, in one query."""
+        stmt = select(Subcategory)
+        if category_id is not None:
+            stmt = stmt.where(Subcategory.category_id == category_id)
+        return cls(session.exec(stmt).all())
+
+    def roots(self, category_id: int) -> List[Subcategory]:
+        return self._roots.get(category_id, [])
+
+    def children(self, subcategory_id: int) -> List[Subcategory]:
+        return self._children.get(subcategory_id, [])
+
+    def walk(self, roots: Optional[Iterable[Subcategory]] = None) -> Iterator[Subcategory]:
+        """
+        Parents before children, siblings in display order. Without ``roots``
+        every node is yielded: all categories' trees, then anything left
+        unreachable by a parent cycle.
+        """
+        seen = set()
+        stack = list(roots if roots is not None else self._all_roots())[::-1]
+        while stack:
+            node = stack.pop()
+            if node.id in seen:
+                continue
+            seen.add(node.id)
+            yield node
+            stack.extend(reversed(self.children(node.id)))
+        if roots is None:
+            for node in self.nodes.values():
+                if node.id not in seen:
+                    yield node
+
+    def _all_roots(self) -> List[Subcategory]:
+        return [node for category_id in sorted(self._roots) for node in self._roots[category_id]]
+
+    def subtree_ids(self, subcategory_id: int) -> List[int]:
+        """``subcategory_id`` followed by all of its descendants."""
+        node = self.nodes.get(subcategory_id)
+        return [sub.id for sub in self.walk([node])] if node is not None else []
+
+    def to_dicts(self, roots: Iterable[Subcategory], payload: Callable[[Subcategory], dict]) -> List[dict]:
+        """Nested dicts, ``payload(node)`` with a ``subcategories`` list of the children's dicts."""
+        result: List[dict] = []
+        seen = set()
+        stack = [(node, result) for node in reversed(list(roots))]
+        while stack:
+            node, siblings = stack.pop()
+            if node.id in seen:
+                continue
+            seen.add(node.id)
+            data = payload(node)
+            data["subcategories"] = []
+            siblings.append(data)
+            stack.extend((child, data["subcategories"]) for child in reversed(self.children(node.id)))
+        return result
+
+
+def _products_by_subcategory(session: Session, subcategory_ids: List[int]) -> Dict[int, List[Product]]:
+    """Direct and linked products of each subcategory, in listing order, each product once per node."""
+    members: Dict[str, List[int]] = defaultdict(list)
+    for start in range(0, len(subcategory_ids), _CHUNK_SIZE):
+        chunk = subcategory_ids[start:start + _CHUNK_SIZE]
+        rows = session.exec(
+            select(Product.id, Product.subcategory_id).where(col(Product.subcategory_id).in_(chunk))
+        ).all()
+        rows += session.exec(
+            select(ProductSubcategoryLink.product_id, ProductSubcategoryLink.subcategory_id)
+            .where(col(ProductSubcategoryLink.subcategory_id).in_(chunk))
+        ).all()
+        for product_id, subcategory_id in rows:
+            if subcategory_id not in members[product_id]:
+                members[product_id].append(subcategory_id)
+
+    product_ids = list(members)
+    products: List[Product] = []
+    for start in range(0, len(product_ids), _CHUNK_SIZE):
+        products += session.exec(
+            select(Product)
+            .where(col(Product.id).in_(product_ids[start:start + _CHUNK_SIZE]))
+            .options(selectinload(Product.images), selectinload(Product.linked_subcategories))
+        ).all()
+    products.sort(key=_listing_key)
+
+    by_subcategory: Dict[int, List[Product]] = defaultdict(list)
+    for product in products:
+        for subcategory_id in members[product.id]:
+            by_subcategory[subcategory_id].append(product)
+    return by_subcategory
+
+
+def _listing_key(product: Product):
+    # Same order as services.ordering.PRODUCTS, for products merged from several chunks
+    return (product.rank is None, product.rank or "", not product.inStock, product.name, product.id)
+
+
+def subcategory_trees(
+    session: Session, category_id: int, rate: float, root_id: Optional[int] = None
+) -> List[dict]:
+    """
+    ``SubcategoryRead``-shaped dicts for the top-level subcategories of
+    ``category_id``, or for the single subtree rooted at ``root_id``.
+    """
+    tree = SubcategoryTree.load(session, category_id)
+    if root_id is None:
+        roots = tree.roots(category_id)
+    else:
+        roots = [tree.nodes[root_id]] if root_id in tree.nodes else []
+
+    products = _products_by_subcategory(session, [node.id for node in tree.walk(roots)])
+    payloads: Dict[str, dict] = {}
+
+    def payload(node: Subcategory) -> dict:
+        data = node.model_dump()
+        data["products"] = []
+        for product in products.get(node.id, []):
+            if product.id not in payloads:
+                payloads[product.id] = product_payload(product, rate)
+            data["products"].append(payloads[product.id])
+        return data
+
+    return tree.to_dicts(roots, payload)
@@ -3,9 +3,9 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 from dotenv import load_dotenv
-from sqlmodel import Session, select
+from sqlmodel import Session
 from database import engine
-from models import Settings
+from services.site_settings import get_settings
 
 load_dotenv()
 
@@ -35,9 +35,9 @@ def get_email_header():
 def get_email_footer():
     try:
         with Session(engine) as session:
-            setting = session.exec(select(Settings).where(Settings.key == "email_footer")).first()
-            if setting and setting.value:
-                return f'<div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; color: #666; font-size: 14px;">{setting.value}</div>'
+            footer = get_settings(session).email_footer
+            if footer:
+                return f'<div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #eee; color: #666; font-size: 14px;">{footer}</div>'
     except Exception as e:
         print(f"Failed to fetch footer: {e}")
     return ""
@@ -0,0 +1,154 @@
+"""
+Content-addressed image storage.
+
+Uploads are named after the SHA-256 of their bytes
+(``static/images/sha256/ab/<digest>.jpg``, or public id ``<digest>`` on
+Cloudinary), so identical files are stored, resized and cached once and a URL
+never changes content. That lets the gateway serve them with
+``Cache-Control: immutable``.
+
+``ImageBlob`` keeps a reference count per content-addressed URL. It follows
+inserts and deletes of ``ProductImage`` and ``Review`` rows, and inserts,
+image changes and deletes of ``Category`` and ``Subcategory`` rows, through
+mapper events, so routers (and ``copy_product``) need no extra calls;
+set-based statements that bypass the ORM call ``retain``/``release``
+themselves. A count reaching zero stamps ``released_at``. Unreferenced files
+are removed later by ``prune_images.py``, once a grace period has passed since
+then; it also checks the plain image columns (``Product.image``,
+``OrderItem.product_image``, and tile images saved before they were counted)
+before deleting anything.
+"""
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import case, event, inspect, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import Category, ImageBlob, OrderItem, Product, ProductImage, Review, Subcategory, get_kyiv_time
+
+CONTENT_DIR = Path("static") / "images" / "sha256"
+
+# Every column holding an image URL, tracked by ImageBlob or not. Order items
+# keep the product's picture after the product is deleted.
+URL_COLUMNS = [
+    Product.image, ProductImage.url, Review.image_url, Category.image, Subcategory.image,
+    OrderItem.product_image,
+]
+
+# URLs per IN (...) list, keeps SQLite under its bound parameter limit
+_CHUNK_SIZE = 500
+
+_DIGEST = re.compile(r"(?<![0-9a-f])([0-9a-f]{64})(?![0-9a-f])")
+
+
+def content_path(digest: str, extension: str) -> Path:
+    """``static/images/sha256/ab/<digest><ext>``; two-character fan-out keeps directories small."""
+    return CONTENT_DIR / digest[:2] / f"{digest}{extension}"
+
+
+def url_digest(url: Optional[str]) -> Optional[str]:
+    """SHA-256 embedded in a content-addressed URL, None for legacy uuid names and external links."""
+    if not url:
+        return None
+    if "/static/images/sha256/" not in url and "res.cloudinary.com" not in url:
+        return None
+    match = _DIGEST.search(url.rsplit("/", 1)[-1])
+    return match.group(1) if match else None
+
+
+def retain(connection, urls: Iterable[str]):
+    """Add one reference per occurrence of each content-addressed URL."""
+    for url in urls:
+        digest = url_digest(url)
+        if not digest:
+            continue
+        insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+        statement = insert(ImageBlob.__table__).values(url=url, sha256=digest, ref_count=1)
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=["url"],
+            set_={"ref_count": ImageBlob.__table__.c.ref_count + 1},
+        ))
+
+
+def release(connection, urls: Iterable[str]):
+    """Drop one reference per occurrence of each URL, one UPDATE per chunk of equal counts."""
+    table = ImageBlob.__table__
+    released_at = get_kyiv_time()
+    by_count = {}
+    for url, count in Counter(url for url in urls if url_digest(url)).items():
+        by_count.setdefault(count, []).append(url)
+    for count, group in by_count.items():
+        for start in range(0, len(group), _CHUNK_SIZE):
+            connection.execute(
+                update(table)
+                .where(table.c.url.in_(group[start:start + _CHUNK_SIZE]), table.c.ref_count > 0)
+                .values(
+                    ref_count=case((table.c.ref_count > count, table.c.ref_count - count), else_=0),
+                    released_at=case((table.c.ref_count > count, table.c.released_at), else_=released_at),
+                )
+            )
+
+
+def referenced_urls(connection, urls: Iterable[str]) -> Set[str]:
+    """The subset of ``urls`` still stored in any image column."""
+    urls = list(dict.fromkeys(url for url in urls if url))
+    found: Set[str] = set()
+    for column in URL_COLUMNS:
+        for start in range(0, len(urls), _CHUNK_SIZE):
+            chunk = [url for url in urls[start:start + _CHUNK_SIZE] if url not in found]
+            if chunk:
+                found.update(connection.execute(
+                    select(column).where(column.in_(chunk)).distinct()
+                ).scalars())
+    return found
+
+
+def unreferenced_urls(connection, urls: Iterable[str]) -> List[str]:
+    """``urls`` (deduplicated, in order) that no row refers to any more."""
+    urls = list(dict.fromkeys(url for url in urls if url))
+    referenced = referenced_urls(connection, urls)
+    return [url for url in urls if url not in referenced]
+
+
+@event.listens_for(ProductImage, "after_insert")
+def _product_image_inserted(mapper, connection, target):
+    retain(connection, [target.url])
+
+
+@event.listens_for(ProductImage, "after_delete")
+def _product_image_deleted(mapper, connection, target):
+    release(connection, [target.url])
+
+
+@event.listens_for(Review, "after_insert")
+def _review_inserted(mapper, connection, target):
+    retain(connection, [target.image_url])
+
+
+@event.listens_for(Review, "after_delete")
+def _review_deleted(mapper, connection, target):
+    release(connection, [target.image_url])
+
+
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Subcategory, "after_insert")
+def _tile_inserted(mapper, connection, target):
+    retain(connection, [target.image])
+
+
+@event.listens_for(Category, "after_update")
+@event.listens_for(Subcategory, "after_update")
+def _tile_updated(mapper, connection, target):
+    history = inspect(target).attrs.image.history
+    if history.has_changes():
+        release(connection, [url for url in history.deleted if url])
+        retain(connection, [url for url in history.added if url])
+
+
+@event.listens_for(Category, "after_delete")
+@event.listens_for(Subcategory, "after_delete")
+def _tile_deleted(mapper, connection, target):
+    release(connection, [target.image])
@@ -1,8 +1,63 @@
+import asyncio
+import hashlib
 import os
+import re
+import tempfile
 import uuid
 from pathlib import Path
 from fastapi import UploadFile
-from typing import Optional
+from typing import Any, Dict, List, NamedTuple, Optional
+from services.image_store import CONTENT_DIR, content_path
+from services.image_variants import EXTENSIONS, cloudinary_variants, is_cloudinary_url, render_variants, variant
+
+# Uploads in flight at once per worker, across all requests
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+
+# Per-file limit; nginx caps the whole request body at 20M
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "20")) * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Cloudinary's upload_large needs chunks of at least 5 MB
+CLOUDINARY_CHUNK_SIZE = 6 * 1024 * 1024
+
+LOCAL_PREFIX = "static/images/"
+
+_VARIANT_NAME = re.compile(r"-(\d+)w\.(webp|jpg)$")
+_VARIANT_FORMATS = {ext: fmt for fmt, ext in EXTENSIONS.items()}
+
+
+class StoredImage(NamedTuple):
+    url: str
+    variants: List[Dict[str, Any]]
+
+class ReceivedFile(NamedTuple):
+    path: Path
+    digest: str
+    extension: str
+
+class UploadRejected(Exception):
+    """An upload over the size limit or not a supported image; main.py answers 413/415."""
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+def sniff_extension(head: bytes) -> Optional[str]:
+    """File extension for the image type given by the leading bytes, None if unsupported."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return ".jpg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return ".png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return ".gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"avif", b"avis"):
+            return ".avif"
+        if brand in (b"heic", b"heix", b"heim", b"heis", b"mif1", b"msf1"):
+            return ".heic"
+    return None
 
 class ImageUploader:
     def __init__(self):
@@ -10,6 +65,8 @@ class ImageUploader:
         self.cloudinary_cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME")
         self.cloudinary_api_key = os.getenv("CLOUDINARY_API_KEY")
         self.cloudinary_api_secret = os.getenv("CLOUDINARY_API_SECRET")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop = None
         
         # Check if Cloudinary is configured
         self.use_cloudinary = all([
@@ -30,6 +87,14 @@ class ImageUploader:
             except ImportError:
                 self.use_cloudinary = False
     
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # A semaphore belongs to one event loop; recreate it if the loop changed
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+            self._semaphore_loop = loop
+        return self._semaphore
+    
     async def upload_image(self, file: UploadFile, folder: str = "tesla-parts") -> Optional[str]:
         """
         Upload an image file and return its URL.
@@ -41,55 +106,217 @@ class ImageUploader:
         Returns:
             URL string of the uploaded image, or None if upload fails
         """
+        stored = await self._upload(file, folder, with_variants=False)
+        return stored.url if stored else None
+
+    async def upload_image_with_variants(self, file: UploadFile, folder: str = "tesla-parts") -> Optional[StoredImage]:
+        """Upload an image together with its resized WebP/JPEG variants."""
+        return await self._upload(file, folder, with_variants=True)
+
+    async def upload_images(self, files: Optional[List[UploadFile]], folder: str = "tesla-parts") -> List[StoredImage]:
+        """
+        Upload several files with variants concurrently (at most
+        UPLOAD_CONCURRENCY at a time) and return the successful ones in the
+        original order.
+
+        When one file is rejected the others are cancelled and whatever they
+        already stored (new files only, content shared with existing images is
+        kept) is deleted before the error propagates, so a failed request
+        leaves nothing behind.
+        """
+        files = [file for file in files or [] if file.filename]
+        created: List[Any] = []
+        tasks = [asyncio.ensure_future(self._upload(file, folder, True, created)) for file in files]
+        try:
+            stored = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await self._discard(created)
+            raise
+        return [image for image in stored if image]
+
+    async def _upload(
+        self, file: UploadFile, folder: str, with_variants: bool, created: Optional[List[Any]] = None
+    ) -> Optional[StoredImage]:
         if not file.filename:
             return None
         
         try:
-            if self.use_cloudinary:
-                return await self._upload_to_cloudinary(file, folder)
-            else:
-                return await self._upload_to_local(file, folder)
+            async with self._get_semaphore():
+                if self.use_cloudinary:
+                    return await self._upload_to_cloudinary(file, folder, with_variants, created)
+                else:
+                    return await self._upload_to_local(file, folder, with_variants, created)
+        except UploadRejected:
+            raise
         except Exception as e:
             print(f"Error uploading image: {e}")
             return None
+
+    async def _discard(self, created: List[Any]):
+        """Delete what an abandoned upload stored: local paths and Cloudinary public ids."""
+        for item in created:
+            try:
+                if isinstance(item, Path):
+                    item.unlink(missing_ok=True)
+                else:
+                    import cloudinary.uploader
+                    await asyncio.to_thread(cloudinary.uploader.destroy, item)
+            except Exception as e:
+                print(f"Error discarding image {item}: {e}")
     
-    async def _upload_to_cloudinary(self, file: UploadFile, folder: str) -> str:
+    async def _receive(self, file: UploadFile, directory: Optional[Path] = None) -> ReceivedFile:
+        """
+        Copy an upload to a temp file chunk by chunk, hashing it and checking
+        its type and size on the way, so memory use does not depend on the
+        file size. The caller owns (moves or deletes) the returned path.
+        """
+        if directory is not None:
+            directory.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix=".upload-", suffix=".tmp", dir=directory)
+        tmp_path = Path(name)
+        digest = hashlib.sha256()
+        extension = None
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                    if extension is None:
+                        extension = sniff_extension(chunk[:16])
+                        if extension is None:
+                            raise UploadRejected(415, f"{file.filename}: unsupported image type")
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise UploadRejected(413, f"{file.filename}: larger than {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+                    await asyncio.to_thread(_write_chunk, out, digest, chunk)
+            if extension is None:
+                raise UploadRejected(415, f"{file.filename}: empty file")
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        return ReceivedFile(tmp_path, digest.hexdigest(), extension)
+
+    async def _upload_to_cloudinary(
+        self, file: UploadFile, folder: str, with_variants: bool = False, created: Optional[List[Any]] = None
+    ) -> StoredImage:
         """Upload image to Cloudinary."""
         import cloudinary.uploader
         
-        # Read file content
-        contents = await file.read()
-        
-        # Upload to Cloudinary
-        result = cloudinary.uploader.upload(
-            contents,
-            folder=folder,
-            public_id=file.filename.rsplit('.', 1)[0] if '.' in file.filename else file.filename
-        )
+        received = await self._receive(file)
+        try:
+            # The SDK call is blocking, keep it off the event loop. It sends the
+            # file in chunks; named after the content hash, so re-uploading the
+            # same bytes keeps the existing asset.
+            result = await asyncio.to_thread(
+                cloudinary.uploader.upload_large,
+                str(received.path),
+                folder=folder,
+                public_id=received.digest,
+                overwrite=False,
+                unique_filename=False,
+                chunk_size=CLOUDINARY_CHUNK_SIZE
+            )
+        finally:
+            received.path.unlink(missing_ok=True)
+        if created is not None and not result.get("existing"):
+            created.append(result["public_id"])
         
-        return result.get("secure_url") or result.get("url")
+        url = result.get("secure_url") or result.get("url")
+        # Cloudinary renders resized formats on demand from transformation URLs
+        return StoredImage(url, cloudinary_variants(url) if with_variants else [])
     
-    async def _upload_to_local(self, file: UploadFile, folder: str) -> str:
-        """Upload image to local storage."""
-        # Create directory structure
-        upload_dir = Path("static") / "images" / folder
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Generate unique filename
-        file_ext = Path(file.filename).suffix if file.filename else ".jpg"
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        file_path = upload_dir / unique_filename
-        
-        # Save file
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+    async def _upload_to_local(
+        self, file: UploadFile, folder: str, with_variants: bool = False, created: Optional[List[Any]] = None
+    ) -> StoredImage:
+        """
+        Upload image to local storage under its content hash
+        (``static/images/sha256/ab/<digest>.jpg``). Identical bytes map to the
+        same file and variants, which are only written once.
+        """
+        # Received next to its destination so the final move is an atomic rename
+        received = await self._receive(file, CONTENT_DIR)
+        file_path = content_path(received.digest, received.extension)
+        try:
+            # Already stored: mark it fresh, prune_images.py leaves recently touched files alone
+            os.utime(file_path)
+            received.path.unlink()
+        except FileNotFoundError:
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(received.path, file_path)
+            if created is not None:
+                created.append(file_path)
         
-        # Return URL
+        variants = []
+        if with_variants:
+            variants = self.existing_local_variants(file_path) or await self.store_local_variants(file_path, created)
+        return StoredImage(self._local_url(file_path), variants)
+
+    def _local_url(self, file_path: Path) -> str:
         # Remove leading slash from base_url if present, and ensure folder path is correct
         base_url = self.base_url.rstrip("/")
-        file_location = f"static/images/{folder}/{unique_filename}"
-        return f"{base_url}/{file_location}"
+        return f"{base_url}/{file_path.as_posix()}"
+
+    def local_path(self, url: Optional[str]) -> Optional[Path]:
+        """Path on disk of a locally stored image URL, None for remote images."""
+        if not url or f"/{LOCAL_PREFIX}" not in url:
+            return None
+        return Path(LOCAL_PREFIX + url.split(f"/{LOCAL_PREFIX}", 1)[1])
+
+    async def store_local_variants(self, file_path: Path, created: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """Render variants of a local image next to it (``<name>-400w.webp``...)."""
+        rendered = await asyncio.to_thread(render_variants, file_path)
+        variants = []
+        for width, fmt, data in rendered:
+            variant_path = file_path.with_name(f"{file_path.stem}-{width}w{EXTENSIONS[fmt]}")
+            if not variant_path.exists():
+                await _write_file(variant_path, data)
+                if created is not None:
+                    created.append(variant_path)
+            variants.append(variant(width, fmt, self._local_url(variant_path)))
+        return variants
+
+    def known_variants(self, url: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Variants available for an image URL without rendering anything:
+        Cloudinary transformations, or local ones an upload already stored.
+        None when unknown, so backfill_image_variants.py picks the row up.
+        """
+        if is_cloudinary_url(url):
+            return cloudinary_variants(url)
+        path = self.local_path(url)
+        if path is None or not path.is_file():
+            return None
+        return self.existing_local_variants(path) or None
+
+    def existing_local_variants(self, file_path: Path) -> List[Dict[str, Any]]:
+        """Variants already rendered for a content-addressed file by an earlier upload."""
+        variants = []
+        for variant_path in sorted(file_path.parent.glob(f"{file_path.stem}-*w.*")):
+            match = _VARIANT_NAME.search(variant_path.name)
+            if match:
+                fmt = _VARIANT_FORMATS[f".{match.group(2)}"]
+                variants.append(variant(int(match.group(1)), fmt, self._local_url(variant_path)))
+        variants.sort(key=lambda item: (item["width"], item["format"] != "webp"))
+        return variants
+
+def _write_chunk(out, digest, chunk: bytes):
+    digest.update(chunk)
+    out.write(chunk)
+
+async def _write_file(path: Path, contents: bytes):
+    # Write to a private temp name and rename, so a concurrent upload of the
+    # same content never serves a half-written file.
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        import aiofiles
+    except ImportError:
+        await asyncio.to_thread(tmp_path.write_bytes, contents)
+    else:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(contents)
+    os.replace(tmp_path, path)
 
 # Create singleton instance
 image_uploader = ImageUploader()
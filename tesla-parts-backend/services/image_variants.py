@@ -0,0 +1,99 @@
+"""
+Resized WebP/JPEG variants of uploaded images.
+
+Each variant is recorded as ``{"width": 400, "format": "webp", "url": ...}``
+on the owning row (``ProductImage.variants``, ``Review.variants``) and turned
+into ``<picture>``-ready srcset strings by ``image_sources``.
+
+Local uploads are resized with Pillow when it is installed (otherwise only
+the original is kept); Cloudinary images get transformation URLs instead,
+since Cloudinary renders and caches those on first request.
+"""
+import io
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+VARIANT_WIDTHS = (200, 400, 800, 1600)
+VARIANT_FORMATS = ("webp", "jpeg")
+
+MIME_TYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"webp": ".webp", "jpeg": ".jpg"}
+
+_QUALITY = {"webp": 80, "jpeg": 82}
+
+_CLOUDINARY_UPLOAD_SEGMENT = "/image/upload/"
+
+
+def variant(width: int, fmt: str, url: str) -> Dict[str, Any]:
+    return {"width": width, "format": fmt, "url": url}
+
+
+def render_variants(source: Union[bytes, Path]) -> List[Tuple[int, str, bytes]]:
+    """
+    Encode ``(width, format, bytes)`` for every width up to the original's,
+    never upscaling. Returns [] when Pillow is missing or the bytes are not an
+    image. ``source`` is the encoded image or a path to it. CPU bound: call it
+    from a worker thread.
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return []
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except Exception:
+        return []
+
+    widths = [width for width in VARIANT_WIDTHS if width <= image.width] or [image.width]
+    rendered = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+        for fmt in VARIANT_FORMATS:
+            frame = resized
+            if fmt == "jpeg" and frame.mode not in ("RGB", "L"):
+                frame = frame.convert("RGB")
+            elif fmt == "webp" and frame.mode not in ("RGB", "RGBA"):
+                frame = frame.convert("RGBA" if "A" in frame.getbands() else "RGB")
+            buffer = io.BytesIO()
+            frame.save(buffer, format=fmt.upper(), quality=_QUALITY[fmt], optimize=True)
+            rendered.append((width, fmt, buffer.getvalue()))
+    return rendered
+
+
+def is_cloudinary_url(url: Optional[str]) -> bool:
+    return bool(url) and "res.cloudinary.com" in url and _CLOUDINARY_UPLOAD_SEGMENT in url
+
+
+def cloudinary_variants(url: str) -> List[Dict[str, Any]]:
+    """Transformation URLs for an image already stored on Cloudinary."""
+    if not is_cloudinary_url(url):
+        return []
+    prefix, rest = url.split(_CLOUDINARY_UPLOAD_SEGMENT, 1)
+    return [
+        variant(
+            width,
+            fmt,
+            f"{prefix}{_CLOUDINARY_UPLOAD_SEGMENT}c_limit,w_{width},f_{'jpg' if fmt == 'jpeg' else fmt},q_auto/{rest}",
+        )
+        for width in VARIANT_WIDTHS
+        for fmt in VARIANT_FORMATS
+    ]
+
+
+def image_sources(url: str, variants: Optional[List[Dict[str, Any]]]) -> Dict[str, Any]:
+    """``{"url": original, "sources": [{"type": mime, "srcset": "u 200w, ..."}]}`` with WebP first."""
+    sources = []
+    for fmt in VARIANT_FORMATS:
+        entries = sorted(
+            (item for item in variants or [] if item.get("format") == fmt),
+            key=lambda item: item["width"],
+        )
+        if entries:
+            sources.append({
+                "type": MIME_TYPES[fmt],
+                "srcset": ", ".join(f"{item['url']} {item['width']}w" for item in entries),
+            })
+    return {"url": url, "sources": sources}
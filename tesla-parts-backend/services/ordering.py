@@ -0,0 +1,390 @@
+"""
+Manual ordering of products, reviews, categories and subcategories.
+
+Rows are shown by their ``rank`` key (see ``services/ranks.py``), lowest first.
+A key strictly between any two neighbours always exists, so ``move_after``
+(one drag and drop) writes the moved row only, and ``reorder`` reuses the
+listed rows' own keys, writing just the rows whose position changed. New rows
+get a key at the end of their sibling group when flushed (reviews at the
+start).
+
+Keys lengthen as a gap is split again and again. Once one is longer than
+``MAX_RANK_LENGTH``, a background thread respaces its neighbourhood after the
+commit (``rebalance_around``): a window of rows around the long key, widened
+until the keys bounding it leave room for short ones, so one product never
+rewrites the whole catalog. The display order does not change, and the window
+is written with compare-and-set on the old keys: when a concurrent move got in
+first the rebalance is dropped and the next long key schedules another.
+
+``apply_ranks`` writes any number of keys with one statement per chunk:
+``UPDATE ... FROM (VALUES ...)`` on PostgreSQL, ``CASE id WHEN ...`` on SQLite.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import String, case, column, event, func, update, values
+from sqlalchemy.orm import Session as OrmSession
+from sqlmodel import Session, col, select
+
+from models import Category, Product, Review, Subcategory
+from services.ranks import MAX_RANK_LENGTH, rank_between, ranks_between, spread_ranks
+
+logger = logging.getLogger(__name__)
+
+# Rows per UPDATE statement, keeps SQLite under its bound parameter limit
+_CHUNK_SIZE = 500
+
+# session.info key: groups whose keys grew too long in this transaction, with the long key
+_PENDING_REBALANCE = "ordering.pending_rebalance"
+
+# Rows on each side of a long key that ``rebalance_around`` starts with
+_WINDOW = 16
+# Longest key ``rebalance_around`` settles for before widening its window
+_TARGET_LENGTH = MAX_RANK_LENGTH // 2
+
+
+class Ordering(NamedTuple):
+    model: Any
+    display_order: tuple  # ORDER BY of the listings: rank first, then tie breakers
+    legacy_order: tuple  # ORDER BY of the old integer sort_order, seeds the first ranks
+    scope: tuple = ()  # Columns defining independent sibling groups
+    new_first: bool = False  # Rows created without a rank go first instead of last
+
+
+PRODUCTS = Ordering(
+    Product,
+    (col(Product.rank).asc(), col(Product.inStock).desc(), col(Product.name).asc(), col(Product.id).asc()),
+    (col(Product.sort_order).asc(), col(Product.inStock).desc(), col(Product.name).asc(), col(Product.id).asc()),
+)
+REVIEWS = Ordering(
+    Review,
+    (col(Review.rank).asc(), col(Review.created_at).desc(), col(Review.id).asc()),
+    (col(Review.sort_order).asc(), col(Review.created_at).desc(), col(Review.id).asc()),
+    new_first=True,
+)
+CATEGORIES = Ordering(
+    Category,
+    (col(Category.rank).asc(), col(Category.id).asc()),
+    (col(Category.sort_order).desc(), col(Category.id).asc()),
+)
+SUBCATEGORIES = Ordering(
+    Subcategory,
+    (col(Subcategory.rank).asc(), col(Subcategory.id).asc()),
+    (col(Subcategory.sort_order).desc(), col(Subcategory.id).asc()),
+    scope=(col(Subcategory.category_id), col(Subcategory.parent_id)),
+)
+
+ORDERINGS = (PRODUCTS, REVIEWS, CATEGORIES, SUBCATEGORIES)
+_BY_MODEL = {ordering.model: ordering for ordering in ORDERINGS}
+
+
+def apply_ranks(
+    session: Session, model, ranks: Dict[Any, str], expected: Optional[Dict[Any, Optional[str]]] = None
+) -> int:
+    """
+    Set ``rank`` for ``{id: key}`` in one UPDATE per chunk. With ``expected``
+    (``{id: old key}``) a row is only written while it still holds its old key;
+    compare the returned count to spot concurrent writes. The caller commits.
+    """
+    if not ranks:
+        return 0
+    table = model.__table__
+    key = table.c.id
+    items = list(ranks.items())
+    postgres = session.get_bind().dialect.name == "postgresql"
+
+    session.flush()
+    connection = session.connection()
+    updated = 0
+    for start in range(0, len(items), _CHUNK_SIZE):
+        chunk = items[start:start + _CHUNK_SIZE]
+        if postgres:
+            columns = [column("id", key.type), column("rank", String)]
+            if expected is not None:
+                columns.append(column("old_rank", String))
+                chunk = [(item_id, rank, expected[item_id]) for item_id, rank in chunk]
+            new_ranks = values(*columns, name="new_ranks").data(chunk)
+            stmt = update(table).where(key == new_ranks.c.id).values(rank=new_ranks.c.rank)
+            if expected is not None:
+                stmt = stmt.where(table.c.rank == new_ranks.c.old_rank)
+        else:
+            stmt = (
+                update(table)
+                .where(key.in_([item_id for item_id, _ in chunk]))
+                .values(rank=case(dict(chunk), value=key))
+            )
+            if expected is not None:
+                old = {item_id: expected[item_id] for item_id, _ in chunk}
+                stmt = stmt.where(table.c.rank == case(old, value=key))
+        updated += connection.execute(stmt).rowcount
+
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, model) and obj.id in ranks:
+            session.expire(obj, ["rank"])
+    return updated
+
+
+def scope_of(ordering: Ordering, item) -> Tuple:
+    return tuple(getattr(item, scope_column.key) for scope_column in ordering.scope)
+
+
+def _scoped(ordering: Ordering, stmt, scope: Tuple):
+    for scope_column, value in zip(ordering.scope, scope):
+        stmt = stmt.where(scope_column.is_(None) if value is None else scope_column == value)
+    return stmt
+
+
+def rebalance(session: Session, ordering: Ordering, scope: Tuple = (), order_by: Optional[tuple] = None) -> int:
+    """
+    Give one sibling group short, evenly spaced keys, keeping its display order
+    (or ``order_by``). Returns the number of rows updated; the caller commits.
+    """
+    model = ordering.model
+    rows = session.exec(
+        _scoped(ordering, select(model.id, model.rank), scope).order_by(*(order_by or ordering.display_order))
+    ).all()
+    keys = spread_ranks(len(rows))
+    return apply_ranks(
+        session, model, {item_id: key for (item_id, rank), key in zip(rows, keys) if rank != key}
+    )
+
+
+def rebalance_all(session: Session, ordering: Ordering, order_by: Optional[tuple] = None) -> int:
+    """``rebalance`` every sibling group of ``ordering``."""
+    if not ordering.scope:
+        return rebalance(session, ordering, order_by=order_by)
+    scopes = session.exec(select(*ordering.scope).distinct()).all()
+    return sum(rebalance(session, ordering, tuple(scope), order_by) for scope in scopes)
+
+
+def _window_bound(session: Session, ordering: Ordering, scope: Tuple, rank: str, width: int, above: bool):
+    # The key ``width`` rows away from ``rank``, None when the group ends first
+    rank_column = col(ordering.model.rank)
+    stmt = _scoped(ordering, select(rank_column), scope)
+    if above:
+        stmt = stmt.where(rank_column > rank).order_by(rank_column.asc())
+    else:
+        stmt = stmt.where(rank_column < rank).order_by(rank_column.desc())
+    return session.exec(stmt.offset(width).limit(1)).first()
+
+
+def _between(ordering: Ordering, stmt, low: Optional[str], high: Optional[str]):
+    rank_column = col(ordering.model.rank)
+    if low is not None:
+        stmt = stmt.where(rank_column > low)
+    if high is not None:
+        stmt = stmt.where(rank_column < high)
+    return stmt
+
+
+def rebalance_around(session: Session, ordering: Ordering, scope: Tuple, rank: str) -> Optional[int]:
+    """
+    Give the rows around ``rank`` short keys between their untouched outer
+    neighbours, keeping the display order. The window starts at ``_WINDOW``
+    rows per side and doubles until its keys fit ``_TARGET_LENGTH`` (at worst
+    it is the whole group). Its rows are locked (FOR UPDATE on PostgreSQL)
+    and written only while they keep the keys read here. Returns the number of
+    rows updated, or None when a concurrent write moved a row in or out of the
+    window; roll back then. The caller commits.
+    """
+    model = ordering.model
+    width = _WINDOW
+    while True:
+        low = _window_bound(session, ordering, scope, rank, width, above=False)
+        high = _window_bound(session, ordering, scope, rank, width - 1, above=True)
+        rows = session.exec(
+            _between(ordering, _scoped(ordering, select(model.id, model.rank), scope), low, high)
+            .order_by(*ordering.display_order)
+            .with_for_update()
+        ).all()
+        if low is None and high is None:
+            keys = spread_ranks(len(rows))
+            break
+        keys = ranks_between(low, high, len(rows))
+        if max((len(key) for key in keys), default=0) <= _TARGET_LENGTH:
+            break
+        width *= 2
+
+    old = {item_id: item_rank for item_id, item_rank in rows}
+    changed = {item_id: key for (item_id, item_rank), key in zip(rows, keys) if item_rank != key}
+    if apply_ranks(session, model, changed, expected=old) != len(changed):
+        return None
+    # A row moved into the gap meanwhile would now sit among the new keys
+    inside = session.exec(
+        _between(ordering, _scoped(ordering, select(func.count()).select_from(model), scope), low, high)
+    ).one()
+    if inside != len(rows):
+        return None
+    return len(changed)
+
+
+def _has_duplicates(session: Session, ordering: Ordering, scope: Tuple) -> bool:
+    model = ordering.model
+    duplicate = session.exec(
+        _scoped(ordering, select(model.rank), scope)
+        .group_by(model.rank)
+        .having(func.count() > 1)
+        .limit(1)
+    ).first()
+    missing = session.exec(
+        _scoped(ordering, select(model.id), scope).where(col(model.rank).is_(None)).limit(1)
+    ).first()
+    return duplicate is not None or missing is not None
+
+
+def reorder(session: Session, ordering: Ordering, ids: Iterable[Any]) -> int:
+    """
+    Put ``ids`` in the given display order, reusing the keys they already hold
+    so rows not listed keep their place. Only rows whose key changes are
+    written. Unknown ids are ignored; returns the number of rows updated.
+    """
+    model = ordering.model
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return 0
+
+    def load():
+        rows = []
+        for start in range(0, len(ids), _CHUNK_SIZE):
+            rows += session.exec(
+                select(model.id, model.rank, *ordering.scope).where(col(model.id).in_(ids[start:start + _CHUNK_SIZE]))
+            ).all()
+        return {row[0]: (row[1], tuple(row[2:])) for row in rows}
+
+    current = load()
+    scopes = {scope for _, scope in current.values()}
+    # Keys are reused as slots, so they must be present and distinct
+    broken = [scope for scope in scopes if _has_duplicates(session, ordering, scope)]
+    if broken:
+        for scope in broken:
+            rebalance(session, ordering, scope)
+        current = load()
+
+    changed = {}
+    for scope in scopes:
+        listed = [item_id for item_id in ids if item_id in current and current[item_id][1] == scope]
+        slots = sorted(current[item_id][0] for item_id in listed)
+        for item_id, slot in zip(listed, slots):
+            if current[item_id][0] != slot:
+                changed[item_id] = slot
+    return apply_ranks(session, model, changed)
+
+
+def _edge_rank(session: Session, ordering: Ordering, scope: Tuple, exclude_id, after: Optional[str] = None):
+    """Lowest key in the group (above ``after`` if given), ignoring ``exclude_id``."""
+    model = ordering.model
+    stmt = _scoped(ordering, select(func.min(model.rank)), scope).where(col(model.id) != exclude_id)
+    if after is not None:
+        stmt = stmt.where(col(model.rank) > after)
+    return session.exec(stmt).one()
+
+
+def _tied(session: Session, ordering: Ordering, scope: Tuple, anchor, exclude_id) -> bool:
+    model = ordering.model
+    return session.exec(
+        _scoped(ordering, select(model.id), scope)
+        .where(col(model.rank) == anchor.rank, col(model.id) != anchor.id, col(model.id) != exclude_id)
+        .limit(1)
+    ).first() is not None
+
+
+def move_after(session: Session, ordering: Ordering, item_id: Any, after_id: Optional[Any]) -> Optional[Any]:
+    """
+    Show ``item_id`` right after ``after_id``, or first when ``after_id`` is
+    None, by giving it a key between its new neighbours. Returns the moved
+    row, or None when either row is missing or they are not siblings. The
+    caller commits.
+    """
+    model = ordering.model
+    item = session.get(model, item_id)
+    if item is None:
+        return None
+    scope = scope_of(ordering, item)
+    anchor = None
+    if after_id is not None:
+        anchor = session.get(model, after_id)
+        if anchor is None or scope_of(ordering, anchor) != scope:
+            return None
+        if anchor.id == item.id:
+            return item
+        if anchor.rank is None or _tied(session, ordering, scope, anchor, item.id):
+            rebalance(session, ordering, scope)
+            session.refresh(anchor)
+
+    if anchor is None:
+        rank = rank_between(None, _edge_rank(session, ordering, scope, item.id))
+    else:
+        rank = rank_between(anchor.rank, _edge_rank(session, ordering, scope, item.id, after=anchor.rank))
+    apply_ranks(session, model, {item.id: rank})
+    _check_length(session, ordering, scope, rank)
+    return item
+
+
+def new_ranks(session: OrmSession, ordering: Ordering, scope: Tuple, count: int = 1) -> List[str]:
+    """
+    Keys for ``count`` rows joining a group at its end (its start for
+    ``new_first``), in display order. For rows that get no key from the
+    flush hook: Core inserts, or rows moved to another group.
+    """
+    model = ordering.model
+    edge = func.min(model.rank) if ordering.new_first else func.max(model.rank)
+    current = session.connection().execute(_scoped(ordering, select(edge), scope)).scalar()
+    if ordering.new_first:
+        keys = ranks_between(None, current, count)
+    else:
+        keys = ranks_between(current, None, count)
+    _check_length(session, ordering, scope, keys[0] if ordering.new_first else keys[-1])
+    return keys
+
+
+def _check_length(session: OrmSession, ordering: Ordering, scope: Tuple, rank: Optional[str]):
+    if rank is not None and len(rank) > MAX_RANK_LENGTH:
+        session.info.setdefault(_PENDING_REBALANCE, {})[(ordering.model, scope)] = rank
+
+
+@event.listens_for(OrmSession, "before_flush")
+def _rank_new_rows(session, flush_context, instances):
+    """Give new rows without a rank a key at the end (or start) of their group."""
+    groups: Dict[Tuple, List[Any]] = {}
+    for obj in session.new:
+        ordering = _BY_MODEL.get(type(obj))
+        if ordering is not None and obj.rank is None:
+            groups.setdefault((ordering, scope_of(ordering, obj)), []).append(obj)
+    if not groups:
+        return
+
+    for (ordering, scope), objs in groups.items():
+        for obj, key in zip(objs, new_ranks(session, ordering, scope, len(objs))):
+            obj.rank = key
+
+
+def _rebalance_groups(bind, groups: Dict[Tuple, str]):
+    from services.versioning import bump_catalog_version
+
+    for (model, scope), rank in groups.items():
+        try:
+            with Session(bind) as session:
+                if rebalance_around(session, _BY_MODEL[model], scope, rank) is None:
+                    logger.info("Rank rebalance of %s %s skipped after a concurrent move", model.__name__, scope)
+                    session.rollback()
+                    continue
+                bump_catalog_version(session)
+                session.commit()
+        except Exception:
+            logger.exception("Rank rebalance failed")
+
+
+_rebalancer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rank-rebalance")
+
+
+@event.listens_for(OrmSession, "after_commit")
+def _schedule_rebalance(session):
+    groups = session.info.pop(_PENDING_REBALANCE, None)
+    if groups:
+        _rebalancer.submit(_rebalance_groups, session.get_bind(), groups)
+
+
+@event.listens_for(OrmSession, "after_rollback")
+def _drop_rebalance(session):
+    session.info.pop(_PENDING_REBALANCE, None)
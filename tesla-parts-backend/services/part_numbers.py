@@ -0,0 +1,132 @@
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlmodel import Session, select, delete, col
+
+from models import ProductPartNumber
+
+KIND_DETAIL = "detail"
+KIND_CROSS = "cross"
+
+# Separators used between several numbers in the free-text cross_number field
+_LIST_SEPARATORS = re.compile(r"[,;|/\n]+")
+
+
+def normalize_part_number(value: Optional[str]) -> str:
+    """Strip dashes, spaces and case so "1084168-00-e" == "108416800E"."""
+    if not value:
+        return ""
+    return re.sub(r"[\s\-]+", "", value).upper()
+
+
+def split_part_numbers(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    numbers: List[str] = []
+    for chunk in _LIST_SEPARATORS.split(value):
+        number = normalize_part_number(chunk)
+        if number and number not in numbers:
+            numbers.append(number)
+    return numbers
+
+
+def _part_number_rows(
+    product_id: str, detail_number: Optional[str], cross_number: Optional[str]
+) -> List[dict]:
+    rows = []
+    detail = normalize_part_number(detail_number)
+    if detail:
+        rows.append({"product_id": product_id, "number": detail, "kind": KIND_DETAIL})
+    for number in split_part_numbers(cross_number):
+        rows.append({"product_id": product_id, "number": number, "kind": KIND_CROSS})
+    return rows
+
+
+def delete_part_numbers(session: Session, product_ids: Iterable[str]):
+    ids = list(product_ids)
+    if ids:
+        session.exec(
+            delete(ProductPartNumber).where(col(ProductPartNumber.product_id).in_(ids))
+        )
+
+
+def sync_part_numbers(
+    session: Session,
+    product_id: str,
+    detail_number: Optional[str],
+    cross_number: Optional[str],
+):
+    """Replace the indexed numbers of one product. The caller commits."""
+    delete_part_numbers(session, [product_id])
+    for row in _part_number_rows(product_id, detail_number, cross_number):
+        session.add(ProductPartNumber(**row))
+
+
+def replace_part_numbers(
+    session: Session, products: Iterable[Tuple[str, Optional[str], Optional[str]]]
+):
+    """Re-index many ``(id, detail_number, cross_number)`` rows in one pass. The caller commits."""
+    products = list(products)
+    delete_part_numbers(session, [product_id for product_id, _, _ in products])
+    rows = []
+    for product_id, detail_number, cross_number in products:
+        rows.extend(_part_number_rows(product_id, detail_number, cross_number))
+    if rows:
+        session.execute(ProductPartNumber.__table__.insert(), rows)
+
+
+def product_ids_by_detail_number(session: Session, numbers: Iterable[str]) -> Dict[str, str]:
+    """Map normalized detail numbers to the id of the (first) product carrying them."""
+    numbers = list({number for number in numbers if number})
+    if not numbers:
+        return {}
+    rows = session.exec(
+        select(ProductPartNumber.number, ProductPartNumber.product_id)
+        .where(col(ProductPartNumber.number).in_(numbers))
+        .where(ProductPartNumber.kind == KIND_DETAIL)
+        .order_by(ProductPartNumber.product_id)
+    ).all()
+    matches: Dict[str, str] = {}
+    for number, product_id in rows:
+        matches.setdefault(number, product_id)
+    return matches
+
+
+def rebuild_part_numbers(session: Session, products) -> int:
+    """Index ``(id, detail_number, cross_number)`` rows from scratch. The caller commits."""
+    session.exec(delete(ProductPartNumber))
+    rows = []
+    for product_id, detail_number, cross_number in products:
+        rows.extend(_part_number_rows(product_id, detail_number, cross_number))
+    if rows:
+        session.execute(ProductPartNumber.__table__.insert(), rows)
+    return len(rows)
+
+
+def _prefix_upper_bound(prefix: str) -> str:
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def lookup_product_ids(session: Session, number: str, limit: int = 20) -> List[str]:
+    """
+    Product ids whose detail or cross number equals or starts with ``number``.
+
+    Uses a range scan on the ``number`` index (>= prefix, < next prefix), exact
+    matches come first, then prefix matches in part-number order.
+    """
+    normalized = normalize_part_number(number)
+    if not normalized:
+        return []
+
+    exact = func.min(case((ProductPartNumber.number == normalized, 0), else_=1))
+    first_number = func.min(ProductPartNumber.number)
+    stmt = (
+        select(ProductPartNumber.product_id)
+        .where(ProductPartNumber.number >= normalized)
+        .where(ProductPartNumber.number < _prefix_upper_bound(normalized))
+        .group_by(ProductPartNumber.product_id)
+        .order_by(exact, first_number, ProductPartNumber.product_id)
+        .limit(limit)
+    )
+    return list(session.exec(stmt).all())
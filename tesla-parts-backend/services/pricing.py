@@ -1,24 +1,88 @@
+"""
+Product prices.
+
+Admins enter ``priceUSD``; the UAH price shown to customers is stored in
+``Product.priceUAH`` and recomputed set-based by ``reprice_products`` whenever
+an input changes (exchange rate, default rounding, a category's markup or
+rounding, or a product's price/categories), so read paths never recompute it.
+
+UAH price = priceUSD * exchange_rate * (1 + markup_percent / 100), rounded to
+the nearest ``price_rounding`` step. Markup and step come from the product's
+primary (first) category; the step falls back to the ``price_rounding``
+setting. Legacy products without a USD price keep their stored UAH price.
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import Numeric, cast, func, select, update
 from sqlmodel import Session
-from models import Settings, Product
 
-DEFAULT_EXCHANGE_RATE = 40.0
+from models import Category, Product, ProductCategoryLink
+from services.site_settings import SiteSettings, get_settings
 
 
 def get_exchange_rate(session: Session) -> float:
-    setting = session.get(Settings, "exchange_rate")
-    if setting and setting.value:
-        try:
-            value = float(setting.value)
-            if value > 0:
-                return value
-        except (ValueError, TypeError):
-            pass
-    return DEFAULT_EXCHANGE_RATE
+    return get_settings(session).exchange_rate
 
 
 def compute_price_fields(product: Product, rate: float) -> tuple[float, float]:
     price_usd = product.priceUSD or 0.0
-    if price_usd <= 0 and product.priceUAH:
-        price_usd = product.priceUAH / rate if rate else product.priceUAH
-    price_uah = round(price_usd * rate, 2) if rate else product.priceUAH or 0.0
+    price_uah = product.priceUAH or 0.0
+    if price_usd <= 0 and price_uah:
+        price_usd = price_uah / rate if rate else price_uah
     return price_usd, price_uah
+
+
+def _primary_category_value(column):
+    link = ProductCategoryLink.__table__
+    return (
+        select(column)
+        .select_from(link.join(Category.__table__, Category.__table__.c.id == link.c.category_id))
+        .where(link.c.product_id == Product.__table__.c.id)
+        .order_by(link.c.position, link.c.category_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+
+def uah_price_expression(rate: float, default_step: float):
+    """SQL expression for the UAH price of the product row being updated."""
+    category = Category.__table__
+    markup = func.coalesce(_primary_category_value(category.c.markup_percent), 0.0)
+    step = func.coalesce(
+        func.nullif(_primary_category_value(category.c.price_rounding), 0.0),
+        default_step,
+    )
+    raw = Product.__table__.c.priceUSD * rate * (1 + markup / 100.0)
+    return func.round(cast(func.round(cast(raw / step, Numeric)) * step, Numeric), 2)
+
+
+def reprice_products(
+    session: Session,
+    product_ids: Optional[Iterable[str]] = None,
+    settings: Optional[SiteSettings] = None,
+) -> int:
+    """
+    Recompute stored UAH prices with one UPDATE, for the given products or the
+    whole catalog. Pass ``settings`` when the rate itself changes in this
+    transaction. The caller commits.
+    """
+    settings = settings or get_settings(session)
+    table = Product.__table__
+    stmt = (
+        update(table)
+        .where(table.c.priceUSD > 0)
+        .values(priceUAH=uah_price_expression(settings.exchange_rate, settings.price_rounding))
+    )
+    ids = None
+    if product_ids is not None:
+        ids = set(product_ids)
+        if not ids:
+            return 0
+        stmt = stmt.where(table.c.id.in_(ids))
+
+    session.flush()
+    result = session.connection().execute(stmt)
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Product) and (ids is None or obj.id in ids):
+            session.expire(obj, ["priceUAH"])
+    return result.rowcount
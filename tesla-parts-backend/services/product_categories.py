@@ -0,0 +1,269 @@
+"""
+Product <-> category membership.
+
+Membership lives in ``ProductCategoryLink``. ``Product.category`` (the
+comma-joined category names) is only a derived value kept for old clients and
+is rewritten from the links whenever they change.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import bindparam, case, insert, literal, update
+from sqlmodel import Session, select, delete, col, func
+
+from models import Category, Product, ProductCategoryLink
+from services.versioning import CATALOG, VersionedCache
+
+
+def split_categories(value: Optional[str]) -> List[str]:
+    if not value:
+        return []
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def join_categories(categories: List[str]) -> str:
+    unique: List[str] = []
+    for category in categories:
+        if category not in unique:
+            unique.append(category)
+    return ", ".join(unique)
+
+
+class UnknownCategoryError(ValueError):
+    def __init__(self, names: List[str]):
+        self.names = names
+        super().__init__(f"unknown category {', '.join(names)}")
+
+
+def category_ids_for_names(session: Session, names: List[str]) -> List[int]:
+    """
+    Resolve category names to ids, keeping the given order. Raises
+    ``UnknownCategoryError`` for names without a category: the legacy string
+    is derived from the links, so they would be lost.
+    """
+    if not names:
+        return []
+    rows = session.exec(
+        select(Category.name, Category.id).where(col(Category.name).in_(names))
+    ).all()
+    id_by_name = {}
+    for name, category_id in rows:
+        id_by_name.setdefault(name, category_id)
+    unknown = [name for name in dict.fromkeys(names) if name not in id_by_name]
+    if unknown:
+        raise UnknownCategoryError(unknown)
+    return list(dict.fromkeys(id_by_name[name] for name in names))
+
+
+def products_in_category(category_id: int):
+    """Subquery of product ids linked to ``category_id`` for use with ``in_()``."""
+    return select(ProductCategoryLink.product_id).where(
+        ProductCategoryLink.category_id == category_id
+    )
+
+
+_category_labels = VersionedCache(CATALOG, max_entries=1)
+
+
+def _load_category_labels(session: Session) -> List[dict]:
+    in_stock = func.sum(case((Product.inStock, 1), else_=0))
+    rows = session.exec(
+        select(
+            Category.id,
+            Category.name,
+            Category.slug,
+            func.count(ProductCategoryLink.product_id),
+            in_stock,
+        )
+        .join(ProductCategoryLink, ProductCategoryLink.category_id == Category.id)
+        .join(Product, Product.id == ProductCategoryLink.product_id)
+        .group_by(Category.id, Category.name, Category.slug, Category.rank)
+        .order_by(Category.rank, Category.id)
+    ).all()
+    return [
+        {
+            "label": name,
+            "category_id": category_id,
+            "slug": slug,
+            "product_count": product_count,
+            "in_stock_count": in_stock_count or 0,
+        }
+        for category_id, name, slug, product_count, in_stock_count in rows
+    ]
+
+
+def category_labels(session: Session, catalog_version: Optional[int] = None) -> List[dict]:
+    """
+    Categories that have products, with product and in-stock counts. Cached per
+    catalog version; pass the ``catalog_version`` the request already read, if any.
+    """
+    return _category_labels.get(
+        session, "labels", lambda: _load_category_labels(session), version=catalog_version
+    )
+
+
+def _category_names_by_product(session: Session, product_ids: List[str]) -> Dict[str, List[str]]:
+    rows = session.exec(
+        select(ProductCategoryLink.product_id, Category.name)
+        .join(Category, Category.id == ProductCategoryLink.category_id)
+        .where(col(ProductCategoryLink.product_id).in_(product_ids))
+        .order_by(ProductCategoryLink.position, ProductCategoryLink.category_id)
+    ).all()
+    names: Dict[str, List[str]] = defaultdict(list)
+    for product_id, name in rows:
+        names[product_id].append(name)
+    return names
+
+
+def refresh_category_strings(session: Session, product_ids: Iterable[str]):
+    """Rewrite the legacy ``Product.category`` string of the given products from their links."""
+    ids = list(dict.fromkeys(product_ids))
+    if not ids:
+        return
+    session.flush()
+    names = _category_names_by_product(session, ids)
+    session.connection().execute(
+        update(Product.__table__)
+        .where(Product.__table__.c.id == bindparam("product_id"))
+        .values(category=bindparam("category_value")),
+        [{"product_id": pid, "category_value": join_categories(names.get(pid, []))} for pid in ids],
+    )
+    id_set = set(ids)
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in id_set:
+            session.expire(obj, ["category"])
+
+
+def set_product_categories(session: Session, product_id: str, category_ids: List[int]) -> str:
+    """Replace the categories of one product and return the derived legacy string."""
+    session.exec(
+        delete(ProductCategoryLink).where(ProductCategoryLink.product_id == product_id)
+    )
+    for position, category_id in enumerate(category_ids):
+        session.add(
+            ProductCategoryLink(
+                product_id=product_id,
+                category_id=category_id,
+                position=position,
+            )
+        )
+    session.flush()
+    names = _category_names_by_product(session, [product_id])
+    return join_categories(names.get(product_id, []))
+
+
+def copy_product_categories(session: Session, source_product_id: str, target_product_id: str):
+    links = session.exec(
+        select(ProductCategoryLink).where(ProductCategoryLink.product_id == source_product_id)
+    ).all()
+    for link in links:
+        session.add(
+            ProductCategoryLink(
+                product_id=target_product_id,
+                category_id=link.category_id,
+                position=link.position,
+            )
+        )
+
+
+def add_products_to_category(session: Session, product_ids: Iterable[str], category_id: int):
+    """
+    Append ``category_id`` to every product that is not linked to it yet, with
+    one INSERT ... SELECT. The caller refreshes strings.
+    """
+    ids = list(dict.fromkeys(product_ids))
+    if not ids:
+        return
+    products = Product.__table__
+    links = ProductCategoryLink.__table__
+    existing = links.alias("existing")
+    next_position = (
+        select(func.coalesce(func.max(existing.c.position) + 1, 0))
+        .where(existing.c.product_id == products.c.id)
+        .scalar_subquery()
+    )
+    already_linked = (
+        select(existing.c.product_id)
+        .where(existing.c.product_id == products.c.id, existing.c.category_id == category_id)
+        .exists()
+    )
+    session.flush()
+    session.connection().execute(
+        insert(links).from_select(
+            ["product_id", "category_id", "position"],
+            select(products.c.id, literal(category_id), next_position)
+            .where(products.c.id.in_(ids), ~already_linked),
+        )
+    )
+
+
+def move_products_between_categories(
+    session: Session,
+    product_ids: Iterable[str],
+    old_category_id: Optional[int],
+    new_category_id: int,
+):
+    """Drop ``old_category_id`` and add ``new_category_id`` for the given products. The caller refreshes strings."""
+    ids = list(dict.fromkeys(product_ids))
+    if not ids:
+        return
+    if old_category_id is not None and old_category_id != new_category_id:
+        session.exec(
+            delete(ProductCategoryLink)
+            .where(col(ProductCategoryLink.product_id).in_(ids))
+            .where(ProductCategoryLink.category_id == old_category_id)
+        )
+    add_products_to_category(session, ids, new_category_id)
+
+
+def delete_product_category_links(session: Session, product_ids: Iterable[str]):
+    ids = list(product_ids)
+    if ids:
+        session.exec(
+            delete(ProductCategoryLink).where(col(ProductCategoryLink.product_id).in_(ids))
+        )
+
+
+def replace_product_categories(session: Session, category_ids_by_product: Dict[str, List[int]]):
+    """Replace the links of many products at once. The caller writes the legacy strings."""
+    product_ids = list(category_ids_by_product)
+    if not product_ids:
+        return
+    delete_product_category_links(session, product_ids)
+    rows = [
+        {"product_id": product_id, "category_id": category_id, "position": position}
+        for product_id, category_ids in category_ids_by_product.items()
+        for position, category_id in enumerate(category_ids)
+    ]
+    if rows:
+        session.execute(ProductCategoryLink.__table__.insert(), rows)
+
+
+def delete_category_links(session: Session, category_id: int) -> List[str]:
+    """Unlink every product from a category and return the affected product ids."""
+    product_ids = list(session.exec(products_in_category(category_id)).all())
+    session.exec(
+        delete(ProductCategoryLink).where(ProductCategoryLink.category_id == category_id)
+    )
+    return product_ids
+
+
+def rebuild_category_links(session: Session) -> int:
+    """Create links from the legacy strings of all products. The caller commits."""
+    id_by_name = {}
+    for name, category_id in session.exec(select(Category.name, Category.id).order_by(Category.id)).all():
+        id_by_name.setdefault(name, category_id)
+
+    session.exec(delete(ProductCategoryLink))
+    rows = []
+    for product_id, category_value in session.exec(select(Product.id, Product.category)).all():
+        seen = set()
+        for name in split_categories(category_value):
+            category_id = id_by_name.get(name)
+            if category_id is None or category_id in seen:
+                continue
+            seen.add(category_id)
+            rows.append({"product_id": product_id, "category_id": category_id, "position": len(seen) - 1})
+    if rows:
+        session.execute(ProductCategoryLink.__table__.insert(), rows)
+    return len(rows)
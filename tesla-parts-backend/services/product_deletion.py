@@ -0,0 +1,72 @@
+"""
+Deleting products with a handful of set-based statements.
+
+``session.delete`` per product loads each row and its gallery and deletes the
+images one by one through the ORM cascade. ``delete_products`` removes any
+number of products with one statement per table and chunk instead: links,
+part numbers, gallery images, order items (detached, the order keeps its copy
+of name and price) and finally the products. Image reference counts are
+released in bulk, since the mapper events of ``services/image_store.py`` do not
+see Core deletes.
+
+Image files are not touched here: the URLs nothing refers to any more are
+returned so storage can be cleaned up later (``prune_images.py``).
+"""
+from typing import Iterable, List, NamedTuple
+
+from sqlalchemy import delete, update
+from sqlmodel import Session, col, select
+
+from models import OrderItem, Product, ProductImage, ProductSubcategoryLink
+from services.image_store import release, unreferenced_urls
+from services.part_numbers import delete_part_numbers
+from services.product_categories import delete_product_category_links
+
+# Ids per IN (...) list, keeps SQLite under its bound parameter limit
+_CHUNK_SIZE = 500
+
+
+class DeletedProducts(NamedTuple):
+    deleted: int
+    freed_images: List[str]  # Image URLs no remaining row refers to
+
+
+def delete_products(session: Session, product_ids: Iterable[str]) -> DeletedProducts:
+    """Delete ``product_ids`` (unknown ids are ignored). The caller commits."""
+    ids = list(dict.fromkeys(product_ids))
+    deleted = 0
+    image_urls: List[str] = []
+    gallery_urls: List[str] = []
+
+    session.flush()
+    connection = session.connection()
+    for start in range(0, len(ids), _CHUNK_SIZE):
+        chunk = ids[start:start + _CHUNK_SIZE]
+        image_urls += connection.execute(
+            select(Product.image).where(col(Product.id).in_(chunk), col(Product.image).is_not(None))
+        ).scalars().all()
+        gallery_urls += connection.execute(
+            select(ProductImage.url).where(col(ProductImage.product_id).in_(chunk))
+        ).scalars().all()
+
+        connection.execute(delete(ProductSubcategoryLink).where(col(ProductSubcategoryLink.product_id).in_(chunk)))
+        delete_part_numbers(session, chunk)
+        delete_product_category_links(session, chunk)
+        connection.execute(delete(ProductImage).where(col(ProductImage.product_id).in_(chunk)))
+        connection.execute(
+            update(OrderItem).where(col(OrderItem.product_id).in_(chunk)).values(product_id=None)
+        )
+        deleted += connection.execute(delete(Product).where(col(Product.id).in_(chunk))).rowcount
+
+    release(connection, gallery_urls)
+    freed = unreferenced_urls(connection, image_urls + gallery_urls)
+
+    deleted_ids = set(ids)
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Product) and obj.id in deleted_ids:
+            session.expunge(obj)
+        elif isinstance(obj, ProductImage) and obj.product_id in deleted_ids:
+            session.expunge(obj)
+        elif isinstance(obj, OrderItem) and obj.product_id in deleted_ids:
+            session.expire(obj, ["product_id"])
+    return DeletedProducts(deleted, freed)
@@ -0,0 +1,122 @@
+"""
+Product counts per category, subcategory, stock state and popularity.
+
+``product_facets`` takes the filtered product query of a listing and counts
+its rows in one aggregate statement: every product yields one row per facet
+bucket it belongs to (all products, popular, each linked category, each
+subcategory it is assigned or linked to and all of their ancestors), and a
+single GROUP BY counts distinct products and in-stock products per bucket.
+The filtered products are a CTE, so the listing's filters run once.
+Ancestors come from a recursive CTE over ``Subcategory.parent_id``.
+
+Results are cached per filter combination until the catalog version moves.
+"""
+from typing import Dict, Hashable, Optional
+
+from sqlalchemy import Integer, String, case, distinct, func, literal, union_all
+from sqlmodel import Session, select
+
+from models import Product, ProductCategoryLink, ProductSubcategoryLink, Subcategory
+from services.versioning import CATALOG, VersionedCache
+
+TOTAL = "total"
+POPULAR = "popular"
+CATEGORY = "category"
+SUBCATEGORY = "subcategory"
+
+_facets = VersionedCache(CATALOG)
+
+
+def facet_columns():
+    """Columns the filtered query passed to ``product_facets`` must select."""
+    return (Product.id, Product.inStock, Product.is_popular, Product.subcategory_id)
+
+
+def _subcategory_ancestors():
+    """(ancestor_id, descendant_id) for every subcategory and each of its ancestors, itself included."""
+    base = select(
+        Subcategory.id.label("ancestor_id"), Subcategory.id.label("descendant_id")
+    ).cte("subcategory_ancestors", recursive=True)
+    child = Subcategory.__table__.alias("child")
+    return base.union(
+        select(base.c.ancestor_id, child.c.id).join(child, child.c.parent_id == base.c.descendant_id)
+    )
+
+
+def _bucket(facet: str, key, filtered, *, where=None, join=None):
+    stmt = select(
+        literal(facet, String).label("facet"),
+        (key if key is not None else literal(0, Integer)).label("key"),
+        filtered.c.id.label("product_id"),
+        filtered.c.inStock.label("in_stock"),
+    ).select_from(filtered)
+    if join is not None:
+        stmt = stmt.join(*join)
+    if where is not None:
+        stmt = stmt.where(where)
+    return stmt
+
+
+def _load_facets(session: Session, filtered_query) -> Dict[str, dict]:
+    # A CTE so the filters (and a search) are evaluated once for all buckets
+    filtered = filtered_query.order_by(None).cte("filtered")
+
+    assignments = union_all(
+        select(Product.id.label("product_id"), Product.subcategory_id.label("subcategory_id"))
+        .where(Product.subcategory_id.is_not(None)),
+        select(ProductSubcategoryLink.product_id, ProductSubcategoryLink.subcategory_id),
+    ).subquery("assignments")
+    ancestors = _subcategory_ancestors()
+
+    rows = union_all(
+        _bucket(TOTAL, None, filtered),
+        _bucket(POPULAR, None, filtered, where=filtered.c.is_popular),
+        _bucket(
+            CATEGORY, ProductCategoryLink.category_id, filtered,
+            join=(ProductCategoryLink, ProductCategoryLink.product_id == filtered.c.id),
+        ),
+        select(
+            literal(SUBCATEGORY, String).label("facet"),
+            ancestors.c.ancestor_id.label("key"),
+            filtered.c.id.label("product_id"),
+            filtered.c.inStock.label("in_stock"),
+        )
+        .select_from(filtered)
+        .join(assignments, assignments.c.product_id == filtered.c.id)
+        .join(ancestors, ancestors.c.descendant_id == assignments.c.subcategory_id),
+    ).subquery("facet_rows")
+
+    counts = session.connection().execute(
+        select(
+            rows.c.facet,
+            rows.c.key,
+            func.count(distinct(rows.c.product_id)),
+            func.count(distinct(case((rows.c.in_stock, rows.c.product_id)))),
+        ).group_by(rows.c.facet, rows.c.key)
+    ).all()
+
+    empty = {"product_count": 0, "in_stock_count": 0}
+    result = {TOTAL: dict(empty), POPULAR: dict(empty), "categories": {}, "subcategories": {}}
+    for facet, key, product_count, in_stock_count in counts:
+        bucket = {"product_count": product_count, "in_stock_count": in_stock_count}
+        if facet == CATEGORY:
+            result["categories"][key] = bucket
+        elif facet == SUBCATEGORY:
+            result["subcategories"][key] = bucket
+        else:
+            result[facet] = bucket
+    return result
+
+
+def product_facets(
+    session: Session, key: Hashable, filtered_query, catalog_version: Optional[int] = None
+) -> Dict[str, dict]:
+    """
+    Counts for the products matched by ``filtered_query`` (a select of
+    ``facet_columns()`` with the listing's filters applied). ``key`` identifies
+    the filters for caching; ``catalog_version`` is the one the request already
+    read, if any.
+    """
+    return _facets.get(
+        session, key, lambda: _load_facets(session, filtered_query), version=catalog_version
+    )
@@ -0,0 +1,156 @@
+"""
+Fast serialization of products for API responses.
+
+Product endpoints used to ``model_dump()`` every row, patch the dict, build a
+``ProductRead`` and let FastAPI validate and serialize it again against
+``response_model``. Here rows are read once into plain dicts shaped like
+``ProductRead`` and encoded to JSON bytes by a precompiled pydantic-core
+serializer, with no validation pass.
+"""
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from fastapi import Response
+from pydantic import TypeAdapter
+from typing_extensions import TypedDict
+
+from models import Product
+from services.image_variants import image_sources
+from services.pricing import compute_price_fields
+
+
+class ImageSourcePayload(TypedDict):
+    type: str
+    srcset: str
+
+
+class ImageSourceSetPayload(TypedDict):
+    url: str
+    sources: List[ImageSourcePayload]
+
+
+class ProductPayload(TypedDict):
+    """Wire shape of ``schemas.ProductRead``; keep the two in sync."""
+    id: str
+    name: str
+    category: str
+    priceUSD: Optional[float]
+    priceUAH: float
+    image: str
+    description: str
+    inStock: bool
+    sort_order: Optional[int]
+    rank: Optional[str]
+    detail_number: Optional[str]
+    cross_number: Optional[str]
+    meta_title: Optional[str]
+    meta_description: Optional[str]
+    is_popular: bool
+    created_at: Optional[datetime]
+    subcategory_id: Optional[int]
+    subcategory_ids: List[int]
+    images: List[str]
+    image_sources: List[ImageSourceSetPayload]
+
+
+class ProductSnapshotPayload(TypedDict):
+    """Wire shape of ``schemas.ProductSnapshotRead``: what a cart needs to revalidate an item."""
+    id: str
+    name: str
+    priceUSD: Optional[float]
+    priceUAH: float
+    inStock: bool
+    image: str
+    images: List[str]
+
+
+_product_list = TypeAdapter(List[ProductPayload])
+_product = TypeAdapter(ProductPayload)
+_snapshot_list = TypeAdapter(List[ProductSnapshotPayload])
+
+
+def collect_subcategory_ids(product: Product) -> List[int]:
+    ids: List[int] = []
+    if product.subcategory_id:
+        ids.append(product.subcategory_id)
+    if product.linked_subcategories:
+        for sub in product.linked_subcategories:
+            if sub.id and sub.id not in ids:
+                ids.append(sub.id)
+    return ids
+
+
+def product_payload(product: Product, rate: float) -> ProductPayload:
+    """Response dict for one product; expects ``images`` and ``linked_subcategories`` loaded."""
+    price_usd, price_uah = compute_price_fields(product, rate)
+    return {
+        "id": product.id,
+        "name": product.name,
+        "category": product.category,
+        "priceUSD": price_usd,
+        "priceUAH": price_uah,
+        "image": product.image,
+        "description": product.description,
+        "inStock": product.inStock,
+        "sort_order": product.sort_order,
+        "rank": product.rank,
+        "detail_number": product.detail_number,
+        "cross_number": product.cross_number,
+        "meta_title": product.meta_title,
+        "meta_description": product.meta_description,
+        "is_popular": product.is_popular,
+        "created_at": product.created_at,
+        "subcategory_id": product.subcategory_id,
+        "subcategory_ids": collect_subcategory_ids(product),
+        "images": [img.url for img in product.images],
+        "image_sources": [image_sources(img.url, img.variants) for img in product.images],
+    }
+
+
+def product_snapshot(product: Product, rate: float) -> ProductSnapshotPayload:
+    """Current price, stock and images of one product; expects ``images`` loaded."""
+    price_usd, price_uah = compute_price_fields(product, rate)
+    return {
+        "id": product.id,
+        "name": product.name,
+        "priceUSD": price_usd,
+        "priceUAH": price_uah,
+        "inStock": product.inStock,
+        "image": product.image,
+        "images": [img.url for img in product.images],
+    }
+
+
+def _json_response(body: bytes, response: Optional[Response]) -> Response:
+    # Returning a Response bypasses FastAPI's injected one, so carry over the
+    # headers dependencies set on it (ETag, X-Next-Cursor...).
+    result = Response(content=body, media_type="application/json")
+    if response is not None:
+        result.raw_headers.extend(
+            (name, value)
+            for name, value in response.raw_headers
+            if name not in (b"content-length", b"content-type")
+        )
+    return result
+
+
+def product_list_response(
+    products: Iterable[Product], rate: float, response: Optional[Response] = None
+) -> Response:
+    return _json_response(
+        _product_list.dump_json([product_payload(product, rate) for product in products]),
+        response,
+    )
+
+
+def product_response(product: Product, rate: float, response: Optional[Response] = None) -> Response:
+    return _json_response(_product.dump_json(product_payload(product, rate)), response)
+
+
+def product_snapshot_list_response(
+    products: Iterable[Product], rate: float, response: Optional[Response] = None
+) -> Response:
+    return _json_response(
+        _snapshot_list.dump_json([product_snapshot(product, rate) for product in products]),
+        response,
+    )
@@ -0,0 +1,91 @@
+"""
+Lexicographic rank keys ("fractional indexing").
+
+A rank is a string of base-36 digits read as a fraction 0.d1d2d3..., so plain
+string comparison (byte order, ``COLLATE "C"`` on PostgreSQL) sorts rows and a
+key strictly between any two others always exists. Keys never end in ``0``,
+which keeps room below every key. Inserting between two neighbours only writes
+the moved row; keys grow by about a digit per five inserts into the same gap,
+and ``spread_ranks`` hands out short evenly spaced keys again when a group is
+rebalanced.
+"""
+from itertools import count as _count
+from typing import Iterator, List, Optional
+
+DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+_VALUES = {digit: value for value, digit in enumerate(DIGITS)}
+
+# Keys longer than this trigger a background rebalance of their group
+MAX_RANK_LENGTH = 12
+
+
+def _midpoint(low: str, high: Optional[str]) -> str:
+    # ``low`` < ``high`` as fractions; "" is 0 and None is 1.
+    if high is not None:
+        prefix = 0
+        while prefix < len(high) and (low[prefix] if prefix < len(low) else "0") == high[prefix]:
+            prefix += 1
+        if prefix:
+            return high[:prefix] + _midpoint(low[prefix:], high[prefix:])
+    low_digit = _VALUES[low[0]] if low else 0
+    high_digit = _VALUES[high[0]] if high is not None else BASE
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high is not None and len(high) > 1:
+        return high[0]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def rank_between(before: Optional[str], after: Optional[str]) -> str:
+    """A key sorting after ``before`` and before ``after``; None means an open end."""
+    if before is not None and after is not None and before >= after:
+        raise ValueError(f"rank {before!r} is not before {after!r}")
+    return _midpoint(before or "", after)
+
+
+def ranks_between(before: Optional[str], after: Optional[str], count: int) -> List[str]:
+    """``count`` increasing keys in the gap, bisected so their length grows with log(count)."""
+    if count <= 0:
+        return []
+    middle = rank_between(before, after)
+    half = count // 2
+    return ranks_between(before, middle, half) + [middle] + ranks_between(middle, after, count - half - 1)
+
+
+def _fixed(value: int, width: int) -> str:
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return "".join(reversed(digits))
+
+
+def sequence_prefix(after: Optional[str]) -> str:
+    """The key ``rank_sequence`` puts in front of its counter."""
+    return rank_between(after, None) if after else ""
+
+
+def rank_sequence(after: Optional[str], width: int = 5) -> Iterator[str]:
+    """
+    Increasing keys above ``after`` (the group's highest key) for appending
+    many rows at once, e.g. an import: a short key just above ``after``
+    followed by a ``width``-digit counter, so keys stay short however many rows
+    are added and do not grow with every import.
+    """
+    prefix = sequence_prefix(after)
+    for number in _count(1):
+        if number % BASE:
+            yield prefix + _fixed(number, width)
+
+
+def spread_ranks(count: int) -> List[str]:
+    """``count`` short keys spread evenly over the whole range, for (re)numbering a group."""
+    width = 1
+    while BASE ** width <= count * 2:
+        width += 1
+    span = BASE ** width
+    keys = []
+    for index in range(1, count + 1):
+        keys.append(_fixed(index * span // (count + 1), width).rstrip("0"))
+    return keys
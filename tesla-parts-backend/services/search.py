@@ -0,0 +1,300 @@
+"""
+Product search backed by database full-text indexes.
+
+SQLite keeps an FTS5 table (``product_fts``) in sync with ``product`` through
+triggers, PostgreSQL uses expression GIN indexes (tsvector + pg_trgm) on the
+``product`` table itself. In both cases the index follows every insert, update
+and delete of a product without any extra calls from the routers.
+
+``product`` has a text primary key, so its implicit rowid may be renumbered by
+VACUUM. The FTS rows are therefore keyed on the product id: ``product_fts_key``
+maps each id to the FTS rowid with a declared INTEGER PRIMARY KEY, which VACUUM
+keeps, and the triggers find a product's FTS row through its unique id index.
+"""
+import re
+from typing import List
+
+from sqlalchemy import Float, String, event, func, or_, case, literal, text
+from sqlmodel import Session, SQLModel, col
+
+from models import Product
+
+FTS_TABLE = "product_fts"
+KEY_TABLE = "product_fts_key"
+
+# Column weights for bm25(): product_id, name, part_numbers, description
+_SQLITE_RANK = f"bm25({FTS_TABLE}, 0.0, 10.0, 20.0, 1.0)"
+
+_SQLITE_PART_NUMBERS = (
+    "replace(coalesce({row}.detail_number, '') || ' ' || "
+    "coalesce({row}.cross_number, ''), '-', '')"
+)
+
+_SQLITE_FTS_ROWID = f"(SELECT fts_rowid FROM {KEY_TABLE} WHERE product_id = {{row}}.id)"
+
+_SQLITE_INSERT_ROW = (
+    f"INSERT INTO {FTS_TABLE} (rowid, product_id, name, part_numbers, description) "
+    "VALUES (" + _SQLITE_FTS_ROWID + ", {row}.id, {row}.name, " + _SQLITE_PART_NUMBERS + ", {row}.description);"
+)
+
+_SQLITE_DELETE_ROW = f"DELETE FROM {FTS_TABLE} WHERE rowid = " + _SQLITE_FTS_ROWID + ";"
+
+SQLITE_DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {KEY_TABLE} (
+        fts_rowid INTEGER PRIMARY KEY,
+        product_id VARCHAR NOT NULL UNIQUE
+    )
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        product_id UNINDEXED,
+        name,
+        part_numbers,
+        description,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_fts_ai AFTER INSERT ON product BEGIN
+        INSERT INTO {KEY_TABLE} (product_id) VALUES (new.id);
+        {_SQLITE_INSERT_ROW.format(row="new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_fts_au
+    AFTER UPDATE OF id, name, detail_number, cross_number, description ON product BEGIN
+        {_SQLITE_DELETE_ROW.format(row="old")}
+        UPDATE {KEY_TABLE} SET product_id = new.id WHERE product_id = old.id;
+        {_SQLITE_INSERT_ROW.format(row="new")}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS product_fts_ad AFTER DELETE ON product BEGIN
+        {_SQLITE_DELETE_ROW.format(row="old")}
+        DELETE FROM {KEY_TABLE} WHERE product_id = old.id;
+    END
+    """,
+]
+
+SQLITE_REBUILD = [
+    f"DELETE FROM {FTS_TABLE}",
+    f"DELETE FROM {KEY_TABLE}",
+    f"INSERT INTO {KEY_TABLE} (product_id) SELECT id FROM product",
+    f"""
+    INSERT INTO {FTS_TABLE} (rowid, product_id, name, part_numbers, description)
+    SELECT {KEY_TABLE}.fts_rowid, product.id, product.name,
+           {_SQLITE_PART_NUMBERS.format(row="product")}, product.description
+    FROM product JOIN {KEY_TABLE} ON {KEY_TABLE}.product_id = product.id
+    """,
+]
+
+# Triggers of the first layout, which keyed FTS rows on product.rowid
+_SQLITE_LEGACY_DROP = [
+    "DROP TRIGGER IF EXISTS product_fts_ai",
+    "DROP TRIGGER IF EXISTS product_fts_au",
+    "DROP TRIGGER IF EXISTS product_fts_ad",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# The expressions below must stay identical to the ones used in
+# _postgres_document()/_postgres_numbers() so the planner can use the indexes.
+POSTGRES_DDL = [
+    """
+    CREATE INDEX IF NOT EXISTS ix_product_search_document ON product
+    USING GIN (to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(description, '')))
+    """,
+]
+
+POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE INDEX IF NOT EXISTS ix_product_search_numbers ON product
+    USING GIN (lower(replace(coalesce(detail_number, '') || ' ' || coalesce(cross_number, ''), '-', '')) gin_trgm_ops)
+    """,
+]
+
+
+def _table_exists(connection, name: str) -> bool:
+    row = connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (name,),
+    ).first()
+    return row is not None
+
+
+def _fts_table_exists(connection) -> bool:
+    return _table_exists(connection, FTS_TABLE)
+
+
+def install_search_index(connection):
+    """Create the search index for the connected database and backfill it if new."""
+    dialect = connection.dialect.name
+    if dialect == "sqlite":
+        existed = _fts_table_exists(connection)
+        if existed and not _table_exists(connection, KEY_TABLE):
+            # Re-create with id-keyed triggers; the old ones cannot be altered
+            for stmt in _SQLITE_LEGACY_DROP:
+                connection.exec_driver_sql(stmt)
+            existed = False
+        try:
+            for stmt in SQLITE_DDL:
+                connection.exec_driver_sql(stmt)
+        except Exception as e:
+            # SQLite builds without FTS5 fall back to plain LIKE search
+            print(f"Could not create FTS5 search index: {e}")
+            return
+        if not existed:
+            for stmt in SQLITE_REBUILD:
+                connection.exec_driver_sql(stmt)
+    elif dialect == "postgresql":
+        for stmt in POSTGRES_DDL:
+            connection.exec_driver_sql(stmt)
+        try:
+            with connection.begin_nested():
+                for stmt in POSTGRES_TRGM_DDL:
+                    connection.exec_driver_sql(stmt)
+        except Exception as e:
+            # pg_trgm needs extension privileges; full-text search still works without it
+            print(f"Could not enable pg_trgm part-number index: {e}")
+
+
+def rebuild_search_index(connection):
+    """Re-populate the SQLite FTS table from scratch (e.g. after rows were written with triggers off)."""
+    if connection.dialect.name == "sqlite" and _fts_table_exists(connection):
+        for stmt in SQLITE_REBUILD:
+            connection.exec_driver_sql(stmt)
+
+
+def _drop_search_index(connection):
+    if connection.dialect.name == "sqlite":
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {KEY_TABLE}")
+
+
+@event.listens_for(SQLModel.metadata, "after_create")
+def _after_create(target, connection, **kw):
+    install_search_index(connection)
+
+
+@event.listens_for(SQLModel.metadata, "before_drop")
+def _before_drop(target, connection, **kw):
+    _drop_search_index(connection)
+
+
+def _search_terms(search: str) -> List[str]:
+    return re.findall(r"\w+", search.lower())
+
+
+def _compact_number(search: str) -> str:
+    return re.sub(r"[\s\-]+", "", search.lower())
+
+
+def _like_escape(value: str) -> str:
+    # Literal substring for LIKE ... ESCAPE '\\'
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _fts_quote(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def build_fts_query(search: str) -> str:
+    """
+    Translate free text into an FTS5 MATCH expression.
+
+    Every word must match as a prefix anywhere in the document; in addition the
+    whole input with dashes/spaces removed is matched as a prefix against the
+    normalized part numbers, so "1084168-00" finds "1084168-00-E".
+    """
+    terms = _search_terms(search)
+    clauses = []
+    if terms:
+        clauses.append(" AND ".join(f"{_fts_quote(t)}*" for t in terms))
+    compact = _compact_number(search)
+    if compact and [compact] != terms:
+        clauses.append(f"part_numbers : {_fts_quote(compact)}*")
+    return " OR ".join(f"({clause})" for clause in clauses)
+
+
+def _postgres_document():
+    return func.to_tsvector(
+        literal("simple"),
+        func.coalesce(Product.name, literal("")) + literal(" ") + func.coalesce(Product.description, literal("")),
+    )
+
+
+def _postgres_numbers():
+    return func.lower(
+        func.replace(
+            func.coalesce(Product.detail_number, literal(""))
+            + literal(" ")
+            + func.coalesce(Product.cross_number, literal("")),
+            literal("-"),
+            literal(""),
+        )
+    )
+
+
+def _apply_sqlite_search(query, search: str):
+    match = build_fts_query(search)
+    if not match:
+        return query
+    hits = (
+        text(
+            f"SELECT product_id, {_SQLITE_RANK} AS rank FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH :match"
+        )
+        .bindparams(match=match)
+        .columns(product_id=String, rank=Float)
+        .subquery("search_hits")
+    )
+    return query.join(hits, hits.c.product_id == Product.id).order_by(hits.c.rank.asc())
+
+
+def _apply_postgres_search(query, search: str):
+    terms = _search_terms(search)
+    compact = _compact_number(search)
+    document = _postgres_document()
+    numbers = _postgres_numbers()
+    conditions = []
+    rank = literal(0.0)
+    if terms:
+        ts_query = func.to_tsquery(literal("simple"), " & ".join(f"{t}:*" for t in terms))
+        conditions.append(document.op("@@")(ts_query))
+        rank = rank + func.ts_rank(document, ts_query)
+    if compact:
+        number_match = numbers.like(f"%{_like_escape(compact)}%", escape="\\")
+        conditions.append(number_match)
+        rank = rank + case((number_match, 1.0), else_=0.0)
+    if not conditions:
+        return query
+    return query.where(or_(*conditions)).order_by(rank.desc())
+
+
+def _apply_like_search(query, search: str):
+    search_term = f"%{_like_escape(search)}%"
+    search_term_clean = f"%{_like_escape(search.replace('-', ''))}%"
+    return query.where(
+        or_(
+            col(Product.name).ilike(search_term, escape="\\"),
+            func.replace(Product.detail_number, "-", "").ilike(search_term_clean, escape="\\"),
+            col(Product.cross_number).ilike(search_term_clean, escape="\\"),
+            col(Product.description).ilike(search_term_clean, escape="\\"),
+        )
+    )
+
+
+def apply_product_search(session: Session, query, search: str):
+    """
+    Restrict a ``select(Product)`` to rows matching ``search`` and order them by
+    relevance. Any other filters and sort keys on ``query`` are kept, so callers
+    can add their usual ordering after this as a tie-breaker.
+    """
+    connection = session.connection()
+    dialect = connection.dialect.name
+    if dialect == "sqlite" and _fts_table_exists(connection):
+        return _apply_sqlite_search(query, search)
+    if dialect == "postgresql":
+        return _apply_postgres_search(query, search)
+    return _apply_like_search(query, search)
@@ -0,0 +1,84 @@
+"""
+Process-wide cache of the ``Settings`` key/value table.
+
+The table holds a handful of rows that change a few times a month, so each
+worker loads all of them once into a ``SiteSettings`` snapshot. Writers call
+``settings_changed`` before committing and ``reload_settings`` afterwards: the
+writing worker sees the change immediately and the other workers notice the
+bumped ``settings`` counter within ``SETTINGS_RECHECK_SECONDS``.
+"""
+import os
+from typing import Dict, NamedTuple, Optional
+
+from sqlalchemy import select
+from sqlmodel import Session
+
+from models import Settings
+from services.versioning import SETTINGS, VersionedCache, bump_version
+
+DEFAULT_EXCHANGE_RATE = 40.0
+DEFAULT_PRICE_ROUNDING = 0.01
+
+SETTINGS_RECHECK_SECONDS = float(os.getenv("SETTINGS_RECHECK_SECONDS", "5"))
+
+
+def _parse_positive(value: Optional[str], default: float) -> float:
+    if value:
+        try:
+            number = float(value)
+            if number > 0:
+                return number
+        except (ValueError, TypeError):
+            pass
+    return default
+
+
+class SiteSettings(NamedTuple):
+    exchange_rate: float
+    price_rounding: float
+    email_footer: str
+    instagram_link: str
+    telegram_link: str
+    viber_link: str
+    telegram_bot_token: Optional[str]
+    telegram_chat_id: Optional[str]
+    values: Dict[str, str]
+
+    @classmethod
+    def from_values(cls, values: Dict[str, str]) -> "SiteSettings":
+        return cls(
+            exchange_rate=_parse_positive(values.get("exchange_rate"), DEFAULT_EXCHANGE_RATE),
+            price_rounding=_parse_positive(values.get("price_rounding"), DEFAULT_PRICE_ROUNDING),
+            email_footer=values.get("email_footer") or "",
+            instagram_link=values.get("instagram_link") or "",
+            telegram_link=values.get("telegram_link") or "",
+            viber_link=values.get("viber_link") or "",
+            telegram_bot_token=values.get("telegram_bot_token"),
+            telegram_chat_id=values.get("telegram_chat_id"),
+            values=values,
+        )
+
+
+_settings = VersionedCache(SETTINGS, max_entries=1, recheck_seconds=SETTINGS_RECHECK_SECONDS)
+
+
+def load_settings(session: Session) -> SiteSettings:
+    """Read settings straight from the database, bypassing the cache (sees uncommitted writes)."""
+    table = Settings.__table__
+    rows = session.connection().execute(select(table.c.key, table.c.value)).all()
+    return SiteSettings.from_values({key: value for key, value in rows})
+
+
+def get_settings(session: Session) -> SiteSettings:
+    """Current settings snapshot; only touches the database when the cache is stale."""
+    return _settings.get(session, "settings", lambda: load_settings(session))
+
+
+def settings_changed(session: Session):
+    """Call before committing a write to the ``Settings`` table."""
+    bump_version(session, SETTINGS)
+
+
+def reload_settings():
+    """Drop this worker's snapshot after a commit so the next read sees the new values."""
+    _settings.clear()
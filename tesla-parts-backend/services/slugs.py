@@ -0,0 +1,92 @@
+import re
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+from sqlmodel import Session, select, or_, col
+
+from models import Category
+from services.versioning import CATALOG, VersionedCache
+
+
+def slugify(value: Optional[str]) -> str:
+    """
+    Simple slugify implementation matching frontend logic (utils/slugify.ts):
+    lowercase, trim, replace whitespace runs with dashes.
+    """
+    if not value:
+        return ""
+    value = value.lower().strip()
+    return re.sub(r"\s+", "-", value)
+
+
+def unique_slug(session: Session, model, name: str, exclude_id: Optional[int] = None) -> str:
+    """Slug for ``name`` that is free in ``model``'s table, suffixed -2, -3... on collision."""
+    base = slugify(name) or model.__tablename__
+    stmt = select(model.slug).where(
+        or_(model.slug == base, col(model.slug).startswith(f"{base}-", autoescape=True))
+    )
+    if exclude_id is not None:
+        stmt = stmt.where(model.id != exclude_id)
+    taken = set(session.exec(stmt).all())
+    return _first_free(base, taken)
+
+
+def unique_slugs(session: Session, model, names: Sequence[str]) -> List[str]:
+    """``unique_slug`` for many new rows at once: free in the table and distinct from each other."""
+    bases = [slugify(name) or model.__tablename__ for name in names]
+    distinct = list(dict.fromkeys(bases))
+    taken = set()
+    # A few bases per query keeps the OR list and its parameters small
+    for start in range(0, len(distinct), 100):
+        conditions = []
+        for base in distinct[start:start + 100]:
+            conditions += [model.slug == base, col(model.slug).startswith(f"{base}-", autoescape=True)]
+        taken.update(session.exec(select(model.slug).where(or_(*conditions))).all())
+    slugs = []
+    for base in bases:
+        slug = _first_free(base, taken)
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def _first_free(base: str, taken) -> str:
+    if base not in taken:
+        return base
+    suffix = 2
+    while f"{base}-{suffix}" in taken:
+        suffix += 1
+    return f"{base}-{suffix}"
+
+
+class CategoryRef(NamedTuple):
+    id: int
+    name: str
+
+
+_category_slugs = VersionedCache(CATALOG)
+
+
+def _load_category_slugs(session: Session) -> Dict[str, CategoryRef]:
+    rows = session.exec(select(Category.slug, Category.id, Category.name)).all()
+    return {
+        row_slug: CategoryRef(row_id, row_name)
+        for row_slug, row_id, row_name in rows
+        if row_slug
+    }
+
+
+def resolve_category_slug(
+    session: Session, slug: str, catalog_version: Optional[int] = None
+) -> Optional[CategoryRef]:
+    """
+    Look up a category by slug in the in-process map.
+
+    The map is rebuilt only after the catalog version moves, which every
+    category write bumps, so all workers pick up renames on their next request.
+    Pass the ``catalog_version`` the request already read (``catalog_etag``) and
+    a warm lookup runs no query at all.
+    """
+    slugs = _category_slugs.get(
+        session, "slugs", lambda: _load_category_slugs(session), version=catalog_version
+    )
+    return slugs.get(slug)
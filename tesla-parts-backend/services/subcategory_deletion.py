@@ -0,0 +1,62 @@
+"""
+Deleting subcategories with a few set-based statements.
+
+The nodes to delete are given as one condition on the subcategory table: a
+``path`` range for a subtree (``subcategory_paths.in_subtree``) or the
+``category_id`` of a category being removed. ``has_products`` answers "is any
+product assigned or linked to any of them" with a single EXISTS query, and
+``delete_subcategories`` removes their product links and the nodes with one
+DELETE each, however large the tree is, and releases their image references.
+Parents and children go in the same statement, so ``parent_id`` needs no
+clearing first.
+"""
+from sqlalchemy import delete, exists, or_, select
+from sqlmodel import Session
+
+from models import Product, ProductSubcategoryLink, Subcategory
+from services.image_store import release
+
+_table = Subcategory.__table__
+
+
+def _node_ids(condition):
+    return select(_table.c.id).where(condition)
+
+
+def has_products(session: Session, condition) -> bool:
+    """True when a product is placed in or linked to any subcategory matching ``condition``."""
+    nodes = _node_ids(condition)
+    products = Product.__table__
+    links = ProductSubcategoryLink.__table__
+    return bool(session.connection().execute(
+        select(or_(
+            exists().where(products.c.subcategory_id.in_(nodes)),
+            exists().where(links.c.subcategory_id.in_(nodes)),
+        ))
+    ).scalar())
+
+
+def delete_subcategories(session: Session, condition) -> int:
+    """
+    Delete the subcategories matching ``condition`` and their product links.
+    Check ``has_products`` first: products placed in them would block the
+    delete. Returns the number of subcategories deleted; the caller commits.
+    """
+    session.flush()
+    connection = session.connection()
+    rows = connection.execute(select(_table.c.id, _table.c.image).where(condition)).all()
+    if not rows:
+        return 0
+    deleted_ids = {row.id for row in rows}
+    connection.execute(
+        delete(ProductSubcategoryLink).where(ProductSubcategoryLink.subcategory_id.in_(_node_ids(condition)))
+    )
+    deleted = connection.execute(delete(_table).where(condition)).rowcount
+    release(connection, [row.image for row in rows])
+
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Subcategory) and obj.id in deleted_ids:
+            session.expunge(obj)
+        elif isinstance(obj, ProductSubcategoryLink) and obj.subcategory_id in deleted_ids:
+            session.expunge(obj)
+    return deleted
@@ -0,0 +1,126 @@
+"""
+Materialized paths for the subcategory hierarchy.
+
+Every subcategory stores ``path``: the ids from its top-level ancestor down to
+itself, e.g. ``/3/17/42/``. Paths compare byte by byte (``COLLATE "C"`` on
+PostgreSQL), so a whole subtree is one range of the ``path`` index,
+``'/3/17/' <= path < '/3/170'`` (``0`` follows ``/``). "All descendants" and
+"products under this subtree" each take one indexed query, and "is X an
+ancestor of Y" and "ancestors of Y" need none: they are read off the paths.
+
+Paths follow the ORM through mapper events: a new row gets its path right
+after its insert and a changed ``parent_id`` rewrites the paths of the whole
+subtree with one UPDATE. Deleting rows needs nothing. ``rebuild_paths``
+recomputes every path from ``parent_id`` (used by the startup migration).
+"""
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, bindparam, event, func, inspect, literal, select, union, update
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session
+
+from models import Product, ProductSubcategoryLink, Subcategory
+
+SEPARATOR = "/"
+
+_table = Subcategory.__table__
+
+# Rows per executemany batch in ``rebuild_paths``
+_CHUNK_SIZE = 500
+
+
+def child_path(parent_path: Optional[str], subcategory_id: int) -> str:
+    return f"{parent_path or SEPARATOR}{subcategory_id}{SEPARATOR}"
+
+
+def path_ids(path: Optional[str]) -> List[int]:
+    """Ids along ``path``, top-level ancestor first and the node itself last."""
+    return [int(part) for part in (path or "").split(SEPARATOR) if part]
+
+
+def is_ancestor(ancestor: Subcategory, node: Subcategory) -> bool:
+    """True when ``node`` is ``ancestor`` itself or lies anywhere below it."""
+    return bool(ancestor.path and node.path and node.path.startswith(ancestor.path))
+
+
+def in_subtree(path: str, column=None):
+    """SQL condition: ``column`` (default ``Subcategory.path``) lies in the subtree at ``path``, root included."""
+    if column is None:
+        column = _table.c.path
+    return and_(column >= path, column < path[:-1] + chr(ord(SEPARATOR) + 1))
+
+
+def products_in_subtree(path: str):
+    """Subquery of product ids assigned or linked to any subcategory of the subtree at ``path``."""
+    return union(
+        select(Product.id)
+        .join(_table, _table.c.id == Product.subcategory_id)
+        .where(in_subtree(path)),
+        select(ProductSubcategoryLink.product_id)
+        .join(_table, _table.c.id == ProductSubcategoryLink.subcategory_id)
+        .where(in_subtree(path)),
+    )
+
+
+def _parent_path(connection, parent_id: Optional[int]) -> Optional[str]:
+    if parent_id is None:
+        return None
+    return connection.execute(select(_table.c.path).where(_table.c.id == parent_id)).scalar()
+
+
+@event.listens_for(Subcategory, "after_insert")
+def _path_on_insert(mapper, connection, target):
+    # Parents are inserted before their children in a flush, so theirs is set
+    path = child_path(_parent_path(connection, target.parent_id), target.id)
+    connection.execute(update(_table).where(_table.c.id == target.id).values(path=path))
+    set_committed_value(target, "path", path)
+
+
+@event.listens_for(Subcategory, "after_update")
+def _path_on_move(mapper, connection, target):
+    if not inspect(target).attrs.parent_id.history.has_changes():
+        return
+    old_path = target.path
+    new_path = child_path(_parent_path(connection, target.parent_id), target.id)
+    if not old_path or new_path == old_path:
+        return
+    if new_path.startswith(old_path):
+        raise ValueError(f"subcategory {target.id} cannot be moved below itself")
+    connection.execute(
+        update(_table)
+        .where(in_subtree(old_path))
+        .values(path=literal(new_path) + func.substr(_table.c.path, len(old_path) + 1))
+    )
+    session = object_session(target)
+    for obj in list(session.identity_map.values()) if session is not None else [target]:
+        if isinstance(obj, Subcategory) and obj.path and obj.path.startswith(old_path):
+            set_committed_value(obj, "path", new_path + obj.path[len(old_path):])
+
+
+def rebuild_paths(session: Session) -> int:
+    """
+    Recompute every path from ``parent_id`` and write the ones that differ.
+    A parent cycle is cut where it is found and a missing parent makes a
+    top-level node. Returns the number of rows
+    updated; the caller commits.
+    """
+    connection = session.connection()
+    rows = connection.execute(select(_table.c.id, _table.c.parent_id, _table.c.path)).all()
+    parents = {row.id: row.parent_id for row in rows}
+    paths: Dict[int, str] = {}
+    for node_id in parents:
+        chain = []
+        current = node_id
+        while current in parents and current not in paths and current not in chain:
+            chain.append(current)
+            current = parents.get(current)
+        parent_path = paths.get(current)
+        for link in reversed(chain):
+            parent_path = paths[link] = child_path(parent_path, link)
+
+    changed = [{"node_id": row.id, "new_path": paths[row.id]} for row in rows if row.path != paths[row.id]]
+    stmt = update(_table).where(_table.c.id == bindparam("node_id")).values(path=bindparam("new_path"))
+    for start in range(0, len(changed), _CHUNK_SIZE):
+        connection.execute(stmt, changed[start:start + _CHUNK_SIZE])
+    return len(changed)
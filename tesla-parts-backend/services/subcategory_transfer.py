@@ -0,0 +1,163 @@
+"""
+Moving and copying whole subcategory subtrees with set-based statements.
+
+Both treat the subtree as one ``path`` range (``services/subcategory_paths.py``)
+instead of recursing per node and per product, so the number of statements
+does not grow with the size of the branch:
+
+``move_subtree`` changes the category of every node with one UPDATE, moves the
+products' category links with one DELETE and one INSERT ... SELECT, and then
+re-parents the root, which rewrites the subtree's paths with one more UPDATE.
+
+``copy_subtree`` reads the source nodes once, inserts all clones with one
+multi-row INSERT ... RETURNING (counting their image references), sets their
+parents and paths with one
+executemany UPDATE, and copies the product links of every node with one
+INSERT ... SELECT that maps each source node to its clone with a CASE.
+
+Both then rewrite the legacy category strings and UAH prices of the affected
+products with the bulk helpers. The caller validates the target and commits.
+"""
+from typing import List, Optional
+
+from sqlalchemy import bindparam, case, insert, select, union, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlmodel import Session
+
+from models import Product, ProductSubcategoryLink, Subcategory
+from services.image_store import retain
+from services.ordering import SUBCATEGORIES, new_ranks
+from services.pricing import reprice_products
+from services.product_categories import (
+    add_products_to_category,
+    move_products_between_categories,
+    refresh_category_strings,
+)
+from services.slugs import unique_slugs
+from services.subcategory_paths import child_path, in_subtree, is_ancestor, path_ids, products_in_subtree
+
+_table = Subcategory.__table__
+
+# Source nodes per CASE/IN (...) list, keeps SQLite under its bound parameter limit
+_CHUNK_SIZE = 500
+
+# Columns a clone takes over from its source node (the root gets a new rank)
+_COPIED_COLUMNS = ("name", "code", "image", "variants", "sort_order", "rank")
+
+
+def _path_of(connection, subcategory_id: Optional[int]) -> Optional[str]:
+    if subcategory_id is None:
+        return None
+    return connection.execute(select(_table.c.path).where(_table.c.id == subcategory_id)).scalar()
+
+
+def _finish_products(session: Session, product_ids: List[str]):
+    refresh_category_strings(session, product_ids)
+    reprice_products(session, product_ids)
+
+
+def move_subtree(
+    session: Session, subcategory: Subcategory, category_id: int, parent_id: Optional[int]
+) -> List[str]:
+    """
+    Move ``subcategory`` and its descendants under ``parent_id`` in
+    ``category_id``. Returns the ids of the products inside the subtree.
+    """
+    old_category_id = subcategory.category_id
+    session.flush()
+    connection = session.connection()
+    rank = subcategory.rank
+    if (category_id, parent_id) != (old_category_id, subcategory.parent_id):
+        # Last among the new siblings; its old key means nothing there
+        rank = new_ranks(session, SUBCATEGORIES, (category_id, parent_id))[0]
+    connection.execute(
+        update(_table).where(in_subtree(subcategory.path)).values(category_id=category_id)
+    )
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Subcategory) and is_ancestor(subcategory, obj):
+            set_committed_value(obj, "category_id", category_id)
+
+    product_ids = list(connection.execute(products_in_subtree(subcategory.path)).scalars())
+    move_products_between_categories(session, product_ids, old_category_id, category_id)
+    _finish_products(session, product_ids)
+
+    subcategory.parent_id = parent_id
+    subcategory.rank = rank
+    session.add(subcategory)
+    session.flush()  # The path event rewrites the subtree's paths
+    return product_ids
+
+
+def copy_subtree(
+    session: Session, source: Subcategory, category_id: int, parent_id: Optional[int]
+) -> int:
+    """
+    Clone ``source`` and its descendants under ``parent_id`` in
+    ``category_id``, each clone linked to the products of its source node.
+    Returns the id of the new root.
+    """
+    session.flush()
+    connection = session.connection()
+    # Ordered by path: parents before children
+    nodes = connection.execute(
+        select(_table).where(in_subtree(source.path)).order_by(_table.c.path)
+    ).all()
+
+    slugs = unique_slugs(session, Subcategory, [node.name for node in nodes])
+    # The copy goes last among its new siblings, descendants keep their relative order
+    root_rank = new_ranks(session, SUBCATEGORIES, (category_id, parent_id))[0]
+    # Slugs are unique, so they pair the returned ids with their sources
+    # (asking for rows in parameter order makes SQLite insert one at a time)
+    id_by_slug = dict(connection.execute(
+        insert(_table).returning(_table.c.slug, _table.c.id),
+        [
+            {
+                **{column: getattr(node, column) for column in _COPIED_COLUMNS},
+                "slug": slug,
+                "category_id": category_id,
+                **({"rank": root_rank} if node.id == source.id else {}),
+            }
+            for node, slug in zip(nodes, slugs)
+        ],
+    ).all())
+    clone_of = {node.id: id_by_slug[slug] for node, slug in zip(nodes, slugs)}
+    # Core inserts skip the mapper events that count image references
+    retain(connection, [node.image for node in nodes])
+
+    # Source path /.../root/a/b/ becomes <parent path>/clone(root)/clone(a)/clone(b)/
+    root_depth = len(path_ids(source.path)) - 1
+    new_root_path = child_path(_path_of(connection, parent_id), clone_of[source.id])
+    placement = []
+    for node in nodes:
+        path = new_root_path
+        for ancestor_id in path_ids(node.path)[root_depth + 1:]:
+            path = child_path(path, clone_of[ancestor_id])
+        placement.append({
+            "node_id": clone_of[node.id],
+            "new_parent_id": parent_id if node.id == source.id else clone_of[node.parent_id],
+            "new_path": path,
+        })
+    connection.execute(
+        update(_table)
+        .where(_table.c.id == bindparam("node_id"))
+        .values(parent_id=bindparam("new_parent_id"), path=bindparam("new_path")),
+        placement,
+    )
+
+    products = Product.__table__
+    links = ProductSubcategoryLink.__table__
+    source_ids = list(clone_of)
+    for start in range(0, len(source_ids), _CHUNK_SIZE):
+        chunk = {source_id: clone_of[source_id] for source_id in source_ids[start:start + _CHUNK_SIZE]}
+        members = union(
+            select(products.c.id, case(chunk, value=products.c.subcategory_id))
+            .where(products.c.subcategory_id.in_(chunk)),
+            select(links.c.product_id, case(chunk, value=links.c.subcategory_id))
+            .where(links.c.subcategory_id.in_(chunk)),
+        )
+        connection.execute(insert(links).from_select(["product_id", "subcategory_id"], members))
+
+    product_ids = list(connection.execute(products_in_subtree(new_root_path)).scalars())
+    add_products_to_category(session, product_ids, category_id)
+    _finish_products(session, product_ids)
+    return clone_of[source.id]
@@ -1,18 +1,15 @@
 import requests
-from models import Order, Product, Settings
+from models import Order, Product
 from sqlmodel import Session
 from database import engine
-from services.pricing import get_exchange_rate
-
-def _get_setting_value(session: Session, key: str) -> str | None:
-    setting = session.get(Settings, key)
-    return setting.value if setting else None
+from services.site_settings import get_settings
 
 def send_telegram_notification(order: Order):
     with Session(engine) as session:
-        bot_token = _get_setting_value(session, "telegram_bot_token")
-        chat_id = _get_setting_value(session, "telegram_chat_id")
-        rate = get_exchange_rate(session)
+        settings = get_settings(session)
+        bot_token = settings.telegram_bot_token
+        chat_id = settings.telegram_chat_id
+        rate = settings.exchange_rate
 
         if not bot_token or not chat_id or "YOUR_" in bot_token:
             print("Telegram credentials not set, skipping notification")
@@ -0,0 +1,133 @@
+"""
+Monotonic version counters stored in the ``cacheversion`` table.
+
+Writers bump a counter inside the same transaction as their change; readers
+compare it with the version their cached data was built from. Because the
+counter lives in the database, every uvicorn/gunicorn worker sees the bump.
+Reads and bumps go through Core statements so they stay cheap on hot paths.
+"""
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from sqlalchemy import select, update, insert
+from sqlmodel import Session
+
+from models import CacheVersion
+
+CATALOG = "catalog"
+SETTINGS = "settings"
+
+_table = CacheVersion.__table__
+
+
+def get_version(session: Session, name: str) -> int:
+    row = session.connection().execute(
+        select(_table.c.version).where(_table.c.name == name)
+    ).first()
+    return row[0] if row else 0
+
+
+def bump_version(session: Session, name: str):
+    """Increment a counter as part of the session's current transaction."""
+    connection = session.connection()
+    result = connection.execute(
+        update(_table).where(_table.c.name == name).values(version=_table.c.version + 1)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(_table).values(name=name, version=1))
+
+
+def bump_catalog_version(session: Session):
+    """Call before committing any write that changes data served by public catalog endpoints."""
+    bump_version(session, CATALOG)
+
+
+def ensure_versions(session: Session, *names: str):
+    """Seed counters so concurrent first bumps never race on the insert."""
+    for name in names:
+        if session.get(CacheVersion, name) is None:
+            session.add(CacheVersion(name=name, version=0))
+
+
+_caches: "weakref.WeakSet[VersionedCache]" = weakref.WeakSet()
+
+
+class VersionedCache:
+    """
+    Per-process cache whose entries are dropped whenever a version counter moves.
+
+    Values are built by ``loader`` on first use for each key and reused until the
+    counter named ``version_name`` changes in the database. With
+    ``recheck_seconds`` the counter itself is only read once per interval, so a
+    warm cache serves hits without any query; writes made by other workers are
+    then picked up within that interval. Callers that already read the counter
+    in this request (see ``dependencies.catalog_etag``) pass it as ``version``
+    so a hit needs no query either. A version older than the cached one never
+    rolls the cache back.
+    """
+
+    def __init__(
+        self,
+        version_name: str = CATALOG,
+        max_entries: int = 256,
+        recheck_seconds: float = 0,
+    ):
+        self.version_name = version_name
+        self.max_entries = max_entries
+        self.recheck_seconds = recheck_seconds
+        self._version: Optional[int] = None
+        self._checked_at = 0.0
+        self._entries: Dict[Hashable, Any] = {}
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(
+        self,
+        session: Session,
+        key: Hashable,
+        loader: Callable[[], Any],
+        version: Optional[int] = None,
+    ) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            if (
+                self.recheck_seconds
+                and key in self._entries
+                and now - self._checked_at < self.recheck_seconds
+            ):
+                return self._entries[key]
+        if version is None:
+            version = get_version(session, self.version_name)
+        with self._lock:
+            # A version older than the cached one was read before another
+            # request's bump; the newer entries are at least as fresh.
+            if self._version is not None and version <= self._version and key in self._entries:
+                if version == self._version:
+                    self._checked_at = now
+                return self._entries[key]
+        value = loader()
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return value
+            if version != self._version:
+                self._entries = {}
+                self._version = version
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[key] = value
+            self._checked_at = now
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._checked_at = 0.0
+            self._entries = {}
+
+
+def clear_version_caches():
+    """Drop every VersionedCache in this process (used when the database is reset, e.g. in tests)."""
+    for cache in list(_caches):
+        cache.clear()
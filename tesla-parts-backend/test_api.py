@@ -1,11 +1,17 @@
+import asyncio
+import csv
+import hashlib
+import io
+import json
 import pytest
 from fastapi.testclient import TestClient
 from main import app
-from models import Product, Order, OrderItem, Settings, User
-from sqlmodel import Session, SQLModel, create_engine
+from models import Category, ImageBlob, Product, Order, OrderItem, Settings, User
+from sqlmodel import Session, SQLModel, create_engine, select
 from sqlmodel.pool import StaticPool
 from database import get_session
 from auth import create_access_token, get_password_hash
+from services.versioning import clear_version_caches
 
 # Use in-memory DB for tests
 sqlite_url = "sqlite:///:memory:"
@@ -25,6 +31,7 @@ client = TestClient(app)
 @pytest.fixture(name="session")
 def session_fixture():
     create_db_and_tables()
+    clear_version_caches()
     with Session(engine) as session:
         admin_user = User(
             username="admin",
@@ -48,7 +55,7 @@ def test_create_product(session: Session):
     product_data = {
         "id": "test-1",
         "name": "Test Product",
-        "category": "Test",
+        "category": "",
         "priceUAH": "400.0",
         "priceUSD": "10.0",
         "image": "http://example.com/image.png",
@@ -68,7 +75,7 @@ def test_create_order(session: Session):
     product_data = {
         "id": "test-1",
         "name": "Test Product",
-        "category": "Test",
+        "category": "",
         "priceUAH": "100.0",
         "priceUSD": "0.0",
         "image": "http://example.com/image.png",
@@ -137,3 +144,927 @@ def test_update_social_links(session: Session):
     data = response.json()
     assert data["instagram"] == "new_insta"
     assert data["telegram"] == "new_tele"
+
+def _create_product(**overrides):
+    product_data = {
+        "name": "Test Product",
+        "category": "",
+        "priceUAH": "400.0",
+        "priceUSD": "10.0",
+        "description": "Test Description",
+        "inStock": "true",
+    }
+    product_data.update(overrides)
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post("/products/", data=product_data, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+def test_search_products(session: Session):
+    bumper = _create_product(id="bumper", name="Front bumper", detail_number="1084168-00-E")
+    _create_product(id="mirror", name="Side mirror", description="Fits front doors", cross_number="1500000-00-A")
+
+    response = client.get("/products/", params={"search": "bump"})
+    assert [p["id"] for p in response.json()] == ["bumper"]
+
+    response = client.get("/products/", params={"search": "108416800"})
+    assert [p["id"] for p in response.json()] == ["bumper"]
+
+    response = client.get("/products/", params={"search": "1500000-00"})
+    assert [p["id"] for p in response.json()] == ["mirror"]
+
+    # Name matches rank above description matches
+    response = client.get("/products/", params={"search": "front"})
+    assert [p["id"] for p in response.json()] == ["bumper", "mirror"]
+
+    # The index follows updates and deletes
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    client.put(
+        f"/products/{bumper['id']}",
+        data={
+            "name": "Rear bumper",
+            "category": "",
+            "priceUAH": "400.0",
+            "priceUSD": "10.0",
+            "description": "Test Description",
+            "inStock": "true",
+        },
+        headers=headers,
+    )
+    assert client.get("/products/", params={"search": "front"}).json()[0]["id"] == "mirror"
+    client.delete("/products/mirror", headers=headers)
+    assert client.get("/products/", params={"search": "1500000"}).json() == []
+
+    # VACUUM or a dump and restore may renumber product rowids; the index rows are keyed on the id
+    _create_product(id="wiper", name="Wiper blade")
+    _create_product(id="handle", name="Door handle")
+    with engine.begin() as conn:
+        conn.exec_driver_sql("UPDATE product SET rowid = -rowid")
+        conn.exec_driver_sql("UPDATE product SET rowid = -rowid - 1")
+    client.put("/products/handle", data={"name": "Trunk handle", "category": "", "priceUAH": "400.0",
+                                         "priceUSD": "10.0", "description": "", "inStock": "true"}, headers=headers)
+    assert [p["id"] for p in client.get("/products/", params={"search": "wiper"}).json()] == ["wiper"]
+    assert [p["id"] for p in client.get("/products/", params={"search": "trunk"}).json()] == ["handle"]
+    assert client.get("/products/", params={"search": "door"}).json() == []
+
+def test_lookup_by_part_number(session: Session):
+    _create_product(id="exact", name="Exact", detail_number="1084168-00-E")
+    _create_product(id="longer", name="Longer", detail_number="1084168-00-EA")
+    _create_product(id="cross", name="Cross", cross_number="1500000-00-A, 1084168 00 E")
+    _create_product(id="other", name="Other", detail_number="2000000-00-B")
+
+    response = client.get("/products/lookup", params={"number": "1084168-00-e"})
+    assert response.status_code == 200
+    ids = [p["id"] for p in response.json()]
+    assert sorted(ids[:2]) == ["cross", "exact"]
+    assert ids[2:] == ["longer"]
+
+    response = client.get("/products/lookup", params={"number": "1500000"})
+    assert [p["id"] for p in response.json()] == ["cross"]
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    client.delete("/products/cross", headers=headers)
+    response = client.get("/products/lookup", params={"number": "15000000"})
+    assert response.json() == []
+
+def test_read_products_cursor_pagination(session: Session):
+    for i in range(5):
+        _create_product(id=f"p{i}", name=f"Part {i}", inStock="true" if i != 2 else "false")
+
+    offset_ids = [p["id"] for p in client.get("/products/", params={"limit": 10}).json()]
+
+    seen = []
+    cursor = ""
+    while True:
+        response = client.get("/products/", params={"limit": 2, "cursor": cursor})
+        assert response.status_code == 200
+        seen.extend(p["id"] for p in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == offset_ids
+
+    response = client.get("/products/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+def _create_category(name, **overrides):
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post("/categories/", data={"name": name, **overrides}, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+def test_category_slugs(session: Session):
+    first = _create_category("Model 3")
+    second = _create_category("Model  3")
+    assert first["slug"] == "model-3"
+    assert second["slug"] == "model-3-2"
+
+    _create_product(id="m3-part", name="Mirror", category="Model 3")
+    response = client.get("/products/", params={"category_slug": "model-3"})
+    assert [p["id"] for p in response.json()] == ["m3-part"]
+
+    # Warm lookups reuse the version the ETag dependency read: one version query per request
+    from sqlalchemy import event
+    executed = []
+    listener = lambda *args: executed.append(args[2])
+    event.listen(engine, "before_cursor_execute", listener)
+    try:
+        for path in ("/products/", "/products/facets", "/products/labels"):
+            assert client.get(path, params={"category_slug": "model-3"}).status_code == 200
+    finally:
+        event.remove(engine, "before_cursor_execute", listener)
+    assert len([sql for sql in executed if "cacheversion" in sql]) == 3
+
+    # Renaming moves the slug and the resolver sees it right away
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.put(f"/categories/{first['id']}", data={"name": "Model S"}, headers=headers)
+    assert response.json()["slug"] == "model-s"
+    assert client.get("/products/", params={"category_slug": "model-3"}).json() == []
+
+def test_product_category_links(session: Session):
+    model_3 = _create_category("Model 3")
+    _create_category("Model 3 Highland")
+    _create_category("Model Y")
+
+    _create_product(id="shared", name="Shared", category="Model Y, Model 3")
+    _create_product(id="highland", name="Highland only", category="Model 3 Highland")
+
+    # "Model 3" is a substring of "Model 3 Highland" but must not match it
+    response = client.get("/products/", params={"category_slug": "model-3"})
+    assert [p["id"] for p in response.json()] == ["shared"]
+    assert response.json()[0]["category"] == "Model Y, Model 3"
+
+    # The legacy string is derived from the links and follows renames
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    client.put(f"/categories/{model_3['id']}", data={"name": "Model 3 2024"}, headers=headers)
+    assert client.get("/products/shared").json()["category"] == "Model Y, Model 3 2024"
+
+    # Names without a category are rejected rather than dropped from the string
+    fields = {"name": "Typo", "priceUAH": "0", "priceUSD": "1", "description": "", "inStock": "true"}
+    response = client.post("/products/", data={**fields, "id": "typo", "category": "Model Y, Modle 3, Model Z"}, headers=headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown category: Modle 3, Model Z"
+    assert client.get("/products/typo").status_code == 404
+    response = client.put("/products/shared", data={**fields, "category": "Model Y, Modle 3"}, headers=headers)
+    assert response.status_code == 400
+    assert client.get("/products/shared").json()["category"] == "Model Y, Model 3 2024"
+
+def _create_subcategory(category_id, name, parent_id=None):
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    data = {"name": name}
+    if parent_id is not None:
+        data["parent_id"] = str(parent_id)
+    response = client.post(f"/categories/{category_id}/subcategories/", data=data, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+def test_product_facets(session: Session):
+    model_3 = _create_category("Model 3")
+    body = _create_subcategory(model_3["id"], "Body")
+    doors = _create_subcategory(model_3["id"], "Doors", parent_id=body["id"])
+    lights = _create_subcategory(model_3["id"], "Lights")
+
+    _create_product(id="door", name="Door handle", category="Model 3", subcategory_id=str(doors["id"]),
+                    subcategory_ids=[str(body["id"])])
+    _create_product(id="lamp", name="Lamp", category="Model 3", subcategory_id=str(lights["id"]),
+                    inStock="false", is_popular="true")
+    _create_product(id="loose", name="Loose door seal", category="")
+
+    facets = client.get("/products/facets").json()
+    assert facets["total"] == {"product_count": 3, "in_stock_count": 2}
+    assert facets["popular"] == {"product_count": 1, "in_stock_count": 0}
+    assert facets["categories"] == {str(model_3["id"]): {"product_count": 2, "in_stock_count": 1}}
+    # Descendants count towards their ancestors, a product linked twice counts once
+    assert facets["subcategories"][str(body["id"])] == {"product_count": 1, "in_stock_count": 1}
+    assert facets["subcategories"][str(doors["id"])] == {"product_count": 1, "in_stock_count": 1}
+    assert facets["subcategories"][str(lights["id"])] == {"product_count": 1, "in_stock_count": 0}
+
+    # Same filters as the listing
+    facets = client.get("/products/facets", params={"search": "door"}).json()
+    assert facets["total"]["product_count"] == 2
+    assert facets["categories"] == {str(model_3["id"]): {"product_count": 1, "in_stock_count": 1}}
+    assert client.get("/products/facets", params={"subcategory_id": lights["id"]}).json()["total"] == {
+        "product_count": 1, "in_stock_count": 0
+    }
+    assert client.get("/products/facets", params={"category_slug": "nope"}).json()["total"]["product_count"] == 0
+
+    # Cached per catalog version
+    _create_product(id="door-2", name="Door hinge", category="Model 3", subcategory_id=str(doors["id"]))
+    facets = client.get("/products/facets").json()
+    assert facets["subcategories"][str(body["id"])]["product_count"] == 2
+
+def test_reorder_and_move_after(session: Session):
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    for product_id in ("a", "b", "c", "d"):
+        _create_product(id=product_id, name=product_id.upper())
+
+    def product_order():
+        return [p["id"] for p in client.get("/products/").json()]
+
+    assert client.post("/products/reorder", json={"product_ids": ["d", "c", "b", "a"]}, headers=headers).status_code == 200
+    assert product_order() == ["d", "c", "b", "a"]
+    # A rank key fits between any two neighbours, so moving one product rewrites only its row
+    before = {p.id: p.rank for p in session.exec(select(Product)).all()}
+    response = client.post("/products/a/move-after", json={"after_id": "d"}, headers=headers)
+    assert response.status_code == 200
+    assert product_order() == ["d", "a", "c", "b"]
+    session.expire_all()
+    after = {p.id: p.rank for p in session.exec(select(Product)).all()}
+    assert [pid for pid in after if after[pid] != before[pid]] == ["a"]
+    assert client.post("/products/b/move-after", json={"after_id": None}, headers=headers).status_code == 200
+    assert product_order() == ["b", "d", "a", "c"]
+
+    category = _create_category("Model Y")
+    first, second, third = (_create_subcategory(category["id"], name)["id"] for name in ("One", "Two", "Three"))
+
+    def subcategory_order():
+        return [s["id"] for s in client.get(f"/categories/{category['id']}").json()["subcategories"]]
+
+    response = client.post("/categories/subcategories/reorder",
+                           json={"subcategory_ids": [first, second, third]}, headers=headers)
+    assert response.status_code == 200
+    assert subcategory_order() == [first, second, third]
+    client.post(f"/categories/subcategories/{first}/move-after", json={"after_id": third}, headers=headers)
+    assert subcategory_order() == [second, third, first]
+    other = _create_category("Model X")
+    stranger = _create_subcategory(other["id"], "Elsewhere")["id"]
+    response = client.post(f"/categories/subcategories/{first}/move-after", json={"after_id": stranger}, headers=headers)
+    assert response.status_code == 404
+
+def test_rank_keys_rebalance_when_too_long(session: Session, monkeypatch):
+    from services import ordering
+    from services.ranks import MAX_RANK_LENGTH
+
+    # Run the background rebalance inline
+    monkeypatch.setattr(ordering._rebalancer, "submit", lambda fn, *args: fn(*args))
+    first, second, third = (_create_category(name)["id"] for name in ("First", "Second", "Third"))
+    longest = 0
+    for step in range(80):
+        # Keep splitting the same gap right after the first category
+        moved = second if step % 2 else third
+        ordering.move_after(session, ordering.CATEGORIES, moved, first)
+        longest = max(longest, len(session.get(Category, moved).rank))
+        session.commit()
+    assert longest > MAX_RANK_LENGTH
+    session.expire_all()
+    ranks = {category.id: category.rank for category in session.exec(select(Category)).all()}
+    assert max(len(rank) for rank in ranks.values()) <= MAX_RANK_LENGTH
+    assert [c["id"] for c in client.get("/categories/").json()] == [first, second, third]
+
+    # Products share one group: only the neighbourhood of the long key is rewritten
+    from services.ranks import spread_ranks
+    ids = [f"p{index:03}" for index in range(100)]
+    session.execute(Product.__table__.insert(), [
+        {"id": pid, "name": pid, "category": "", "priceUAH": 0.0, "priceUSD": 1.0,
+         "image": "", "description": "", "inStock": True, "rank": key}
+        for pid, key in zip(ids, spread_ranks(len(ids)))
+    ])
+    session.commit()
+    before = dict(session.exec(select(Product.id, Product.rank)).all())
+    longest = 0
+    for step in range(80):
+        moved = ordering.move_after(session, ordering.PRODUCTS, "p051" if step % 2 else "p052", "p050")
+        longest = max(longest, len(moved.rank))
+        session.commit()
+    assert longest > MAX_RANK_LENGTH
+    after = dict(session.exec(select(Product.id, Product.rank)).all())
+    assert max(len(rank) for rank in after.values()) <= MAX_RANK_LENGTH
+    assert sorted(after, key=after.get) == ids
+    unchanged = [pid for pid in ids if after[pid] == before[pid]]
+    assert "p000" in unchanged and "p099" in unchanged and len(unchanged) > 50, len(unchanged)
+
+    # Rows that no longer hold the key read before are not overwritten
+    assert ordering.apply_ranks(session, Product, {"p000": "0001"}, expected={"p000": "stale"}) == 0
+    session.rollback()
+
+def test_category_tree_uses_constant_queries(session: Session):
+    from sqlalchemy import event
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    category = _create_category("Model 3")
+
+    def statements_for_update():
+        executed = []
+        listener = lambda *args: executed.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.put(f"/categories/{category['id']}", data={"name": "Model 3"}, headers=headers)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 200
+        return response.json(), len(executed)
+
+    parent = _create_subcategory(category["id"], "Body")
+    child = _create_subcategory(category["id"], "Doors", parent_id=parent["id"])
+    _create_product(id="door", name="Door", category="Model 3", subcategory_id=str(child["id"]),
+                    subcategory_ids=[str(parent["id"])])
+    small_tree, small_count = statements_for_update()
+    assert [sub["name"] for sub in small_tree["subcategories"]] == ["Body"]
+    body = small_tree["subcategories"][0]
+    assert [p["id"] for p in body["products"]] == ["door"]
+    assert [p["id"] for p in body["subcategories"][0]["products"]] == ["door"]
+
+    for index in range(10):
+        sub = _create_subcategory(category["id"], f"Sub {index}", parent_id=parent["id"])
+        _create_product(id=f"p{index}", name=f"Part {index}", category="Model 3", subcategory_id=str(sub["id"]))
+    large_tree, large_count = statements_for_update()
+    assert len(large_tree["subcategories"][0]["subcategories"]) == 11
+    assert large_count == small_count
+
+def test_subcategory_tree_index(session: Session):
+    from models import Subcategory
+    from services.category_tree import SubcategoryTree
+
+    category = Category(name="Deep", slug="deep", sort_order=0)
+    session.add(category)
+    session.commit()
+    parent_id = None
+    chain = []
+    for depth in range(100):
+        node = Subcategory(name=f"Level {depth}", category_id=category.id, parent_id=parent_id)
+        session.add(node)
+        session.commit()
+        chain.append(node.id)
+        parent_id = node.id
+    # Siblings come out in rank order, not insertion order
+    late = Subcategory(name="Late", category_id=category.id, parent_id=chain[0], rank="0001")
+    session.add(late)
+    session.commit()
+
+    tree = SubcategoryTree.load(session, category.id)
+    assert [node.id for node in tree.walk()][:3] == [chain[0], late.id, chain[1]]
+    assert tree.subtree_ids(chain[98]) == [chain[98], chain[99]]
+
+    response = client.get(f"/categories/{category.id}")
+    node = response.json()["subcategories"][0]
+    assert [child["name"] for child in node["subcategories"]] == ["Late", "Level 1"]
+    depth = 1
+    while node["subcategories"]:
+        node = node["subcategories"][-1]
+        depth += 1
+    assert depth == 100
+
+def test_move_and_copy_subcategory_updates_categories(session: Session):
+    source = _create_category("Model S")
+    target = _create_category("Model X")
+    doors = _create_subcategory(source["id"], "Doors")
+    handles = _create_subcategory(source["id"], "Handles", parent_id=doors["id"])
+    _create_product(id="handle", name="Handle", category="Model S", subcategory_id=str(handles["id"]))
+    _create_subcategory(target["id"], "Wheels")
+    _create_subcategory(target["id"], "Seats")
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post(
+        f"/categories/subcategories/{doors['id']}/copy",
+        json={"target_category_id": target["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    copied = response.json()
+    assert copied["category_id"] == target["id"]
+    assert copied["subcategories"][0]["products"][0]["id"] == "handle"
+    assert client.get("/products/handle").json()["category"] == "Model S, Model X"
+    # The copy goes after the existing top-level subcategories of the target
+    names = [sub["name"] for sub in client.get(f"/categories/{target['id']}").json()["subcategories"]]
+    assert names == ["Wheels", "Seats", "Doors"]
+
+    response = client.post(
+        f"/categories/subcategories/{doors['id']}/move",
+        json={"target_category_id": target["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert client.get("/products/handle").json()["category"] == "Model X"
+    target_tree = client.get(f"/categories/{target['id']}").json()["subcategories"]
+    assert [(sub["name"], sub["id"] == doors["id"]) for sub in target_tree] == [
+        ("Wheels", False), ("Seats", False), ("Doors", False), ("Doors", True)
+    ]
+    x_products = client.get("/products/", params={"category_slug": "model-x", "subcategory_id": handles["id"]}).json()
+    assert [p["id"] for p in x_products] == ["handle"]
+
+def test_copy_subcategory_into_own_branch(session: Session):
+    from models import Subcategory
+
+    category = _create_category("Model S")
+    body = _create_subcategory(category["id"], "Body")
+    doors = _create_subcategory(category["id"], "Doors", parent_id=body["id"])
+    handles = _create_subcategory(category["id"], "Handles", parent_id=doors["id"])
+    _create_product(id="handle", name="Handle", category="Model S", subcategory_id=str(handles["id"]))
+    _create_product(id="seal", name="Seal", category="Model S", subcategory_id=str(doors["id"]),
+                    subcategory_ids=[str(handles["id"])])
+
+    # The copy lands inside the branch it copies and still covers only the original nodes
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post(
+        f"/categories/subcategories/{body['id']}/copy",
+        json={"target_category_id": category["id"], "target_parent_id": handles["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    copied = response.json()
+    assert copied["slug"] == "body-2"
+    copied_doors = copied["subcategories"][0]
+    copied_handles = copied_doors["subcategories"][0]
+    assert [p["id"] for p in copied_doors["products"]] == ["seal"]
+    assert sorted(p["id"] for p in copied_handles["products"]) == ["handle", "seal"]
+    assert copied_handles["subcategories"] == []
+
+    session.expire_all()
+    clone = session.get(Subcategory, copied_handles["id"])
+    assert clone.path == f"/{body['id']}/{doors['id']}/{handles['id']}/{copied['id']}/{copied_doors['id']}/{clone.id}/"
+
+def test_subcategory_paths(session: Session):
+    from models import Subcategory
+
+    category = _create_category("Model S")
+    other = _create_category("Model X")
+    body = _create_subcategory(category["id"], "Body")
+    doors = _create_subcategory(category["id"], "Doors", parent_id=body["id"])
+    handles = _create_subcategory(category["id"], "Handles", parent_id=doors["id"])
+    lights = _create_subcategory(category["id"], "Lights")
+    trim = _create_subcategory(category["id"], "Trim", parent_id=body["id"])
+    assert session.get(Subcategory, handles["id"]).path == f"/{body['id']}/{doors['id']}/{handles['id']}/"
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post(
+        f"/categories/subcategories/{body['id']}/move",
+        json={"target_category_id": category["id"], "target_parent_id": handles["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+    # Editing a node cannot re-parent it into its own subtree or another category's tree
+    def put_parent(subcategory, parent_id):
+        data = {"name": subcategory["name"], "parent_id": str(parent_id)}
+        return client.put(f"/categories/subcategories/{subcategory['id']}", data=data, headers=headers)
+
+    assert put_parent(body, body["id"]).status_code == 400
+    assert put_parent(body, handles["id"]).status_code == 400
+    assert put_parent(lights, _create_subcategory(other["id"], "Other")["id"]).status_code == 400
+    assert put_parent(lights, 9999).status_code == 404
+    assert put_parent(lights, handles["id"]).status_code == 200
+    session.expire_all()
+    assert session.get(Subcategory, lights["id"]).path == f"/{body['id']}/{doors['id']}/{handles['id']}/{lights['id']}/"
+    assert put_parent(lights, body["id"]).status_code == 200
+    # A new parent puts the node last among its new siblings
+    tree = client.get(f"/categories/{category['id']}").json()["subcategories"]
+    assert [sub["id"] for sub in tree[0]["subcategories"]] == [doors["id"], trim["id"], lights["id"]]
+
+    # Moving rewrites the whole subtree's paths and category
+    response = client.post(
+        f"/categories/subcategories/{doors['id']}/move",
+        json={"target_category_id": other["id"]},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    session.expire_all()
+    moved = session.get(Subcategory, handles["id"])
+    assert moved.path == f"/{doors['id']}/{handles['id']}/"
+    assert moved.category_id == other["id"]
+    assert session.get(Subcategory, lights["id"]).path == f"/{body['id']}/{lights['id']}/"
+
+    assert client.delete(f"/categories/subcategories/{doors['id']}", headers=headers).status_code == 200
+    session.expire_all()
+    assert session.get(Subcategory, handles["id"]) is None
+    assert session.get(Subcategory, body["id"]) is not None
+
+def test_delete_category_checks_whole_tree(session: Session):
+    from models import Subcategory
+
+    category = _create_category("Model S")
+    body = _create_subcategory(category["id"], "Body")
+    doors = _create_subcategory(category["id"], "Doors", parent_id=body["id"])
+    handles = _create_subcategory(category["id"], "Handles", parent_id=doors["id"])
+    _create_product(id="seal", name="Seal", category="Model S", subcategory_ids=[str(handles["id"])])
+
+    # A product linked three levels down blocks both deletes
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    assert client.delete(f"/categories/{category['id']}", headers=headers).status_code == 400
+    assert client.delete(f"/categories/subcategories/{body['id']}", headers=headers).status_code == 400
+
+    assert client.delete("/products/seal", headers=headers).status_code == 200
+    assert client.delete(f"/categories/{category['id']}", headers=headers).status_code == 200
+    session.expire_all()
+    assert session.exec(select(Subcategory)).all() == []
+    assert session.get(Category, category["id"]) is None
+
+def test_catalog_etag(session: Session):
+    _create_product(id="etag-product")
+
+    response = client.get("/products/")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert client.get("/categories/").headers["ETag"] == etag
+
+    response = client.get("/products/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post("/products/etag-product/toggle-popular", headers=headers)
+    assert response.status_code == 200
+    response = client.get("/products/etag-product", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_settings_cache_refreshes_on_update(session: Session):
+    _create_product(id="priced", priceUSD="10.0")
+    assert client.get("/products/priced").json()["priceUAH"] == 400.0
+
+    response = client.post("/settings/exchange_rate", json={"value": "41.5"}, headers=get_admin_headers())
+    assert response.status_code == 200
+    assert client.get("/products/priced").json()["priceUAH"] == 415.0
+
+def test_versioned_cache_ignores_older_versions(session: Session):
+    from services.versioning import VersionedCache
+
+    cache = VersionedCache()
+    assert cache.get(session, "key", lambda: "v2", version=2) == "v2"
+    # A request that read the counter before the bump gets the newer entry...
+    assert cache.get(session, "key", lambda: "v1", version=1) == "v2"
+    # ...and a miss at the old version does not evict what is cached
+    assert cache.get(session, "other", lambda: "v1", version=1) == "v1"
+    assert cache.get(session, "other", lambda: "v2", version=2) == "v2"
+    assert cache.get(session, "key", lambda: "reloaded", version=2) == "v2"
+    assert cache.get(session, "key", lambda: "v3", version=3) == "v3"
+
+def test_product_payload_matches_product_read(session: Session):
+    from schemas import ProductRead
+    from services.product_serializer import ProductPayload
+
+    assert set(ProductPayload.__annotations__) == set(ProductRead.model_fields)
+
+    created = _create_product(id="fast", detail_number="1084168-00-E")
+    response = client.get("/products/fast")
+    assert response.headers["content-type"] == "application/json"
+    assert "ETag" in response.headers
+    assert response.json() == ProductRead(**created).model_dump(mode="json")
+
+    # Write endpoints answer with the same serializer as reads
+    response = client.post("/products/fast/toggle-popular", headers=get_admin_headers())
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == client.get("/products/fast").json()
+
+def test_read_products_batch(session: Session):
+    from schemas import ProductSnapshotRead
+    from services.product_serializer import ProductSnapshotPayload
+
+    assert set(ProductSnapshotPayload.__annotations__) == set(ProductSnapshotRead.model_fields)
+
+    _create_product(id="one", name="One", priceUSD="10.0", image="http://example.com/one.png")
+    _create_product(id="two", name="Two", priceUSD="20.0", inStock="false")
+    response = client.post("/products/batch", json={"product_ids": ["two", "gone", "one", "two"]})
+    assert response.status_code == 200
+    items = response.json()
+    assert [item["id"] for item in items] == ["two", "one"]
+    assert items[0]["inStock"] is False
+    assert items[1]["priceUSD"] == 10.0
+    assert items[1]["image"] == "http://example.com/one.png"
+    assert client.post("/products/batch", json={"product_ids": ["x"] * 201}).status_code == 422
+
+def test_read_labels(session: Session):
+    _create_category("Model S")
+    _create_category("Model X")
+    _create_product(id="shared", category="Model S, Model X")
+    _create_product(id="s-only", category="Model S", inStock="false")
+
+    response = client.get("/products/labels")
+    assert response.status_code == 200
+    labels = {item["label"]: item for item in response.json()}
+    assert labels["Model S"]["product_count"] == 2
+    assert labels["Model S"]["in_stock_count"] == 1
+    assert labels["Model X"]["product_count"] == 1
+    assert labels["Model X"]["slug"] == "model-x"
+
+def test_import_and_export_products(session: Session):
+    _create_category("Model S")
+    existing = _create_product(id="bumper", name="Front bumper", detail_number="1084168-00-E")
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+
+    sheet = (
+        "detail_number;name;category;priceUSD;inStock\n"
+        "1084168-00-E;Front bumper v2;Model S;12,5;0\n"
+        "1500000-00-A;Side mirror;Model S;20;yes\n"
+        "1500001-00-A;Broken row;Model S;abc;1\n"
+        "1500002-00-A;Unknown category;Model Z;5;1\n"
+    )
+    response = client.post(
+        "/products/import",
+        params={"batch_size": 2},
+        files={"file": ("prices.csv", sheet.encode("utf-8"), "text/csv")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    reports = [json.loads(line) for line in response.text.splitlines()]
+    assert len(reports) == 3
+    assert reports[-1] == {"batch": 2, "rows": 4, "created": 1, "updated": 1, "failed": 2, "done": True}
+    assert [error["row"] for error in reports[1]["errors"]] == [4, 5]
+
+    updated = client.get(f"/products/{existing['id']}").json()
+    assert updated["name"] == "Front bumper v2"
+    assert updated["inStock"] is False
+    assert updated["priceUAH"] == 500.0
+    assert updated["category"] == "Model S"
+    mirror = client.get("/products/lookup", params={"number": "150000000A"}).json()
+    assert [p["name"] for p in mirror] == ["Side mirror"]
+
+    response = client.get("/products/export", headers=headers)
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text.lstrip("﻿"))))
+    assert {row["name"] for row in rows} == {"Front bumper v2", "Side mirror"}
+
+    # A subcategory has to sit under one of the row's categories
+    model_s = client.get("/categories/").json()[0]
+    model_x = _create_category("Model X")
+    doors = _create_subcategory(model_s["id"], "Doors")
+    seats = _create_subcategory(model_x["id"], "Seats")
+    sheet = (
+        "detail_number;category;subcategory_id\n"
+        f"1500000-00-A;Model S;{doors['id']}\n"
+        f"1084168-00-E;Model S;{seats['id']}\n"
+    )
+    response = client.post(
+        "/products/import",
+        files={"file": ("prices.csv", sheet.encode("utf-8"), "text/csv")},
+        headers=headers,
+    )
+    reports = [json.loads(line) for line in response.text.splitlines()]
+    assert reports[-1]["updated"] == 1
+    assert [error["row"] for error in reports[0]["errors"]] == [3]
+    assert "not in category Model S" in reports[0]["errors"][0]["error"]
+    assert client.get(f"/products/{existing['id']}").json()["subcategory_id"] is None
+
+    response = client.post(
+        "/products/import",
+        files={"file": ("prices.csv", b"name,price\nx,1\n", "text/csv")},
+        headers=headers,
+    )
+    assert response.status_code == 400
+
+def test_export_returns_connections_to_pool(session: Session):
+    from sqlalchemy import event
+
+    _create_product(id="bumper", name="Front bumper")
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    checked_out, closed, reopened = [], [], []
+
+    def tracked_session():
+        with Session(engine) as request_session:
+            yield request_session
+        closed.append(request_session)
+
+    def on_begin(began_session, transaction, connection):
+        if began_session in closed:
+            reopened.append(began_session)
+
+    on_checkout = lambda *args: checked_out.append(1)
+    on_checkin = lambda *args: checked_out.pop()
+    app.dependency_overrides[get_session] = tracked_session
+    event.listen(Session, "after_begin", on_begin)
+    event.listen(engine, "checkout", on_checkout)
+    event.listen(engine, "checkin", on_checkin)
+    try:
+        response = client.get("/products/export", headers=headers)
+        assert response.status_code == 200
+        assert "Front bumper" in response.text
+        response = client.post(
+            "/products/import",
+            files={"file": ("prices.csv", b"detail_number;name;priceUSD\n1500000-00-A;Side mirror;20\n", "text/csv")},
+            headers=headers,
+        )
+        assert response.status_code == 200
+        assert json.loads(response.text.splitlines()[-1])["created"] == 1
+        # The streams use sessions of their own, not the request's closed one
+        assert closed and reopened == []
+        assert checked_out == []
+    finally:
+        app.dependency_overrides[get_session] = get_session_override
+        event.remove(Session, "after_begin", on_begin)
+        event.remove(engine, "checkout", on_checkout)
+        event.remove(engine, "checkin", on_checkin)
+
+def test_repricing_with_category_markup(session: Session):
+    category = _create_category("Model S", markup_percent="10", price_rounding="5")
+    _create_product(id="marked-up", category="Model S", priceUSD="11.0")
+    _create_product(id="plain", category="", priceUSD="11.0")
+    assert client.get("/products/marked-up").json()["priceUAH"] == 485.0  # 11 * 40 * 1.1 = 484
+    assert client.get("/products/plain").json()["priceUAH"] == 440.0
+
+    response = client.post("/settings/exchange_rate", json={"value": "41"}, headers=get_admin_headers())
+    assert response.status_code == 200
+    assert client.get("/products/marked-up").json()["priceUAH"] == 495.0  # 496.1
+    assert client.get("/products/plain").json()["priceUAH"] == 451.0
+
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.put(
+        f"/categories/{category['id']}",
+        data={"name": "Model S", "markup_percent": "0", "price_rounding": "0"},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert client.get("/products/marked-up").json()["priceUAH"] == 451.0
+
+def test_create_product_uploads_images_concurrently(session: Session, tmp_path, monkeypatch):
+    from services.image_uploader import image_uploader, UPLOAD_CONCURRENCY
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(image_uploader, "use_cloudinary", False)
+    in_flight = 0
+    peak = 0
+    original = image_uploader._upload_to_local
+
+    async def tracked_upload(file, folder, with_variants=False, created=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        try:
+            return await original(file, folder, with_variants, created)
+        finally:
+            in_flight -= 1
+
+    monkeypatch.setattr(image_uploader, "_upload_to_local", tracked_upload)
+    files = [("files", (f"photo{i}.jpg", b"\xff\xd8\xff" + f"image-{i}".encode(), "image/jpeg")) for i in range(6)]
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    response = client.post(
+        "/products/",
+        data={"id": "gallery", "name": "Gallery", "category": "", "priceUAH": "0", "priceUSD": "1",
+              "description": "", "inStock": "true"},
+        files=files,
+        headers=headers,
+    )
+    assert response.status_code == 200
+    images = response.json()["images"]
+    assert len(images) == 6
+    assert 1 < peak <= UPLOAD_CONCURRENCY
+    contents = [(tmp_path / url.split("/", 3)[3]).read_bytes() for url in images]
+    assert contents == [b"\xff\xd8\xff" + f"image-{i}".encode() for i in range(6)]
+
+def test_uploads_store_image_variants(session: Session, tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    from services.image_uploader import image_uploader
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(image_uploader, "use_cloudinary", False)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1000, 500), "red").save(buffer, format="PNG")
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+
+    response = client.post(
+        "/products/",
+        data={"id": "photo", "name": "Photo", "category": "", "priceUAH": "0", "priceUSD": "1",
+              "description": "", "inStock": "true"},
+        files=[("files", ("photo.png", buffer.getvalue(), "image/png"))],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    image_set = response.json()["image_sources"][0]
+    assert image_set["url"] == response.json()["images"][0]
+    assert [source["type"] for source in image_set["sources"]] == ["image/webp", "image/jpeg"]
+    webp = [entry.split(" ") for entry in image_set["sources"][0]["srcset"].split(", ")]
+    assert [width for _, width in webp] == ["200w", "400w", "800w"]
+    with Image.open(tmp_path / webp[0][0].split("/", 3)[3]) as thumbnail:
+        assert thumbnail.size == (200, 100)
+
+    response = client.post(
+        "/reviews/",
+        files={"file": ("review.png", buffer.getvalue(), "image/png")},
+        headers=headers,
+    )
+    assert response.status_code == 200
+    assert len(response.json()["image_source"]["sources"]) == 2
+    assert "variants" not in response.json()
+
+    # Category tiles get variants too, and their images are reference counted
+    response = client.post("/categories/", data={"name": "Tiles"},
+                           files={"file": ("tile.png", buffer.getvalue(), "image/png")}, headers=headers)
+    category = response.json()
+    assert len(category["image_source"]["sources"]) == 2
+    assert client.get("/categories/").json()[0]["image_source"] == category["image_source"]
+    session.expire_all()
+    assert session.get(ImageBlob, category["image"]).ref_count == 3
+    other = io.BytesIO()
+    Image.new("RGB", (300, 300), "blue").save(other, format="PNG")
+    response = client.put(f"/categories/{category['id']}", data={"name": "Tiles"},
+                          files={"file": ("tile.png", other.getvalue(), "image/png")}, headers=headers)
+    new_image = response.json()["image"]
+    session.expire_all()
+    assert session.get(ImageBlob, category["image"]).ref_count == 2
+    assert session.get(ImageBlob, new_image).ref_count == 1
+    sub = client.post(f"/categories/{category['id']}/subcategories/", data={"name": "Sub", "image": new_image},
+                      headers=headers).json()
+    assert sub["image_source"] == response.json()["image_source"]
+    assert client.delete(f"/categories/{category['id']}", headers=headers).status_code == 200
+    session.expire_all()
+    assert session.get(ImageBlob, new_image).ref_count == 0
+
+def test_identical_uploads_share_one_content_addressed_file(session: Session, tmp_path, monkeypatch):
+    from services.image_uploader import image_uploader
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(image_uploader, "use_cloudinary", False)
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    contents = b"\xff\xd8\xff same image bytes"
+
+    response = client.post(
+        "/products/",
+        data={"id": "dedup", "name": "Dedup", "category": "", "priceUAH": "0", "priceUSD": "1",
+              "description": "", "inStock": "true"},
+        files=[("files", ("a.JPEG", contents, "image/jpeg"))],
+        headers=headers,
+    )
+    assert response.status_code == 200
+    url = response.json()["images"][0]
+    review = client.post("/reviews/", files={"file": ("b.jpg", contents, "image/jpeg")}, headers=headers).json()
+    assert review["image_url"] == url
+    assert url.endswith(f"/static/images/sha256/{hashlib.sha256(contents).hexdigest()[:2]}/"
+                        f"{hashlib.sha256(contents).hexdigest()}.jpg")
+    assert len(list((tmp_path / "static" / "images" / "sha256").rglob("*.jpg"))) == 1
+    assert session.get(ImageBlob, url).ref_count == 2
+
+    assert client.post("/products/dedup/copy", headers=headers).status_code == 200
+    assert client.delete(f"/reviews/{review['id']}", headers=headers).status_code == 200
+    session.expire_all()
+    assert session.get(ImageBlob, url).ref_count == 2
+
+def test_bulk_delete_is_set_based(session: Session, tmp_path, monkeypatch):
+    from services.image_uploader import image_uploader
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(image_uploader, "use_cloudinary", False)
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+    shared = b"\xff\xd8\xff shared"
+    own = b"\xff\xd8\xff own"
+    fields = {"category": "", "priceUAH": "0", "priceUSD": "1", "description": "", "inStock": "true"}
+    urls = {}
+    for product_id, contents in [("gone-1", shared), ("gone-2", own), ("kept", shared)]:
+        response = client.post(
+            "/products/",
+            data={"id": product_id, "name": product_id, **fields},
+            files=[("files", ("a.jpg", contents, "image/jpeg"))],
+            headers=headers,
+        )
+        urls[product_id] = response.json()["images"][0]
+    order = Order(customer_first_name="A", customer_last_name="B", customer_phone="1", delivery_city="Kyiv",
+                  delivery_branch="1", payment_method="card", totalUSD=1.0)
+    order.items = [OrderItem(product_id="gone-1", quantity=1, price_at_purchase=1.0)]
+    session.add(order)
+    session.commit()
+    item_id = order.items[0].id
+
+    response = client.post(
+        "/products/bulk-delete", json={"product_ids": ["gone-1", "gone-2", "missing"]}, headers=headers
+    )
+    assert response.json() == {"deleted": 2, "freed_images": [urls["gone-2"]]}
+    session.expire_all()
+    assert session.get(Product, "gone-1") is None
+    assert session.get(Product, "kept") is not None
+    assert session.get(OrderItem, item_id).product_id is None
+    assert session.get(ImageBlob, urls["kept"]).ref_count == 1
+    assert session.get(ImageBlob, urls["gone-2"]).ref_count == 0
+
+    # Pruning waits out the grace period after the last release, and after a re-upload
+    import os
+    from datetime import timedelta
+    from prune_images import GRACE_SECONDS, content_files, prune_blobs
+
+    blob = session.get(ImageBlob, urls["gone-2"])
+    assert blob.released_at is not None
+    assert prune_blobs(session, dry_run=False) == 0
+    blob = session.get(ImageBlob, urls["gone-2"])
+    blob.released_at -= timedelta(seconds=GRACE_SECONDS + 60)
+    session.commit()
+    paths = content_files(blob.sha256)
+    assert paths and prune_blobs(session, dry_run=False) == 0
+    for path in paths:
+        os.utime(path, (0, 0))
+    assert prune_blobs(session, dry_run=False) == 1
+    assert session.get(ImageBlob, urls["gone-2"]) is None
+    assert not any(path.exists() for path in paths)
+
+def test_upload_limits(session: Session, tmp_path, monkeypatch):
+    from services import image_uploader as uploader_module
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(uploader_module.image_uploader, "use_cloudinary", False)
+    monkeypatch.setattr(uploader_module, "MAX_UPLOAD_BYTES", 3 * 1024 * 1024)
+    headers = {"Authorization": get_admin_headers()["Authorization"]}
+
+    response = client.post("/reviews/", files={"file": ("page.jpg", b"<html></html>", "image/jpeg")}, headers=headers)
+    assert response.status_code == 415
+    too_big = b"\xff\xd8\xff" + b"\0" * (3 * 1024 * 1024)
+    response = client.post("/reviews/", files={"file": ("big.jpg", too_big, "image/jpeg")}, headers=headers)
+    assert response.status_code == 413
+    # Rejected uploads leave nothing behind, not even their temp files
+    assert not [path for path in (tmp_path / "static").rglob("*") if path.is_file()]
+    assert client.get("/reviews/").json() == []
+
+    # Nor do the files uploaded next to a rejected one
+    fields = {"id": "mixed", "name": "Mixed", "category": "", "priceUAH": "0", "priceUSD": "1",
+              "description": "", "inStock": "true"}
+    files = [("files", (f"photo{i}.jpg", b"\xff\xd8\xff" + f"image-{i}".encode(), "image/jpeg")) for i in range(3)]
+    files.append(("files", ("big.jpg", too_big, "image/jpeg")))
+    response = client.post("/products/", data=fields, files=files, headers=headers)
+    assert response.status_code == 413
+    assert not [path for path in (tmp_path / "static").rglob("*") if path.is_file()]
+    assert client.get("/products/mixed").status_code == 404
@@ -41,6 +41,7 @@ import ViberIcon from './components/ViberIcon';
 import { DEFAULT_EXCHANGE_RATE_UAH_PER_USD } from './constants';
 import SeoHead from './components/SeoHead';
 import { slugify } from './utils/slugify';
+import { compareByRank } from './utils/rank';
 import { trackAddToCart } from './utils/analytics';
 
 const CART_STORAGE_KEY = 'tesla-parts-cart';
@@ -111,30 +112,16 @@ const findCategorySlugForSubcategory = (
   return null;
 };
 
-const compareBySortOrder = <
-  T extends { sort_order?: number | null; id?: number },
->(
-  a: T,
-  b: T
-) => {
-  const orderDiff = (b.sort_order ?? 0) - (a.sort_order ?? 0);
-  if (orderDiff !== 0) return orderDiff;
-  if (a.id !== undefined && b.id !== undefined) {
-    return a.id - b.id;
-  }
-  return 0;
-};
-
 const sortSubcategoryTreeData = (subs?: Subcategory[]): Subcategory[] => {
   if (!subs) return [];
-  return [...subs].sort(compareBySortOrder).map((sub) => ({
+  return [...subs].sort(compareByRank).map((sub) => ({
     ...sub,
     subcategories: sortSubcategoryTreeData(sub.subcategories),
   }));
 };
 
 const sortCategoryTreeData = (cats: Category[]): Category[] => {
-  return [...cats].sort(compareBySortOrder).map((cat) => ({
+  return [...cats].sort(compareByRank).map((cat) => ({
     ...cat,
     subcategories: sortSubcategoryTreeData(cat.subcategories),
   }));
@@ -270,6 +257,41 @@ const App: React.FC = () => {
     }
   }, [cart, isCustomerLoggedIn, hasMergedCart]);
 
+  // Cart items are snapshots taken when they were added: refresh price, stock
+  // and image in one request whenever the cart drawer or checkout is shown.
+  const isCheckoutPage = location.pathname === '/checkout';
+  const cartIds = cart.map((item) => item.id).join(',');
+  useEffect(() => {
+    if (!cartIds || (!isCartOpen && !isCheckoutPage)) return;
+    let cancelled = false;
+    api
+      .getProductsBatch(cartIds.split(','))
+      .then((snapshots) => {
+        if (cancelled) return;
+        const byId = new Map(snapshots.map((item) => [item.id, item]));
+        setCart((prev) =>
+          prev
+            .filter((item) => byId.has(item.id))
+            .map((item) => {
+              const current = byId.get(item.id)!;
+              return {
+                ...item,
+                name: current.name,
+                priceUSD: current.priceUSD ?? undefined,
+                priceUAH: current.priceUAH,
+                inStock: current.inStock,
+                image: current.image,
+                images: current.images,
+              };
+            })
+        );
+      })
+      .catch(() => {});
+    return () => {
+      cancelled = true;
+    };
+  }, [cartIds, isCartOpen, isCheckoutPage]);
+
   useEffect(() => {
     const loadData = async () => {
       try {
@@ -440,7 +462,7 @@ const App: React.FC = () => {
   };
 
   const sortedCategories = useMemo(
-    () => [...categories].sort(compareBySortOrder),
+    () => [...categories].sort(compareByRank),
     [categories]
   );
 
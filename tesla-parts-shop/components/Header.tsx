@@ -10,6 +10,7 @@ import {
   User,
 } from 'lucide-react';
 import { Category, Currency, Page } from '../types';
+import { compareByRank } from '../utils/rank';
 import TeslaPartsCenterLogo from './ShopLogo';
 import { Link } from 'react-router-dom';
 import { formatCurrency } from '../utils/currency';
@@ -111,9 +112,7 @@ const Header: React.FC<HeaderProps> = ({
     return currency === Currency.UAH ? cartTotalUSD * rate : cartTotalUSD;
   })();
 
-  const sortedCategories = [...categories].sort(
-    (a, b) => (b.sort_order ?? 0) - (a.sort_order ?? 0)
-  );
+  const sortedCategories = [...categories].sort(compareByRank);
 
   return (
     <header className="bg-white shadow-md sticky top-0 z-50">
@@ -1,4 +1,12 @@
-import { Product, OrderData, Category, StaticSeoRecord, Page } from '../types';
+import {
+  Product,
+  ProductLabel,
+  ProductSnapshot,
+  OrderData,
+  Category,
+  StaticSeoRecord,
+  Page,
+} from '../types';
 
 const API_URL = import.meta.env.VITE_API_URL || 'http://127.0.0.1:8000';
 
@@ -62,7 +70,18 @@ export const api = {
     return res.json();
   },
 
-  getLabels: async (): Promise<string[]> => {
+  // Unknown (deleted) ids are left out of the result
+  getProductsBatch: async (ids: string[]): Promise<ProductSnapshot[]> => {
+    const res = await fetch(`${API_URL}/products/batch`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ product_ids: ids }),
+    });
+    if (!res.ok) throw new Error('Failed to refresh products');
+    return res.json();
+  },
+
+  getLabels: async (): Promise<ProductLabel[]> => {
     const res = await fetch(`${API_URL}/products/labels`);
     if (!res.ok) throw new Error('Failed to fetch labels');
     return res.json();
@@ -11,6 +11,7 @@ export interface Subcategory {
   category_id?: number;
   parent_id?: number | null;
   sort_order?: number;
+  rank?: string | null;
   subcategories?: Subcategory[];
 }
 
@@ -19,11 +20,31 @@ export interface Category {
   name: string;
   image?: string;
   sort_order?: number;
+  rank?: string | null;
   meta_title?: string | null;
   meta_description?: string | null;
   subcategories?: Subcategory[];
 }
 
+// Current price, stock and images of a product, from POST /products/batch
+export interface ProductSnapshot {
+  id: string;
+  name: string;
+  priceUSD?: number | null;
+  priceUAH: number;
+  inStock: boolean;
+  image: string;
+  images: string[];
+}
+
+export interface ProductLabel {
+  label: string;
+  category_id: number;
+  slug?: string | null;
+  product_count: number;
+  in_stock_count: number;
+}
+
 export interface Product {
   id: string;
   name: string;
@@ -37,6 +58,7 @@ export interface Product {
   description: string;
   inStock: boolean;
   sort_order?: number;
+  rank?: string | null;
   detail_number?: string;
   cross_number?: string;
   is_popular?: boolean;
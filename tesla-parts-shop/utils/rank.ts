@@ -0,0 +1,16 @@
+// Catalog order keys from the API; plain string comparison (not localeCompare)
+// matches the server's byte order.
+export const compareByRank = <
+  T extends { rank?: string | null; id?: number },
+>(
+  a: T,
+  b: T
+) => {
+  const rankA = a.rank ?? '';
+  const rankB = b.rank ?? '';
+  if (rankA !== rankB) return rankA < rankB ? -1 : 1;
+  if (a.id !== undefined && b.id !== undefined) {
+    return a.id - b.id;
+  }
+  return 0;
+};